@@ -22,11 +22,13 @@ wbinfo = {
 
 # Crawler settings
 crawler = {
-    'delay': 0.1,           # Delay between requests (seconds)
+    'rate': 10.0,           # Max requests per second (per host)
+    'burst': 2,             # Allowed back-to-back requests
     'timeout': 30,          # Request timeout (seconds)
     'pdf_timeout': 60,      # PDF download timeout (seconds)
-    'max_retries': 3,       # Max retry count
+    'max_retries': 3,       # Max retry count (connection errors / 429 / 5xx, GET only)
     'days_ahead': 60,       # Days to look ahead for auctions
+    'daily_limit': 10000,   # Daily processing limit
 }
 
 # Crawl types
@@ -38,5 +40,6 @@ crawl_types = {
 # Paths
 paths = {
     'output_dir': './data/',
+    'pdf_index': './data/existing_pdfs.sqlite',   # Local dedup index (synced by entrydate)
     'log_dir': './logs/',
 }
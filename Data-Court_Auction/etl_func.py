@@ -3,48 +3,51 @@
 ETL Functions for Court Auction Crawler
 """
 
-import pymssql
 import hashlib
 import unicodedata
 import re
 from datetime import datetime
 from typing import List, Dict, Optional
 
+from common.db import get_pool
+from common.query import fetch_value
+
 
 def src_obs(server, username, password, database, fromtb, totb):
     """Get count of records to process"""
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
-    cursor = conn.cursor()
     script = f"""
     SELECT COUNT(*) FROM (
         SELECT DISTINCT CONCAT(court,'_',number,'_',REPLACE(REPLACE(date,' ','_'),'/',''),'.pdf') as pdf_name
         FROM {totb}
     ) t
     """
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
 
 
-def get_existing_pdfs(server, username, password, database, totb):
-    """Get list of existing PDF files from database"""
-    try:
-        conn = pymssql.connect(server=server, user=username, password=password, database=database)
-        cursor = conn.cursor()
-        script = f"""
-        SELECT DISTINCT CONCAT(court,'_',number,'_',REPLACE(REPLACE(date,' ','_'),'/',''),'.pdf')
-        FROM {totb}
-        """
-        cursor.execute(script)
+def get_existing_pdfs(server, username, password, database, totb, since=None):
+    """
+    Get existing PDF names with their latest entrydate
+
+    Args:
+        since: only return rows with entrydate >= since (None for all)
+
+    Returns:
+        list of (pdf_name, entrydate)
+    """
+    script = f"""
+    SELECT CONCAT(court,'_',number,'_',REPLACE(REPLACE(date,' ','_'),'/',''),'.pdf') AS pdf_name,
+           MAX(entrydate)
+    FROM {totb}
+    {'WHERE entrydate >= %s' if since else ''}
+    GROUP BY CONCAT(court,'_',number,'_',REPLACE(REPLACE(date,' ','_'),'/',''),'.pdf')
+    """
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script, (since,) if since else None)
         results = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return [r[0] for r in results]
-    except Exception as e:
-        print(f"Error getting existing PDFs: {e}")
-        return []
+    return [(r[0], r[1]) for r in results]
 
 
 def generate_id(data: Dict) -> str:
@@ -153,55 +156,54 @@ def auction_info_item(doc):
     }]
 
 
-def toSQL(docs, totb, server, database, username, password):
-    """Insert data to SQL database"""
+def toSQL(docs, totb, server, database, username, password, writer=None, on_success=None):
+    """Insert data to SQL database (queued on writer when given; on_success runs after commit)"""
     if not docs:
         return
 
-    with pymssql.connect(server=server, user=username, password=password, database=database) as conn:
-        with conn.cursor() as cursor:
-            # Filter out None values and convert datetime
-            for doc in docs:
-                for key, val in doc.items():
-                    if isinstance(val, datetime):
-                        doc[key] = val.strftime("%Y/%m/%d %H:%M:%S")
-                    elif val is None:
-                        doc[key] = ''
+    # Filter out None values and convert datetime
+    for doc in docs:
+        for key, val in doc.items():
+            if isinstance(val, datetime):
+                doc[key] = val.strftime("%Y/%m/%d %H:%M:%S")
+            elif val is None:
+                doc[key] = ''
+
+    if writer is not None:
+        writer.insert_docs(totb, docs, tag=(totb, docs[0].get('rowid')), on_success=on_success)
+        return
 
+    with get_pool(server, username, password, database).connection() as conn:
+        with conn.cursor() as cursor:
             data_keys = ','.join(docs[0].keys())
             data_symbols = ','.join(['%s' for _ in docs[0].keys()])
             insert_cmd = f"INSERT INTO {totb} ({data_keys}) VALUES ({data_symbols})"
             data_values = [tuple(doc.values()) for doc in docs]
             cursor.executemany(insert_cmd, data_values)
         conn.commit()
+    if on_success is not None:
+        on_success()
 
 
 def check_exists(server, username, password, database, totb, rowid):
     """Check if record already exists"""
     try:
-        conn = pymssql.connect(server=server, user=username, password=password, database=database)
-        cursor = conn.cursor()
-        script = f"SELECT COUNT(*) FROM {totb} WHERE rowid = '{rowid}'"
-        cursor.execute(script)
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        return result[0] > 0
+        script = f"SELECT COUNT(*) FROM {totb} WHERE rowid = %(rowid)s"
+        count = fetch_value(get_pool(server, username, password, database), script,
+                            {'rowid': rowid}, default=0)
+        return count > 0
     except:
         return False
 
 
 def exit_obs(server, username, password, database, totb):
     """Get count of records processed today"""
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
-    cursor = conn.cursor()
     script = f"""
     SELECT COUNT(DISTINCT rowid)
     FROM [{totb}]
     WHERE entrydate >= CONVERT(VARCHAR(10), GETDATE(), 111)
     """
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
@@ -26,7 +26,12 @@ from etl_func import (
     src_obs, get_existing_pdfs, generate_id, parse_tw_date,
     normalize_text, auction_item, auction_info_item, toSQL, exit_obs
 )
+from common.db import get_pool
 from common.logger import get_logger
+from common.quota import DailyQuota, QuotaExhausted
+from common.keyindex import KeyIndex
+from common.writer import BackgroundWriter
+from common.http import make_retry, new_session, set_rate
 
 # Disable SSL warnings
 import urllib3
@@ -36,6 +41,22 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logger = get_logger('Data-Court_Auction')
 
 
+def on_write_error(tag, error):
+    """Background write failure callback (tag = (table, rowid))"""
+    table, rowid = tag
+    logger.log_db_error(error, "INSERT")
+    logger.warning(f"背景寫入失敗: {table} rowid={rowid}")
+    if table == db['totb']:
+        # 拍賣資訊未寫入：不加入 PDF 索引 (下次執行重試)，計為失敗
+        logger.increment('records_failed')
+
+
+def on_auction_written(existing_pdfs: KeyIndex, pdf_filename: str):
+    """拍賣資訊 commit 後 (背景寫入執行緒呼叫)：加入 PDF 索引並計為成功"""
+    existing_pdfs.add(pdf_filename)
+    logger.increment('records_success')
+
+
 class PDFReader:
     """PDF Reader for auction documents"""
 
@@ -175,6 +196,7 @@ def get_date_range(start_date: str):
     return start_date_str, end_date_str
 
 
+@logger.trace('query')
 def get_page_data(session, page_num: int, sale_type: str, prop_type: str,
                   start_date: str, end_date: str) -> Optional[Dict]:
     """Get page data from API"""
@@ -207,8 +229,8 @@ def get_page_data(session, page_num: int, sale_type: str, prop_type: str,
 
         logger.log_response(
             response.status_code,
-            dict(response.headers),
-            response.text[:500] if len(response.text) > 500 else response.text,
+            response.headers,
+            lambda r=response: r.text[:500],
             elapsed
         )
 
@@ -283,8 +305,14 @@ def generate_pdf_filename(auction_info: Dict, item: Dict) -> str:
 
 
 def process_page_data(session, data_list: List[Dict], sale_type: str, prop_type: str,
-                      existing_pdfs: List[str], output_dir: str) -> int:
-    """Process page data and save to database"""
+                      existing_pdfs: KeyIndex, queued_pdfs: set, output_dir: str, quota: DailyQuota,
+                      writer: BackgroundWriter) -> int:
+    """
+    Process page data and save to database (raises QuotaExhausted at daily limit)
+
+    PDF 只在拍賣資訊 commit 後才加入 existing_pdfs (背景寫入失敗時下次執行會重試)；
+    queued_pdfs 避免同一次執行中在 commit 前重複處理
+    """
     server = db['server']
     database = db['database']
     username = db['username']
@@ -300,99 +328,101 @@ def process_page_data(session, data_list: List[Dict], sale_type: str, prop_type:
         logger.ctx.set_operation("process_auction_item")
 
         try:
-            auction_info = build_auction_info(item, sale_type, prop_type)
-            pdf_filename = generate_pdf_filename(auction_info, item)
-            logger.ctx.set_data(
-                court=auction_info['court'],
-                number=auction_info['number'],
-                pdf=pdf_filename
-            )
-
-            if pdf_filename in existing_pdfs:
-                logger.debug(f"PDF 已存在，跳過: {pdf_filename}")
-                continue
-
-            # Generate rowid
-            rowid = generate_id({
-                'number': auction_info['number'],
-                'date': auction_info['date']
-            })
-            auction_info['rowid'] = rowid
-            auction_info['entrydate'] = datetime.datetime.now()
-
-            # Save auction info
-            logger.ctx.set_operation("DB_insert_auction")
-            logger.ctx.set_db(server=server, database=database, table=totb, operation="INSERT")
-
-            docs = auction_item(auction_info)
-            toSQL(docs, totb, server, database, username, password)
-            logger.log_db_operation("INSERT", database, totb, 1)
-            logger.info(f"儲存拍賣資訊: {auction_info['court']} {auction_info['number']}")
-
-            # Download and parse PDF
-            pdf_url = auction_info['document']
-            logger.ctx.set_operation("PDF_download")
-
-            try:
-                start_time = time.time()
-                logger.log_request("GET", pdf_url, session.headers, None)
-
-                response = session.get(pdf_url, timeout=crawler['pdf_timeout'], verify=False)
-                elapsed = time.time() - start_time
-
-                logger.log_response(response.status_code, dict(response.headers), f"[PDF Binary: {len(response.content)} bytes]", elapsed)
-                response.raise_for_status()
-
-                pdf_path = os.path.join(output_dir, pdf_filename)
-                with open(pdf_path, 'wb') as f:
-                    f.write(response.content)
-                logger.debug(f"PDF 下載完成: {pdf_filename}, size={len(response.content)}")
-
-                # Parse PDF
-                logger.ctx.set_operation("PDF_parse")
-                with PDFReader(pdf_path) as reader:
-                    pdf_data = reader.extract()
-
-                pdf_items_count = 0
-                for pdf_item in pdf_data:
-                    info_data = {
-                        **pdf_item,
-                        'court': auction_info['court'],
-                        'number': auction_info['number'],
-                        'date': auction_info['date'],
-                        'country': auction_info.get('country', ''),
-                        'address': auction_info.get('address', ''),
-                        'refertb': totb,
-                        'referi': rowid,
-                        'entrydate': datetime.datetime.now(),
-                    }
-                    info_data['rowid'] = generate_id(info_data)
-
-                    info_docs = auction_info_item(info_data)
-                    toSQL(info_docs, auction_info_tb, server, database, username, password)
-                    pdf_items_count += 1
-
-                logger.log_db_operation("INSERT", database, auction_info_tb, pdf_items_count)
-                logger.info(f"PDF 處理完成: {pdf_filename}, items={pdf_items_count}")
-
-            except requests.exceptions.Timeout as e:
-                logger.log_http_error(e, pdf_url)
-                logger.warning(f"PDF 下載超時: {pdf_url}")
-            except requests.exceptions.RequestException as e:
-                logger.log_http_error(e, pdf_url)
-            except Exception as e:
-                logger.log_exception(e, f"PDF 處理失敗: {pdf_url}")
-
-            processed_count += 1
-            logger.increment('records_success')
-
-            # Check daily limit
-            exit_count = exit_obs(server, username, password, database, totb)
-            if exit_count >= 10000:
-                logger.warning(f"每日處理上限達成: {exit_count} >= 10000")
-                logger.task_end(success=True)
-                sys.exit(0)
+            with logger.span('auction_item', index=idx):
+                auction_info = build_auction_info(item, sale_type, prop_type)
+                pdf_filename = generate_pdf_filename(auction_info, item)
+                logger.ctx.set_data(
+                    court=auction_info['court'],
+                    number=auction_info['number'],
+                    pdf=pdf_filename
+                )
+
+                if pdf_filename in existing_pdfs or pdf_filename in queued_pdfs:
+                    logger.debug(f"PDF 已存在，跳過: {pdf_filename}")
+                    continue
 
+                # Generate rowid
+                rowid = generate_id({
+                    'number': auction_info['number'],
+                    'date': auction_info['date']
+                })
+                auction_info['rowid'] = rowid
+                auction_info['entrydate'] = datetime.datetime.now()
+
+                # Save auction info
+                logger.ctx.set_operation("DB_insert_auction")
+                logger.ctx.set_db(server=server, database=database, table=totb, operation="INSERT")
+
+                docs = auction_item(auction_info)
+                toSQL(docs, totb, server, database, username, password, writer=writer,
+                      on_success=lambda key=pdf_filename: on_auction_written(existing_pdfs, key))
+                queued_pdfs.add(pdf_filename)
+                logger.log_db_operation("INSERT", database, totb, 1)    # 延遲由 writer 在實際寫入時記錄
+                logger.info(f"儲存拍賣資訊: {auction_info['court']} {auction_info['number']}")
+
+                # Download and parse PDF
+                pdf_url = auction_info['document']
+                logger.ctx.set_operation("PDF_download")
+
+                try:
+                    start_time = time.time()
+                    logger.log_request("GET", pdf_url, session.headers, None)
+
+                    with logger.span('pdf_download'):
+                        response = session.get(pdf_url, timeout=crawler['pdf_timeout'], verify=False)
+                    elapsed = time.time() - start_time
+
+                    logger.log_response(response.status_code, response.headers, lambda r=response: f"[PDF Binary: {len(r.content)} bytes]", elapsed)
+                    response.raise_for_status()
+
+                    pdf_path = os.path.join(output_dir, pdf_filename)
+                    with open(pdf_path, 'wb') as f:
+                        f.write(response.content)
+                    logger.debug(f"PDF 下載完成: {pdf_filename}, size={len(response.content)}")
+
+                    # Parse PDF
+                    logger.ctx.set_operation("PDF_parse")
+                    with logger.span('pdf_parse'), PDFReader(pdf_path) as reader:
+                        pdf_data = reader.extract()
+
+                    pdf_items_count = 0
+                    for pdf_item in pdf_data:
+                        info_data = {
+                            **pdf_item,
+                            'court': auction_info['court'],
+                            'number': auction_info['number'],
+                            'date': auction_info['date'],
+                            'country': auction_info.get('country', ''),
+                            'address': auction_info.get('address', ''),
+                            'refertb': totb,
+                            'referi': rowid,
+                            'entrydate': datetime.datetime.now(),
+                        }
+                        info_data['rowid'] = generate_id(info_data)
+
+                        info_docs = auction_info_item(info_data)
+                        toSQL(info_docs, auction_info_tb, server, database, username, password, writer=writer)
+                        pdf_items_count += 1
+
+                    logger.log_db_operation("INSERT", database, auction_info_tb, pdf_items_count)
+                    logger.info(f"PDF 處理完成: {pdf_filename}, items={pdf_items_count}")
+
+                except requests.exceptions.Timeout as e:
+                    logger.log_http_error(e, pdf_url)
+                    logger.warning(f"PDF 下載超時: {pdf_url}")
+                except requests.exceptions.RequestException as e:
+                    logger.log_http_error(e, pdf_url)
+                except Exception as e:
+                    logger.log_exception(e, f"PDF 處理失敗: {pdf_url}")
+
+                processed_count += 1
+
+                # Check daily limit
+                quota.consume()
+                quota.check()
+
+        except QuotaExhausted:
+            raise
         except Exception as e:
             logger.log_exception(e, f"處理拍賣項目失敗: item_index={idx}")
             logger.increment('records_failed')
@@ -414,12 +444,13 @@ def run(start_date: str = None):
     # Log database config
     logger.log_db_connect(db['server'], db['database'], db['username'])
 
-    # Setup session
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-    })
-    session.verify = False
+    # Setup session (連線池 + 重試 + 每秒請求數限制，取代每頁固定 sleep)
+    set_rate(wbinfo['url'], crawler['rate'], crawler.get('burst', 1))
+    session = new_session(
+        retries=make_retry(crawler['max_retries']),
+        headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'},
+        verify=False,
+    )
 
     # Create output directory
     output_dir = paths['output_dir']
@@ -437,14 +468,37 @@ def run(start_date: str = None):
     obs = src_obs(server, username, password, database, totb, totb)
     logger.info(f"現有記錄數: {obs}")
 
-    existing_pdfs = get_existing_pdfs(server, username, password, database, totb)
+    existing_pdfs = KeyIndex(paths['pdf_index'], name='court_auction_pdfs')
+    try:
+        synced = existing_pdfs.sync(
+            lambda since: get_existing_pdfs(server, username, password, database, totb, since)
+        )
+        logger.info(f"PDF 索引同步: 新增 {synced}, watermark={existing_pdfs.watermark}")
+    except Exception as e:
+        logger.log_db_error(e, "SELECT")
+        logger.warning("PDF 索引同步失敗，使用本地索引")
     logger.info(f"現有 PDF 數: {len(existing_pdfs)}")
 
+    quota = DailyQuota(
+        'Data-Court_Auction', crawler['daily_limit'],
+        counter=lambda: exit_obs(server, username, password, database, totb),
+    )
+    logger.info(f"今日已處理: {quota.used}, 上限: {quota.limit}")
+    if quota.exhausted:
+        logger.warning(f"每日處理上限達成: {quota.used} >= {quota.limit}")
+        logger.task_end(success=True)
+        return True
+
+    writer = BackgroundWriter(get_pool(server, username, password, database),
+                              name='Data-Court_Auction', on_error=on_write_error, logger=logger)
+    quota.sync = writer.flush       # 對帳前先寫完佇列，DB 筆數才包含已處理的資料
+
     # Get date range
     start_date_str, end_date_str = get_date_range(start_date)
     logger.info(f"查詢日期範圍: {start_date_str} - {end_date_str}")
 
     total_processed = 0
+    queued_pdfs = set()
     success = True
 
     try:
@@ -478,12 +532,15 @@ def run(start_date: str = None):
                         sale_type,
                         prop_type,
                         existing_pdfs,
-                        output_dir
+                        queued_pdfs,
+                        output_dir,
+                        quota,
+                        writer
                     )
                     total_processed += processed
 
-                    time.sleep(crawler['delay'])
-
+    except QuotaExhausted:
+        logger.warning(f"每日處理上限達成: {quota.used} >= {quota.limit}")
     except KeyboardInterrupt:
         logger.warning("使用者中斷執行")
         success = False
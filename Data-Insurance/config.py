@@ -22,3 +22,22 @@ wbinfo = {
     'Drvfile':rf'C:\Py_Project\env\chromedriver_win32\chromedriver',
     'imgp':rf'./captcha.jpg',
 }
+
+crawler = {
+    'daily_limit': 5000,    # 每日查詢上限
+    'captcha_ttl': 60,      # 預取驗證碼可用秒數
+    'ocr_workers': 0,       # OCR 子程序數，0 = 程序內辨識
+    'adaptive': {           # 自適應速率 / 並行數 (common.adaptive)，上次結果存於 data/http_limits.json
+        'min_rate': 0.2,
+        'max_rate': 3.0,
+        'max_concurrency': 2,
+        'min_concurrency': 2,   # 驗證碼預取 GET 與查詢 POST 同時進行，不互相等待並行名額
+    },
+}
+
+captcha = {
+    # liaroc simpleCaptcha：5 碼小寫英數，依網站驗證碼調整
+    'charset': 'abcdefghijklmnopqrstuvwxyz0123456789',
+    'length': 5,
+    'case': 'lower',
+}
@@ -4,6 +4,10 @@ Created on Mon May  9 18:38:29 2022
 
 @author: admin
 """
+from common.db import get_pool
+from common.query import run
+from common.schema import ensure_indexes, stale_predicate
+from common.workqueue import WorkQueue
 
 
 
@@ -21,23 +25,18 @@ def foo(num,obs):
         num = num + 1 
         yield num
 def src_obs(server,username,password,database,fromtb,totb):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
     script = f"""
 
     select (select count(*) from [{fromtb}]  b
-	left join [{totb}] r on b.ID = r.ID 
-	where r.ID is null and b.C is not null)
+	where not exists (select 1 from [{totb}] r where r.ID = b.ID) and b.C is not null)
 	+
 	(select count(*) from [{fromtb}]  b
-	left join [{totb}] r on b.ID = r.ID 
-	where (select DATEDIFF(mm, update_date, getdate()))> = 3  and note  <> 'Y'  )
+	join [{totb}] r on b.ID = r.ID 
+	where {stale_predicate('r.update_date')}  and r.note  <> 'Y'  )
     """    
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
 def insurance(doc):
     insurance= []
@@ -54,8 +53,7 @@ def insurance(doc):
     })
     return insurance
 def toSQL(docs, totb, server, database, username, password):
-    import pymssql
-    with pymssql.connect(server=server, user=username, password=password, database=database) as conn:
+    with get_pool(server, username, password, database).connection() as conn:
         with conn.cursor() as cursor:
             data_keys = ','.join(docs[0].keys())
             data_symbols = ','.join(['%s' for _ in range(len(docs[0].keys()))])
@@ -65,32 +63,35 @@ def toSQL(docs, totb, server, database, username, password):
             conn.commit()
 
 
-def dbfrom(server,username,password,database,fromtb,totb):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
-    
-    script = f"""
-
-    select b.* ,r.rowid
-    into #test
+def work_queue(server,username,password,database,fromtb,totb,batch_size=20):
+    """待查詢名單佇列：尚未查詢過 + 超過 3 個月未更新 (flg 有值者優先)"""
+    candidates = f"""
+    select b.ID as item_key, case when isnull(b.flg, '') <> '' then 1 else 0 end as priority
+    from {fromtb} b
+	where not exists (select 1 from [{totb}] r where r.ID = b.ID) and b.C is not null 
+	union all
+	select b.ID, case when isnull(b.flg, '') <> '' then 1 else 0 end
+	from {fromtb} b
+	join [{totb}] r on b.ID = r.ID 
+	where {stale_predicate('r.update_date')}  and r.note  <> 'Y' and b.C is not null
+    """
+    fetch = f"""
+    select b.ID, b.*, r.rowid
     from {fromtb} b
 	left join [{totb}] r on b.ID = r.ID 
-	where r.ID is null and b.C is not null 
-	insert into #test
-	select b.*,r.rowid from {fromtb} b
-	left join [{totb}] r on b.ID = r.ID 
-	where (select DATEDIFF(mm, update_date, getdate()))> = 3  and note  <> 'Y' and b.C is not null
-    select * from #test order by flg desc
-    --order by personi
-	offset 0 row fetch next 1 rows only
+	where b.ID in %s
     """
-    cursor.execute(script)
-    c_src = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
-    return c_src
+    return WorkQueue(get_pool(server, username, password, database), 'Data-Insurance',
+                     candidates, fetch, batch_size=batch_size)
+
+def ensure_work_indexes(server,username,password,database,fromtb,totb):
+    """待查詢名單用的索引：目標表 ID 比對、update_date 範圍查詢 (排除 note = 'Y')"""
+    return ensure_indexes(get_pool(server, username, password, database), [
+        {'table': totb, 'name': f'IX_{totb}_ID', 'columns': ['ID'], 'include': ['rowid']},
+        {'table': totb, 'name': f'IX_{totb}_update_date', 'columns': ['update_date'],
+         'include': ['ID', 'note']},
+        {'table': fromtb, 'name': f'IX_{fromtb}_ID', 'columns': ['ID'], 'include': ['C', 'flg']},
+    ])
 
 def mail(obs):
     if obs ==0:
@@ -177,33 +178,23 @@ def CAPTCHAOCR(Apurl,imgf,imgp):
     return response.text
 
 def update(server,username,password,database,totb,note,ID,today,rowid,insurance_num):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
-        
     script = f"""
     update [{totb}]
-    set note = '{note}',update_date = '{today}',insurance_num='{insurance_num}'
-    where id = '{ID}' and rowid = '{rowid}'
-    
+    set note = %(note)s,update_date = %(today)s,insurance_num=%(insurance_num)s
+    where id = %(ID)s and rowid = %(rowid)s
     """
-    cursor.execute(script)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    run(get_pool(server, username, password, database), script, {
+        'note': note, 'today': today, 'insurance_num': insurance_num, 'ID': ID, 'rowid': rowid,
+    })
 def exit_obs(server,username,password,database,totb):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
     script = f"""
     select count (distinct ID)
     from [{totb}]
     where  update_date > = convert(varchar(10),getdate(),111)
     """    
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
 
 
@@ -7,7 +7,6 @@ import sys
 import contextlib
 import datetime
 import requests
-import ddddocr
 import time
 import xml.etree.ElementTree as ET
 
@@ -17,6 +16,12 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import *
 from etl_func import *
 from common.logger import get_logger
+from common.ocrpool import configure_ocr
+from common.captcha import CaptchaPipeline, get_profile
+from common.http import new_session
+from common.adaptive import get_controller, set_adaptive
+from common.schema import log_index_results
+from common.quota import DailyQuota
 
 # Initialize logger
 logger = get_logger('Data-Insurance')
@@ -29,18 +34,6 @@ os.environ["NUMEXPR_NUM_THREADS"] = "1"
 os.environ["ORT_LOGGING_LEVEL"] = "FATAL"
 
 
-# ---- suppress_stderr context manager ----
-@contextlib.contextmanager
-def suppress_stderr():
-    with open(os.devnull, 'w') as devnull:
-        old_stderr = sys.stderr
-        sys.stderr = devnull
-        try:
-            yield
-        finally:
-            sys.stderr = old_stderr
-
-
 # DB/網頁設定
 server, database, username, password, totb, fromtb = (
     db['server'], db['database'], db['username'], db['password'], db['totb'], db['fromtb']
@@ -60,9 +53,13 @@ headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
 }
 
-# 初始化 session
-session = requests.Session()
-session.timeout = 30
+
+
+def fetch_captcha(session):
+    """取得驗證碼圖片 (於 CaptchaPipeline 背景執行緒呼叫)"""
+    resp = session.get(captcha_url, verify=False, timeout=10)
+    resp.raise_for_status()
+    return resp.content
 
 
 def build_payload(captcha_code, usrId, DateY, DateM, DateD):
@@ -95,34 +92,25 @@ def build_payload(captcha_code, usrId, DateY, DateM, DateD):
         return None
 
 
-def query_regno(usrId, DateY, DateM, DateD, max_retry=10):
+def query_regno(usrId, DateY, DateM, DateD, captchas, max_retry=10):
     """查詢保險登錄號"""
     logger.ctx.set_data(usrId=usrId)
     logger.debug(f"開始查詢用戶: {usrId}, 生日: {DateY}/{DateM}/{DateD}")
 
     try:
         for i in range(max_retry):
+            token = None
             try:
-                # 獲取驗證碼圖片
+                # 取得預先辨識的驗證碼 (與上一次查詢重疊準備)
                 logger.ctx.set_operation("get_captcha")
-                captcha_response = session.get(captcha_url, verify=False, timeout=10)
-
-                if captcha_response.status_code != 200:
-                    logger.warning(f"驗證碼請求失敗，狀態碼: {captcha_response.status_code}")
-                    time.sleep(2)
+                token = captchas.get(timeout=30)
+                if token is None:
+                    logger.warning("驗證碼取得逾時")
                     continue
 
-                captcha_img = captcha_response.content
-
-                # 識別驗證碼
-                try:
-                    with suppress_stderr():
-                        captcha_code = ddddocr.DdddOcr(show_ad=False).classification(captcha_img)
-                    logger.log_captcha_attempt(i + 1, True, captcha_code)
-                except Exception as ocr_error:
-                    logger.warning(f"OCR 識別失敗: {ocr_error}")
-                    time.sleep(1)
-                    continue
+                session = token.session
+                captcha_code = token.code
+                logger.log_captcha_attempt(i + 1, True, captcha_code, token.solve_seconds)
 
                 # 建立 payload
                 payload = build_payload(captcha_code, usrId, DateY, DateM, DateD)
@@ -143,27 +131,28 @@ def query_regno(usrId, DateY, DateM, DateD, max_retry=10):
                     )
                     elapsed = time.time() - start_time
 
-                    # 檢查是否為 500 錯誤
-                    if resp.status_code == 500:
-                        logger.error(f"HTTP 500 伺服器錯誤 - usrId={usrId}, 嘗試={i+1}")
-                        raise SystemExit("HTTP 500 伺服器錯誤，程式正常停止")
+                    # 5xx：自適應控制器已降速並減少並行數，持續失敗才停止
+                    if resp.status_code >= 500:
+                        limiter = get_controller(url)
+                        if limiter is None or limiter.failing:
+                            logger.error(f"HTTP {resp.status_code} 伺服器持續錯誤 - usrId={usrId}, 嘗試={i+1}")
+                            raise SystemExit(f"HTTP {resp.status_code} 伺服器持續錯誤，程式正常停止")
+                        logger.warning(f"HTTP {resp.status_code} 伺服器錯誤，降速後重試 (第 {i+1} 次)")
+                        continue
 
                     if resp.status_code != 200:
                         logger.warning(f"POST 請求失敗，狀態碼: {resp.status_code}")
-                        time.sleep(2)
                         continue
 
+                # 逾時 / 連線錯誤同樣由自適應控制器降速，不再固定 sleep
                 except requests.exceptions.Timeout:
                     logger.warning(f"請求超時 (第 {i+1} 次)")
-                    time.sleep(3)
                     continue
                 except requests.exceptions.ConnectionError as conn_error:
                     logger.warning(f"連線錯誤 (第 {i+1} 次): {conn_error}")
-                    time.sleep(5)
                     continue
                 except requests.exceptions.RequestException as req_error:
                     logger.warning(f"請求異常 (第 {i+1} 次): {req_error}")
-                    time.sleep(2)
                     continue
 
                 # 解析回應
@@ -171,6 +160,7 @@ def query_regno(usrId, DateY, DateM, DateD, max_retry=10):
                 try:
                     result = resp.content.decode("big5", errors="ignore")
 
+                    token.report("<CaptchaError>" not in result)
                     if "<CaptchaError>" in result:
                         logger.debug(f"{usrId} 第{i+1}次驗證碼失敗 code={captcha_code}")
                         time.sleep(1)
@@ -217,6 +207,9 @@ def query_regno(usrId, DateY, DateM, DateD, max_retry=10):
                 logger.warning(f"迴圈內錯誤 (第 {i+1} 次): {loop_error}")
                 time.sleep(2)
                 continue
+            finally:
+                if token is not None:
+                    token.close()
 
         logger.warning(f"{usrId} 超過 {max_retry} 次重試仍失敗")
         return None
@@ -231,6 +224,7 @@ def query_regno(usrId, DateY, DateM, DateD, max_retry=10):
 def run():
     """Main execution function"""
     logger.task_start("保險登錄查詢")
+    configure_ocr(crawler.get('ocr_workers', 0))
     logger.log_db_connect(server, database, username)
 
     total_processed = 0
@@ -238,7 +232,10 @@ def run():
     total_failed = 0
 
     try:
-        obs = src_obs(server, username, password, database, fromtb, totb)
+        log_index_results(logger, ensure_work_indexes(server, username, password, database, fromtb, totb))
+
+        queue = work_queue(server, username, password, database, fromtb, totb)
+        obs = queue.refill()
         logger.info(f"待處理筆數: {obs}")
 
         if obs == 0:
@@ -246,92 +243,105 @@ def run():
             logger.task_end(success=True)
             return True
 
-        for i in foo(-1, obs - 1):
-            total_processed += 1
-            logger.log_progress(total_processed, obs, f"record_{total_processed}")
-
-            try:
-                src = dbfrom(server, username, password, database, fromtb, totb)[0]
-                today = str(datetime.datetime.now())[0:-3]
-                Name = src[2]
-                ID = src[1]
-                birthday = src[6]
-                rowid = str(src[10]).replace('None', '')
-
-                logger.ctx.set_data(ID=ID, Name=Name)
-                logger.debug(f"處理用戶: {Name} (ID: {ID})")
+        quota = DailyQuota(
+            'Data-Insurance', crawler['daily_limit'],
+            counter=lambda: exit_obs(server, username, password, database, totb),
+        )
+        if quota.exhausted:
+            logger.warning(f'今日查詢數已達上限 {quota.limit} 筆，正常停止')
+            logger.task_end(success=True)
+            return True
 
-                # 解析生日
-                try:
-                    bir = birthday.split('/', 2)
-                    birY, birM, birD = bir[0], bir[1], bir[2]
-                except Exception as birthday_error:
-                    logger.warning(f"生日解析錯誤 ({birthday}): {birthday_error}")
-                    total_failed += 1
-                    logger.increment('records_failed')
-                    continue
+        set_adaptive(url, **crawler['adaptive'])
+        captchas = CaptchaPipeline('Data-Insurance', fetch_captcha, session_factory=new_session,
+                                   ttl=crawler['captcha_ttl'], profile=get_profile('liaroc', **captcha))
 
-                # 查詢保險資訊
-                message = query_regno(ID, birY, birM, birD)
-
-                # 處理查詢結果
-                if message is None:
-                    note = 'N'
-                    insurance_num = ''
-                    logger.debug(f"{ID} 查無資料")
-                elif message == "未辦理登錄":
-                    note = 'N'
-                    insurance_num = ''
-                    logger.debug(f"{ID} 未辦理登錄")
-                else:
-                    insurance_num = message.get("regno", "")
-                    note = 'Y' if insurance_num != '' else 'N'
-                    logger.info(f"{ID} 查詢成功 regno={insurance_num}")
-
-                # 準備資料並寫入資料庫
-                logger.ctx.set_operation("DB_update")
-                logger.ctx.set_db(server=server, database=database, table=totb, operation="UPDATE/INSERT")
+        with queue, contextlib.closing(captchas):
+            for key, src in queue:
+                total_processed += 1
+                logger.log_progress(total_processed, obs, f"record_{total_processed}")
 
                 try:
-                    docs = (Name, ID, birthday, insurance_num, today, note)
-                    insurance_result = insurance(docs)
+                    today = str(datetime.datetime.now())[0:-3]
+                    Name = src[2]
+                    ID = src[1]
+                    birthday = src[6]
+                    rowid = str(src[10]).replace('None', '')
+
+                    logger.ctx.set_data(ID=ID, Name=Name)
+                    logger.debug(f"處理用戶: {Name} (ID: {ID})")
+
+                    # 解析生日
+                    try:
+                        bir = birthday.split('/', 2)
+                        birY, birM, birD = bir[0], bir[1], bir[2]
+                    except Exception as birthday_error:
+                        logger.warning(f"生日解析錯誤 ({birthday}): {birthday_error}")
+                        total_failed += 1
+                        logger.increment('records_failed')
+                        queue.fail(key, birthday_error)
+                        continue
 
-                    if len(rowid) > 0:
-                        update(server, username, password, database, totb, note, ID, today, rowid, insurance_num)
-                        logger.log_db_operation("UPDATE", database, totb, 1)
+                    # 查詢保險資訊
+                    captchas.mark_record()
+                    message = query_regno(ID, birY, birM, birD, captchas)
+
+                    # 處理查詢結果
+                    if message is None:
+                        note = 'N'
+                        insurance_num = ''
+                        logger.debug(f"{ID} 查無資料")
+                    elif message == "未辦理登錄":
+                        note = 'N'
+                        insurance_num = ''
+                        logger.debug(f"{ID} 未辦理登錄")
                     else:
-                        toSQL(insurance_result, totb, server, database, username, password)
-                        logger.log_db_operation("INSERT", database, totb, 1)
+                        insurance_num = message.get("regno", "")
+                        note = 'Y' if insurance_num != '' else 'N'
+                        logger.info(f"{ID} 查詢成功 regno={insurance_num}")
+
+                    # 準備資料並寫入資料庫
+                    logger.ctx.set_operation("DB_update")
+                    logger.ctx.set_db(server=server, database=database, table=totb, operation="UPDATE/INSERT")
+
+                    try:
+                        docs = (Name, ID, birthday, insurance_num, today, note)
+                        insurance_result = insurance(docs)
+
+                        db_start = time.perf_counter()
+                        if len(rowid) > 0:
+                            update(server, username, password, database, totb, note, ID, today, rowid, insurance_num)
+                            logger.log_db_operation("UPDATE", database, totb, 1, time.perf_counter() - db_start)
+                        else:
+                            toSQL(insurance_result, totb, server, database, username, password)
+                            logger.log_db_operation("INSERT", database, totb, 1, time.perf_counter() - db_start)
+
+                        total_success += 1
+                        logger.increment('records_success')
+                        queue.done(key)
+
+                    except Exception as db_error:
+                        logger.log_exception(db_error, f"資料庫操作錯誤 (ID={ID})")
+                        total_failed += 1
+                        logger.increment('records_failed')
+                        queue.fail(key, db_error)
+                        continue
 
-                    total_success += 1
-                    logger.increment('records_success')
+                    # 檢查查詢總筆數
+                    if not quota.consume():
+                        logger.warning(f'今日查詢數已達上限 {quota.limit} 筆，正常停止')
+                        break
 
-                except Exception as db_error:
-                    logger.log_exception(db_error, f"資料庫操作錯誤 (ID={ID})")
+                except SystemExit as sys_exit:
+                    logger.warning(f"程式因 HTTP 500 錯誤正常停止: {sys_exit}")
+                    break
+                except Exception as record_error:
+                    logger.log_exception(record_error, f"處理第 {total_processed} 筆資料時發生錯誤")
                     total_failed += 1
                     logger.increment('records_failed')
+                    queue.fail(key, record_error)
                     continue
 
-                # 檢查查詢總筆數
-                try:
-                    exit_o = exit_obs(server, username, password, database, totb)
-
-                    if exit_o >= 5000:
-                        logger.warning('今日查詢數已達上限 5000 筆，正常停止')
-                        break
-
-                except Exception as check_error:
-                    logger.warning(f"檢查查詢數錯誤: {check_error}")
-
-            except SystemExit as sys_exit:
-                logger.warning(f"程式因 HTTP 500 錯誤正常停止: {sys_exit}")
-                break
-            except Exception as record_error:
-                logger.log_exception(record_error, f"處理第 {total_processed} 筆資料時發生錯誤")
-                total_failed += 1
-                logger.increment('records_failed')
-                continue
-
         logger.log_stats({
             'total_processed': total_processed,
             'total_success': total_success,
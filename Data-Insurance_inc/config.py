@@ -19,4 +19,18 @@ wbinfo = {
     'url':'https://public.liaroc.org.tw/lia-public/DIS/Servlet/RD?returnUrl=..%2F..%2FindexUsr.jsp&xml=%3C%3Fxml+version%3D%221.0%22+encoding%3D%22BIG5%22%3F%3E%3CRoot%3E%3CForm%3E%3CreturnUrl%3E..%2F..%2FindexUsr.jsp%3C%2FreturnUrl%3E%3Cxml%2F%3E%3Cfuncid%3EPGQ010++++++++++++++++++++++++%3C%2Ffuncid%3E%3CprogId%3EPGQ010S01%3C%2FprogId%3E%3C%2FForm%3E%3C%2FRoot%3E&funcid=PGQ010++++++++++++++++++++++++&progId=PGQ010S01',
     'Drvfile':rf'C:\Py_Project\env\chromedriver_win32\chromedriver',
     'imgp':r'./captcha.jpg',
-}
\ No newline at end of file
+}
+
+crawler = {
+    'daily_limit': 5000,    # 每日查詢上限
+    'captcha_ttl': 60,      # 預取驗證碼可用秒數
+    'rate': 1.0,            # Max requests per second (per host，驗證碼 GET + 查詢 POST 合計)
+    'burst': 2,             # Allowed back-to-back requests
+}
+
+captcha = {
+    # liaroc simpleCaptcha：5 碼小寫英數，依網站驗證碼調整
+    'charset': 'abcdefghijklmnopqrstuvwxyz0123456789',
+    'length': 5,
+    'case': 'lower',
+}
@@ -1,59 +1,69 @@
+from common.db import get_pool
+from common.query import run
+from common.schema import ensure_indexes, stale_predicate
+from common.workqueue import WorkQueue
+
+
 def src_obs(server,username,password,database,totb1,entitytype):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
     script = f"""
     select (select count(*)
     from [dbo].[{totb1}]
     where (status is null)) --entitytype in ('{entitytype}') and (status is null))
     +
     (select count(*) from [{totb1}] 
-    where (select DATEDIFF(mm, updatetime, getdate()))> = 3 and status <> 'Y')
+    where {stale_predicate('updatetime')} and status <> 'Y')
     """    
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
         
-def dbfrom(server,username,password,database,totb1,entitytype):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
-    script = f"""
-    select *
-    into #test
+def work_queue(server,username,password,database,totb1,entitytype,batch_size=20):
+    """待查詢名單佇列：尚未查詢 (status is null) + 超過 3 個月未更新"""
+    candidates = f"""
+    select concat(ID, '|', IDN_10) as item_key, 1 as priority
     from [dbo].[{totb1}] as a
     where (status is null) --entitytype in ('{entitytype}') and (status is null)
-    
-    insert into #test
-    select  *
+    union all
+    select concat(ID, '|', IDN_10), 0
     from [{totb1}]
-    where (select DATEDIFF(mm, updatetime, getdate()))> = 3 and status <> 'Y'
-    
-    select * from #test
-    order by entitytype desc
-    offset 0 row fetch next 1 rows only
+    where {stale_predicate('updatetime')} and status <> 'Y'
     """
-    cursor.execute(script)
-    c_src = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return c_src
+    # 以 ID 取回 (IX_{totb1}_ID 索引 seek)，(ID, IDN_10) 的比對由 WorkQueue.fetch 在 Python 端完成
+    fetch = f"""
+    select concat(ID, '|', IDN_10), *
+    from [dbo].[{totb1}]
+    where ID in %s
+    """
+    return WorkQueue(get_pool(server, username, password, database), 'Data-Insurance_inc',
+                     candidates, fetch, batch_size=batch_size,
+                     fetch_params=lambda keys: sorted({key.split('|', 1)[0] for key in keys}))
+
+def ensure_work_indexes(server,username,password,database,totb1):
+    """待查詢名單用的索引：尚未查詢 (status is null) 篩選索引、updatetime 範圍查詢、依 ID 取回 / 更新"""
+    return ensure_indexes(get_pool(server, username, password, database), [
+        {'table': totb1, 'name': f'IX_{totb1}_ID', 'columns': ['ID', 'IDN_10']},
+        {'table': totb1, 'name': f'IX_{totb1}_pending', 'columns': ['ID', 'IDN_10'],
+         'where': 'status IS NULL'},
+        {'table': totb1, 'name': f'IX_{totb1}_updatetime', 'columns': ['updatetime'],
+         'include': ['ID', 'IDN_10', 'status']},
+    ])
 
-def updateSQL(server,username,password,database,totb1,entitytype,status,updatetime,ID,IDN_10,Insurance_type,login_date,login_inc):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()    
+def updateSQL(server,username,password,database,totb1,entitytype,status,updatetime,ID,IDN_10,Insurance_type,login_date,login_inc,
+              writer=None):
     script = f"""
     update [dbo].[{totb1}]
-    set Insurance_type = '{Insurance_type}', login_date = '{login_date}', login_inc = '{login_inc}',status = '{status}', updatetime = '{updatetime}'
-    where ID = '{ID}' and IDN_10 = '{IDN_10}' --entitytype in ('{entitytype}') and ID = '{ID}' and IDN_10 = '{IDN_10}'
+    set Insurance_type = %(Insurance_type)s, login_date = %(login_date)s, login_inc = %(login_inc)s,status = %(status)s, updatetime = %(updatetime)s
+    where ID = %(ID)s and IDN_10 = %(IDN_10)s
     """
-    cursor.execute(script)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    params = {
+        'Insurance_type': Insurance_type, 'login_date': login_date, 'login_inc': login_inc,
+        'status': status, 'updatetime': updatetime, 'ID': ID, 'IDN_10': IDN_10,
+    }
+    if writer is not None:
+        writer.execute(script, params, tag=(ID, IDN_10), table=totb1)
+    else:
+        run(get_pool(server, username, password, database), script, params)
 
 def foo(num,obs):
     while num < obs:
@@ -61,16 +71,12 @@ def foo(num,obs):
         yield num
         
 def exit_obs(server,username,password,database,totb1):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
     script = f"""
     select count (distinct ID)
     from [{totb1}]
     where  updatetime > = convert(varchar(10),getdate(),111)
     """    
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
\ No newline at end of file
@@ -2,10 +2,9 @@
 """
 Insurance_inc crawler - 保險登錄機構查詢
 """
+import contextlib
 import os
 import sys
-import requests
-import ddddocr
 import time
 import xml.etree.ElementTree as ET
 import warnings
@@ -25,21 +24,28 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import *
 from etl_func import *
+from common.db import get_pool
 from common.logger import get_logger
+from common.captcha import CaptchaPipeline, get_profile
+from common.http import new_session, set_rate
+from common.schema import log_index_results
+from common.quota import DailyQuota
+from common.writer import BackgroundWriter
 
 # Initialize logger
 logger = get_logger('Data-Insurance_inc')
 
-# 重定向 stderr 以抑制 C++ 層級的錯誤訊息
-class NullWriter:
-    def write(self, txt): pass
-    def flush(self): pass
 
-# 暫存原始 stderr
-original_stderr = sys.stderr
+def on_write_error(tag, error):
+    """背景寫入失敗回報"""
+    logger.log_db_error(error, "UPDATE")
+    logger.warning(f"背景寫入失敗: {tag}")
+    # 該筆已在排入佇列時計為成功，寫入失敗改計為失敗
+    logger.increment('records_success', -1)
+    logger.increment('records_failed')
 
-# Session 和 URL 設定
-session = requests.Session()
+
+# URL 設定
 url = "https://public.liaroc.org.tw/lia-public/DIS/Servlet/RD"
 captcha_url = "https://public.liaroc.org.tw/lia-public/simpleCaptcha.png"
 
@@ -61,6 +67,13 @@ server, database, username, password, totb1, entitytype = (
 )
 
 
+def fetch_captcha(session):
+    """取得驗證碼圖片 (於 CaptchaPipeline 背景執行緒呼叫)"""
+    resp = session.get(captcha_url, verify=False, timeout=10)
+    resp.raise_for_status()
+    return resp.content
+
+
 def build_payload(captcha_code, regno):
     """建構查詢用的 XML payload"""
     return f'''<?xml version="1.0" encoding="BIG5"?>
@@ -81,24 +94,24 @@ def build_payload(captcha_code, regno):
             '''
 
 
-def query_regno_requests(regno, max_retry=1000):
+def query_regno_requests(regno, captchas, max_retry=1000):
     """使用 requests 方式查詢統編"""
     logger.ctx.set_data(regno=regno)
 
     for i in range(max_retry):
+        token = None
         try:
-            # 1. 取得驗證碼
+            # 1. 取得預先辨識的驗證碼 (與上一次查詢重疊準備)
             logger.ctx.set_operation("get_captcha")
-            captcha_img = session.get(captcha_url, verify=False).content
+            token = captchas.get(timeout=30)
+            if token is None:
+                logger.warning("驗證碼取得逾時")
+                continue
 
-            # 暫時重定向 stderr 以抑制 ONNX Runtime 錯誤訊息
-            sys.stderr = NullWriter()
-            try:
-                captcha_code = ddddocr.DdddOcr(show_ad=False).classification(captcha_img)
-            finally:
-                sys.stderr = original_stderr
+            session = token.session
+            captcha_code = token.code
 
-            logger.log_captcha_attempt(i + 1, True, captcha_code)
+            logger.log_captcha_attempt(i + 1, True, captcha_code, token.solve_seconds)
 
             # 2. 準備 payload
             payload = build_payload(captcha_code, regno)
@@ -112,6 +125,7 @@ def query_regno_requests(regno, max_retry=1000):
             result = resp.content.decode("big5", errors="ignore")
 
             # 4. 判斷是否驗證碼錯誤
+            token.report("<CaptchaError>" not in result)
             if "<CaptchaError>" in result:
                 logger.debug(f"驗證碼錯誤 (第 {i+1} 次)")
                 time.sleep(1)
@@ -127,6 +141,9 @@ def query_regno_requests(regno, max_retry=1000):
             logger.warning(f"查詢過程發生錯誤 (第 {i+1} 次): {e}")
             time.sleep(1)
             continue
+        finally:
+            if token is not None:
+                token.close()
 
     logger.warning(f"超過 {max_retry} 次重試仍失敗")
     return False, {'message': '查詢失敗'}
@@ -208,8 +225,8 @@ def parse_query_result(result):
     return result_data
 
 
-def process_single_record(record_data, is_first_record=False):
-    """處理單筆記錄的查詢和資料庫更新"""
+def process_single_record(record_data, quota, writer, captchas, is_first_record=False):
+    """處理單筆記錄的查詢和資料庫更新，回傳 False 表示已達今日上限"""
     name = record_data['name']
     ID = record_data['ID']
     IDN_10 = record_data['IDN_10']
@@ -221,7 +238,8 @@ def process_single_record(record_data, is_first_record=False):
     max_retry = 1000 if is_first_record else 10
 
     # 執行查詢
-    success, result_data = query_regno_requests(IDN_10, max_retry)
+    captchas.mark_record()
+    success, result_data = query_regno_requests(IDN_10, captchas, max_retry)
 
     # 準備資料庫更新資料
     updatetime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
@@ -234,14 +252,14 @@ def process_single_record(record_data, is_first_record=False):
     logger.ctx.set_operation("DB_update")
     logger.ctx.set_db(server=server, database=database, table=totb1, operation="UPDATE")
 
-    updateSQL(server, username, password, database, totb1, entitytype, status, updatetime, ID, IDN_10, Insurance_type, login_date, login_inc)
-    logger.log_db_operation("UPDATE", database, totb1, 1)
+    updateSQL(server, username, password, database, totb1, entitytype, status, updatetime, ID, IDN_10, Insurance_type, login_date, login_inc,
+              writer=writer)
+    logger.log_db_operation("UPDATE", database, totb1, 1)    # 延遲由 writer 在實際寫入時記錄
     logger.info(f"更新完成: ID={ID}, 機構={login_inc}, 狀態={status}")
 
     # 檢查今日查詢筆數限制
-    exit_o = exit_obs(server, username, password, database, totb1)
-    if exit_o >= 5000:
-        logger.warning("今日查詢筆數已達上限 5000 筆")
+    if not quota.consume():
+        logger.warning(f"今日查詢筆數已達上限 {quota.limit} 筆")
         return False
 
     return True
@@ -257,7 +275,10 @@ def run():
     total_failed = 0
 
     try:
-        obs = src_obs(server, username, password, database, totb1, entitytype)
+        log_index_results(logger, ensure_work_indexes(server, username, password, database, totb1))
+
+        queue = work_queue(server, username, password, database, totb1, entitytype)
+        obs = queue.refill()
         logger.info(f"待處理筆數: {obs}")
 
         if obs == 0:
@@ -265,41 +286,53 @@ def run():
             logger.task_end(success=True)
             return True
 
-        for i in range(obs):
-            total_processed += 1
-            logger.log_progress(total_processed, obs, f"record_{total_processed}")
-
-            try:
-                # 從資料庫取得待處理資料
-                src = dbfrom(server, username, password, database, totb1, entitytype)
-
-                if not src or len(src) == 0:
-                    logger.info("沒有待處理的記錄")
-                    break
+        quota = DailyQuota(
+            'Data-Insurance_inc', crawler['daily_limit'],
+            counter=lambda: exit_obs(server, username, password, database, totb1),
+        )
+        if quota.exhausted:
+            logger.warning(f"今日查詢筆數已達上限 {quota.limit} 筆")
+            logger.task_end(success=True)
+            return True
 
-                record_data = {
-                    'name': src[0][1],
-                    'ID': src[0][2],
-                    'IDN_10': src[0][4]
-                }
+        writer = BackgroundWriter(get_pool(server, username, password, database),
+                                  name='Data-Insurance_inc', on_error=on_write_error, logger=logger)
+        quota.sync = writer.flush       # 對帳前先寫完佇列，DB 筆數才包含已處理的資料
+
+        # 驗證碼 GET 與查詢 POST 同一主機，以每秒請求數限制取代固定間隔
+        set_rate(url, crawler['rate'], crawler.get('burst', 1))
+        captchas = CaptchaPipeline('Data-Insurance_inc', fetch_captcha, session_factory=new_session,
+                                   ttl=crawler['captcha_ttl'], profile=get_profile('liaroc', **captcha))
+
+        with queue, contextlib.closing(captchas):
+            for key, src in queue:
+                total_processed += 1
+                logger.log_progress(total_processed, obs, f"record_{total_processed}")
+
+                try:
+                    record_data = {
+                        'name': src[1],
+                        'ID': src[2],
+                        'IDN_10': src[4]
+                    }
+
+                    # 處理記錄（第一筆記錄有特殊處理）
+                    is_first_record = (total_processed == 1)
+                    reached_limit = not process_single_record(record_data, quota, writer, captchas, is_first_record)
+                    queue.done(key)
+                    if reached_limit:
+                        # 達到上限，跳出迴圈
+                        break
 
-                # 處理記錄（第一筆記錄有特殊處理）
-                is_first_record = (i == 0)
-                if process_single_record(record_data, is_first_record):
                     total_success += 1
                     logger.increment('records_success')
-                else:
-                    # 達到上限，跳出迴圈
-                    break
 
-                # 每筆記錄間隔，避免請求過於頻繁
-                time.sleep(2)
-
-            except Exception as e:
-                logger.log_exception(e, f"處理第 {total_processed} 筆資料時發生錯誤")
-                total_failed += 1
-                logger.increment('records_failed')
-                continue
+                except Exception as e:
+                    logger.log_exception(e, f"處理第 {total_processed} 筆資料時發生錯誤")
+                    total_failed += 1
+                    logger.increment('records_failed')
+                    queue.fail(key, e)
+                    continue
 
         logger.log_stats({
             'total_processed': total_processed,
@@ -21,5 +21,5 @@ wbinfo = {
 crawler = {
     'timeout': 30,          # Request timeout (seconds)
     'page_size': 20,        # Records per page
-    'delay': 1,             # Delay between requests (seconds)
+    'rate': 1.0,            # Max requests per second (per host)
 }
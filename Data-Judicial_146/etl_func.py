@@ -5,6 +5,11 @@ ETL functions for Judicial 146 (Deposit Announcements) Crawler
 
 import pymssql
 
+from common.bulk import insert_missing
+
+# 判斷重複記錄的鍵欄位 (建有 UNIQUE INDEX)
+KEY_COLUMNS = ['CaseNumber', 'ApplicantName', 'AnnouncementDate']
+
 
 def connect_database(server, username, password, database):
     """連接資料庫"""
@@ -44,6 +49,7 @@ def create_table_if_not_exists(conn, table_name):
         if table_exists:
             print(f"資料表 '{table_name}' 已存在，將累積新資料")
             cursor.close()
+            ensure_unique_index(conn, table_name)   # 失敗時仍可寫入 (NOT EXISTS 去重)
             return True
 
         # 建立新表
@@ -69,6 +75,7 @@ def create_table_if_not_exists(conn, table_name):
         conn.commit()
         cursor.close()
         print(f"資料表 '{table_name}' 建立成功")
+        ensure_unique_index(conn, table_name)
         return True
 
     except Exception as e:
@@ -106,70 +113,103 @@ def check_existing_data(conn, table_name, western_start, western_end):
         return False
 
 
-def check_duplicate_record(conn, table_name, case_number, applicant_name, announcement_date):
-    """檢查是否為重複記錄"""
+def ensure_unique_index(conn, table_name):
+    """
+    建立重複判斷鍵的 UNIQUE INDEX (已存在則略過)
+
+    既有重複記錄會讓建立失敗，需先執行 remove_duplicates (main.py --dedup)；
+    失敗時回傳 False，寫入仍由 insert_missing 的 NOT EXISTS 比對去重
+    """
     if not conn:
         return False
 
+    index_name = f"UX_{table_name}_dedup"
+    key_sql = ', '.join(KEY_COLUMNS)
+
     try:
         cursor = conn.cursor()
-        check_sql = f"""
-        SELECT COUNT(*)
-        FROM {table_name}
-        WHERE CaseNumber = %s AND ApplicantName = %s AND AnnouncementDate = %s
-        """
+        cursor.execute("SELECT COUNT(*) FROM sys.indexes WHERE name = %s AND object_id = OBJECT_ID(%s)",
+                       (index_name, table_name))
+        if cursor.fetchone()[0] > 0:
+            cursor.close()
+            return True
 
-        cursor.execute(check_sql, (case_number, applicant_name, announcement_date))
-        count = cursor.fetchone()[0]
+        # IGNORE_DUP_KEY: 並行執行時重複的列直接略過，不讓整批失敗
+        cursor.execute(f"""
+        CREATE UNIQUE INDEX {index_name} ON {table_name} ({key_sql})
+        WITH (IGNORE_DUP_KEY = ON)
+        """)
+        conn.commit()
         cursor.close()
-        return count > 0
+        print(f"索引 '{index_name}' 建立成功")
+        return True
 
     except Exception as e:
-        print(f"檢查重複記錄時發生錯誤: {e}")
+        print(f"警告: 建立唯一索引失敗，改以 NOT EXISTS 比對去重 (若有既有重複記錄請執行 --dedup): {e}")
+        conn.rollback()
         return False
 
 
+def remove_duplicates(conn, table_name):
+    """
+    清除既有重複記錄 (保留最早寫入，ID 最小的一筆) - 一次性遷移，不在每次執行時呼叫
+
+    Returns:
+        刪除筆數 (失敗時為 None)
+    """
+    if not conn:
+        return None
+
+    key_sql = ', '.join(KEY_COLUMNS)
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+        WITH d AS (
+            SELECT ROW_NUMBER() OVER (PARTITION BY {key_sql} ORDER BY ID) AS rn
+            FROM {table_name}
+        )
+        DELETE FROM d WHERE rn > 1
+        """)
+        removed = cursor.rowcount
+        conn.commit()
+        cursor.close()
+        print(f"清除 {removed} 筆既有重複記錄")
+        return removed
+
+    except Exception as e:
+        print(f"清除重複記錄失敗: {e}")
+        conn.rollback()
+        return None
+
+
 def insert_data(conn, table_name, processed_data):
-    """插入資料到資料庫"""
+    """插入資料到資料庫 (整頁一次比對重複，只寫入新記錄)"""
     if not conn or not processed_data:
         return False
 
     try:
         cursor = conn.cursor()
 
-        insert_sql = f"""
-        INSERT INTO {table_name} (
-            ItemNumber, Court, CaseNumber, CaseYear, CaseType, CaseFileNumber,
-            ApplicantName, DocumentType, AnnouncementDate, AnnouncementContent
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
+        columns = [
+            'ItemNumber', 'Court', 'CaseNumber', 'CaseYear', 'CaseType', 'CaseFileNumber',
+            'ApplicantName', 'DocumentType', 'AnnouncementDate', 'AnnouncementContent'
+        ]
+
+        rows = [(
+            record['ItemNumber'], record['Court'], record['CaseNumber'],
+            record['CaseYear'], record['CaseType'], record['CaseFileNumber'],
+            record['ApplicantName'], record['DocumentType'],
+            record['AnnouncementDate'], record['AnnouncementContent']
+        ) for record in processed_data]
 
-        # 準備批量插入資料，過濾重複記錄
-        batch_data = []
-        duplicate_count = 0
-
-        for record in processed_data:
-            # 檢查是否重複
-            if check_duplicate_record(conn, table_name, record['CaseNumber'], record['ApplicantName'], record['AnnouncementDate']):
-                duplicate_count += 1
-                continue
-
-            batch_data.append((
-                record['ItemNumber'], record['Court'], record['CaseNumber'],
-                record['CaseYear'], record['CaseType'], record['CaseFileNumber'],
-                record['ApplicantName'], record['DocumentType'],
-                record['AnnouncementDate'], record['AnnouncementContent']
-            ))
-
-        # 插入非重複記錄
-        for record_data in batch_data:
-            cursor.execute(insert_sql, record_data)
+        inserted, duplicate_count = insert_missing(cursor, table_name, rows, columns, KEY_COLUMNS)
         conn.commit()
         cursor.close()
 
         if duplicate_count > 0:
             print(f"跳過 {duplicate_count} 筆重複記錄")
-        print(f"成功插入 {len(batch_data)} 筆新記錄到資料庫")
+        print(f"成功插入 {inserted} 筆新記錄到資料庫")
         return True
 
     except Exception as e:
@@ -14,6 +14,7 @@
 
 import os
 import sys
+import argparse
 import requests
 import re
 import time
@@ -28,6 +29,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import *
 from etl_func import *
 from common.logger import get_logger
+from common.http import new_session, set_rate
 
 # Initialize logger
 logger = get_logger('Data-Judicial_146')
@@ -43,12 +45,10 @@ class DepositCrawler:
         self.base_url = wbinfo['url']
         self.timeout = crawler['timeout']
         self.page_size = crawler['page_size']
-        self.delay = crawler['delay']
 
-        # Session 設定
-        self.session = requests.Session()
-        self.session.verify = False
-        self.session.headers.update({
+        # Session 設定 (共用連線池 + 每秒請求數限制，取代固定 sleep)
+        set_rate(self.base_url, crawler['rate'])
+        self.session = new_session(verify=False, headers={
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'zh-TW,zh;q=0.8,en-US;q=0.5,en;q=0.3',
@@ -135,7 +135,7 @@ class DepositCrawler:
             response = self.session.get(self.base_url)
             elapsed = time.time() - start_time
 
-            logger.log_response(response.status_code, dict(response.headers), f"[HTML: {len(response.text)} chars]", elapsed)
+            logger.log_response(response.status_code, response.headers, lambda r=response: f"[HTML: {len(r.text)} chars]", elapsed)
             response.raise_for_status()
 
             soup = BeautifulSoup(response.text, 'html.parser')
@@ -182,7 +182,7 @@ class DepositCrawler:
                 response = self.session.get(page_url, timeout=30)
 
             elapsed = time.time() - start_time
-            logger.log_response(response.status_code, dict(response.headers), f"[HTML: {len(response.text)} chars]", elapsed)
+            logger.log_response(response.status_code, response.headers, lambda r=response: f"[HTML: {len(r.text)} chars]", elapsed)
 
             response.raise_for_status()
             return self.parse_page_results(response.text)
@@ -363,8 +363,6 @@ class DepositCrawler:
                     saved_count = self.scrape_and_save_page_data(start_date, end_date, page_num, total_pages)
                     total_saved += saved_count
 
-                    time.sleep(self.delay)
-
             verify_data(self.connection, db['totb'])
 
             logger.log_stats({
@@ -392,11 +390,38 @@ def run(start_date=None, end_date=None):
     return crawler.run_complete_process(start_date, end_date)
 
 
+def migrate_dedup():
+    """一次性遷移：清除既有重複記錄並建立唯一索引"""
+    conn = connect_database(db['server'], db['username'], db['password'], db['database'])
+    if not conn:
+        return False
+    try:
+        removed = remove_duplicates(conn, db['totb'])
+        if removed is None:
+            return False
+        logger.info(f"清除 {removed} 筆既有重複記錄")
+        return ensure_unique_index(conn, db['totb'])
+    finally:
+        conn.close()
+
+
 def main():
     """主程式"""
+    parser = argparse.ArgumentParser(description='司法院公告資料抓取')
+    parser.add_argument('--dedup', action='store_true',
+                        help='一次性遷移：清除既有重複記錄並建立唯一索引後結束')
+    args = parser.parse_args()
+
     logger.info(f"資料庫: {db['server']}.{db['database']}")
     logger.info(f"目標資料表: {db['totb']}")
 
+    if args.dedup:
+        if migrate_dedup():
+            logger.info("重複記錄清除與唯一索引建立完成")
+        else:
+            logger.error("重複記錄清除或唯一索引建立失敗")
+        return
+
     try:
         success = run()
         if success:
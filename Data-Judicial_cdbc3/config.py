@@ -24,5 +24,7 @@ wbinfo = {
 crawler = {
     'timeout': 45,          # Request timeout (seconds)
     'daily_limit': 5000,    # Daily processing limit
-    'delay': 0.2,           # Delay between requests (seconds)
+    'rate': 5.0,            # Max requests per second (per host)
+    'burst': 3,             # Allowed back-to-back requests
+    'cache_ttl': 30 * 86400,  # VIEW detail cache (seconds, 0 = off)
 }
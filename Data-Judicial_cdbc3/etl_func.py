@@ -8,6 +8,10 @@ import logging
 import pymssql
 from typing import Dict, Any, List, Optional, Tuple
 
+from common.db import get_pool
+from common.schema import ensure_indexes, stale_predicate
+from common.workqueue import WorkQueue
+
 logger = logging.getLogger(__name__)
 
 
@@ -57,12 +61,11 @@ def src_obs(cursor, fromtb: str, totb: str) -> int:
     SELECT
       (SELECT COUNT(*)
          FROM {fromtb} b
-         LEFT JOIN [{totb}] r ON b.ID = r.ID
-         WHERE r.ID IS NULL)
+         WHERE NOT EXISTS (SELECT 1 FROM [{totb}] r WHERE r.ID = b.ID))
       +
       (SELECT COUNT(*)
          FROM [{totb}]
-         WHERE DATEDIFF(MONTH, update_date, GETDATE()) >= 3)
+         WHERE {stale_predicate('update_date')})
     """
     safe_execute(cursor, sql)
     n = cursor.fetchone()[0]
@@ -70,49 +73,68 @@ def src_obs(cursor, fromtb: str, totb: str) -> int:
     return int(n or 0)
 
 
-def dbfrom(cursor, fromtb: str, totb: str) -> Optional[Tuple]:
+def work_queue(cfg: Dict[str, str], fromtb: str, totb: str, batch_size: int = 20) -> WorkQueue:
     """
-    取一筆要查的身分證資料（優先：目標表沒有的，再來是 >3 個月未更新的）
+    待查詢身分證佇列（優先：目標表沒有的，再來是 >3 個月未更新的）
     """
-    sql = f"""
-    IF OBJECT_ID('tempdb..#test') IS NOT NULL DROP TABLE #test;
-
-    SELECT
-        b.personi,
-        b.ID,
-        CAST(b.name AS NVARCHAR(200)) AS name,
-        b.casei,
-        b.type,
-        b.c,
-        b.m,
-        b.age,
-        b.flg,
-        r.rowid,
-        b.client_flg
-    INTO #test
+    candidates = f"""
+    SELECT b.ID AS item_key, CASE WHEN ISNULL(b.flg, '') <> '' THEN 2 ELSE 1 END AS priority
     FROM {fromtb} b
-    LEFT JOIN [{totb}] r ON b.ID = r.ID
-    WHERE r.ID IS NULL;
-
-    INSERT INTO #test
-    SELECT DISTINCT
-        0 AS personi,
-        ID,
-        CAST(name AS NVARCHAR(200)) AS name,
-        0 AS casei, 0 AS type, 0 AS c, 0 AS m, 0 AS age,
-        '' AS flg,
-        rowid,
-        '1' AS client_flg
+    WHERE NOT EXISTS (SELECT 1 FROM [{totb}] r WHERE r.ID = b.ID)
+    UNION ALL
+    SELECT ID, 0
     FROM [{totb}]
-    WHERE DATEDIFF(MONTH, update_date, GETDATE()) >= 3;
+    WHERE {stale_predicate('update_date')}
+    """
+    fetch = f"""
+    SELECT CONVERT(NVARCHAR(200), t.ID), t.*
+    FROM (
+        SELECT
+            b.personi,
+            b.ID,
+            CAST(b.name AS NVARCHAR(200)) AS name,
+            b.casei,
+            b.type,
+            b.c,
+            b.m,
+            b.age,
+            b.flg,
+            NULL AS rowid,
+            b.client_flg
+        FROM {fromtb} b
+        WHERE NOT EXISTS (SELECT 1 FROM [{totb}] r WHERE r.ID = b.ID)
+
+        UNION ALL
+
+        SELECT DISTINCT
+            0 AS personi,
+            ID,
+            CAST(name AS NVARCHAR(200)) AS name,
+            0 AS casei, 0 AS type, 0 AS c, 0 AS m, 0 AS age,
+            '' AS flg,
+            rowid,
+            '1' AS client_flg
+        FROM [{totb}]
+        WHERE {stale_predicate('update_date')}
+    ) t
+    WHERE t.ID IN %s
+    ORDER BY t.flg DESC, t.rowid ASC
+    """
+    pool = get_pool(cfg["server"], cfg["username"], cfg["password"], cfg["database"])
+    return WorkQueue(pool, 'Data-Judicial_cdbc3', candidates, fetch, batch_size=batch_size)
+
 
-    SELECT TOP 1 *
-    FROM #test
-    ORDER BY flg DESC, rowid ASC;
+def ensure_work_indexes(cfg: Dict[str, str], fromtb: str, totb: str) -> List[Tuple[str, str]]:
     """
-    safe_execute(cursor, sql)
-    row = cursor.fetchone()
-    return row
+    待查詢佇列用的索引：目標表 ID 比對、update_date 範圍查詢、來源表 ID
+    """
+    pool = get_pool(cfg["server"], cfg["username"], cfg["password"], cfg["database"])
+    return ensure_indexes(pool, [
+        {'table': totb, 'name': f'IX_{totb}_ID', 'columns': ['ID'], 'include': ['rowid']},
+        {'table': totb, 'name': f'IX_{totb}_update_date', 'columns': ['update_date'],
+         'include': ['ID', 'name', 'rowid']},
+        {'table': fromtb, 'name': f'IX_{fromtb}_ID', 'columns': ['ID'], 'include': ['flg']},
+    ])
 
 
 def delete_row(cursor, totb: str, ID: str, rowid: str):
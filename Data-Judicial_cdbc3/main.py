@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 """
 Judicial cdcb3 sync - 消債事件公告同步
-- requests.Session + Retry 防止 DNS/連線暫失
+- requests.Session + Retry 防止 DNS/連線暫失 (common.http)
+- 每秒請求數限制 (token bucket) 取代每筆固定 sleep
 - SQL 改為參數化 (%s) + 語法修正
 - 統一 Log 模組
 """
@@ -14,7 +15,6 @@ import json
 from typing import Dict, Any, List, Optional
 
 import requests
-from requests.adapters import HTTPAdapter, Retry
 from bs4 import BeautifulSoup
 
 # Add parent directory to path for common module
@@ -23,31 +23,26 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import *
 from etl_func import *
 from common.logger import get_logger
+from common.schema import log_index_results
+from common.quota import DailyQuota
+from common.http import make_retry, new_session, set_rate
+from common.httpcache import get_cache
 
 # Initialize logger
 logger = get_logger('Data-Judicial_cdbc3')
 
 
 def build_session() -> requests.Session:
-    """Build HTTP session with retry"""
-    s = requests.Session()
-    retries = Retry(
-        total=5,
-        connect=5,
-        read=5,
-        backoff_factor=1.2,
-        status_forcelist=(429, 500, 502, 503, 504),
-        allowed_methods=["GET", "POST"],
-        raise_on_status=False,
+    """Build HTTP session with retry (查詢為 POST，允許重送)、每秒請求數限制與 VIEW 頁快取"""
+    set_rate(wbinfo['query_url'], crawler['rate'], crawler.get('burst', 1))
+    return new_session(
+        retries=make_retry(total=5, backoff=1.2, methods=("GET", "POST")),
+        headers={
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                          "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0 Safari/537.36"
+        },
+        cache=get_cache('Data-Judicial_cdbc3', crawler['cache_ttl'], urls=[wbinfo['view_url']]),
     )
-    adapter = HTTPAdapter(max_retries=retries)
-    s.mount("https://", adapter)
-    s.mount("http://", adapter)
-    s.headers.update({
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                      "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0 Safari/537.36"
-    })
-    return s
 
 
 class JudicialSync:
@@ -58,7 +53,6 @@ class JudicialSync:
         self.today_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.timeout = crawler['timeout']
         self.daily_limit = crawler['daily_limit']
-        self.delay = crawler['delay']
 
     def get_token(self) -> Optional[str]:
         """Get CSRF token from page"""
@@ -74,7 +68,7 @@ class JudicialSync:
             r = self.session.post(wbinfo["token_url"], headers=headers, timeout=self.timeout)
             elapsed = time.time() - start_time
 
-            logger.log_response(r.status_code, dict(r.headers), f"[HTML: {len(r.text)} chars]", elapsed)
+            logger.log_response(r.status_code, r.headers, lambda r=r: f"[HTML: {len(r.text)} chars]", elapsed)
 
             if r.status_code != 200:
                 logger.error(f"token 頁面狀態碼: {r.status_code}")
@@ -127,7 +121,7 @@ class JudicialSync:
             r = self.session.post(wbinfo["query_url"], headers=headers, data=data, timeout=self.timeout)
             elapsed = time.time() - start_time
 
-            logger.log_response(r.status_code, dict(r.headers), r.text[:500] if len(r.text) > 500 else r.text, elapsed)
+            logger.log_response(r.status_code, r.headers, lambda r=r: r.text[:500], elapsed)
 
             if r.status_code != 200:
                 logger.error(f"query_list 狀態碼: {r.status_code}, ID={ID}")
@@ -166,7 +160,7 @@ class JudicialSync:
             r = self.session.post(wbinfo["view_url"], data=data1, timeout=self.timeout)
             elapsed = time.time() - start_time
 
-            logger.log_response(r.status_code, dict(r.headers), f"[HTML: {len(r.text)} chars]", elapsed)
+            logger.log_response(r.status_code, r.headers, lambda r=r: f"[HTML: {len(r.text)} chars]", elapsed)
 
             if r.status_code != 200:
                 logger.warning(f"view_basis 狀態碼: {r.status_code}, crtid={crtid}")
@@ -228,7 +222,10 @@ class JudicialSync:
             self.conn = db_connect(db)
             self.cursor = self.conn.cursor()
 
-            tasks = src_obs(self.cursor, db['fromtb'], db['totb'])
+            log_index_results(logger, ensure_work_indexes(db, db['fromtb'], db['totb']))
+
+            queue = work_queue(db, db['fromtb'], db['totb'])
+            tasks = queue.refill()
             logger.info(f"待處理筆數: {tasks}")
 
             if tasks <= 0:
@@ -237,8 +234,11 @@ class JudicialSync:
                 return True
 
             # Check daily limit
-            processed_today = exit_obs(self.cursor, db['totb'])
-            if processed_today >= self.daily_limit:
+            quota = DailyQuota(
+                'Data-Judicial_cdbc3', self.daily_limit,
+                counter=lambda: exit_obs(self.cursor, db['totb']),
+            )
+            if quota.exhausted:
                 logger.info(f"已達每日上限 ({self.daily_limit})")
                 logger.task_end(success=True)
                 return True
@@ -253,55 +253,41 @@ class JudicialSync:
 
             total_processed = 0
 
-            for task_idx in range(tasks):
-                logger.log_progress(task_idx + 1, tasks, f"task_{task_idx + 1}")
-
-                # Check limits each iteration
-                processed_today = exit_obs(self.cursor, db['totb'])
-                if processed_today >= self.daily_limit:
-                    logger.info(f"已達每日上限 ({self.daily_limit})")
-                    break
-
-                now = datetime.datetime.now()
-                if now > cutoff:
-                    logger.info(f"超過時間限制")
-                    break
-
-                row = dbfrom(self.cursor, db['fromtb'], db['totb'])
-                if not row:
-                    logger.info("沒有候選記錄")
-                    break
-
-                ID = str(row[1])
-                name = str(row[2])
-                rowid = ("" if row[9] is None else str(row[9]))
-
-                logger.ctx.set_data(ID=ID, name=name, rowid=rowid)
-                logger.info(f"處理: ID={ID}, name={name}")
-
-                token = self.get_token()
-                if not token:
-                    logger.error(f"跳過 ID={ID}: 無法取得 token")
-                    time.sleep(1.0)
-                    continue
-
-                payload = self.query_list(token, ID)
-                today_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                docs: List[Dict[str, Any]] = []
-
-                if not payload or "data" not in payload or "dataList" not in payload["data"]:
-                    logger.info(f"ID={ID} 查無資料")
-                    if rowid:
-                        delete_row(self.cursor, db["totb"], ID, rowid)
-                    docs.append(self.build_doc_tuple(
-                        ID, name, "", "", "", "", "", "", "", "", "",
-                        "", "", "", "", "", "", today_str, "N", ""
-                    ))
-                else:
-                    data_list = payload["data"]["dataList"] or []
-                    if len(data_list) == 0:
-                        logger.info(f"ID={ID} dataList 為空")
+            with queue:
+                for task_idx, (key, row) in enumerate(queue):
+                    logger.log_progress(task_idx + 1, tasks, f"task_{task_idx + 1}")
+
+                    # Check limits each iteration
+                    if quota.exhausted:
+                        logger.info(f"已達每日上限 ({self.daily_limit})")
+                        break
+
+                    now = datetime.datetime.now()
+                    if now > cutoff:
+                        logger.info(f"超過時間限制")
+                        break
+
+                    ID = str(row[1])
+                    name = str(row[2])
+                    rowid = ("" if row[9] is None else str(row[9]))
+
+                    logger.ctx.set_data(ID=ID, name=name, rowid=rowid)
+                    logger.info(f"處理: ID={ID}, name={name}")
+
+                    token = self.get_token()
+                    if not token:
+                        logger.error(f"跳過 ID={ID}: 無法取得 token")
+                        queue.fail(key, "token")
+                        time.sleep(1.0)
+                        continue
+
+                    payload = self.query_list(token, ID)
+                    today_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+                    docs: List[Dict[str, Any]] = []
+
+                    if not payload or "data" not in payload or "dataList" not in payload["data"]:
+                        logger.info(f"ID={ID} 查無資料")
                         if rowid:
                             delete_row(self.cursor, db["totb"], ID, rowid)
                         docs.append(self.build_doc_tuple(
@@ -309,65 +295,76 @@ class JudicialSync:
                             "", "", "", "", "", "", today_str, "N", ""
                         ))
                     else:
-                        if rowid:
-                            delete_row(self.cursor, db["totb"], ID, rowid)
-
-                        for i, rec in enumerate(data_list):
-                            crtid = str(rec.get("crtid") or "")
-                            sys_ = str(rec.get("sys") or "")
-                            crmyy = str(rec.get("crmyy") or "")
-                            crmid = str(rec.get("crmid") or "")
-                            crmno = str(rec.get("crmno") or "")
-                            crtname = str(rec.get("crtname") or "")
-                            durdt = str(rec.get("durdt") or "")
-                            durnm = str(rec.get("durnm") or "")
-                            filenm = str(rec.get("filenm") or "")
-                            crm_text = str(rec.get("crm_text") or "")
-                            owner = str(rec.get("owner") or "")
-
-                            attachment_rmk = ""
-                            attachment_atfilenm = ""
-                            attachmentnm = ""
-                            try:
-                                attach = rec.get("attachment") or []
-                                if attach and isinstance(attach, list):
-                                    attachment_rmk = str(attach[0].get("rmk") or "")
-                                    attachment_atfilenm = str(attach[0].get("atfilenm") or "")
-                                attachmentnm = str(rec.get("attachmentnm") or "")
-                            except Exception:
-                                pass
-
-                            basis = self.view_basis(crtid, filenm, ID)
-                            if len(basis) > 4000:
-                                basis = ""
-
+                        data_list = payload["data"]["dataList"] or []
+                        if len(data_list) == 0:
+                            logger.info(f"ID={ID} dataList 為空")
+                            if rowid:
+                                delete_row(self.cursor, db["totb"], ID, rowid)
                             docs.append(self.build_doc_tuple(
-                                ID, name, crtid, sys_, crmyy, crmid, crmno, crtname, durdt, durnm,
-                                filenm, crm_text, owner, attachment_rmk, attachment_atfilenm,
-                                attachmentnm, basis, today_str, "Y", ""
+                                ID, name, "", "", "", "", "", "", "", "", "",
+                                "", "", "", "", "", "", today_str, "N", ""
                             ))
+                        else:
+                            if rowid:
+                                delete_row(self.cursor, db["totb"], ID, rowid)
+
+                            for i, rec in enumerate(data_list):
+                                crtid = str(rec.get("crtid") or "")
+                                sys_ = str(rec.get("sys") or "")
+                                crmyy = str(rec.get("crmyy") or "")
+                                crmid = str(rec.get("crmid") or "")
+                                crmno = str(rec.get("crmno") or "")
+                                crtname = str(rec.get("crtname") or "")
+                                durdt = str(rec.get("durdt") or "")
+                                durnm = str(rec.get("durnm") or "")
+                                filenm = str(rec.get("filenm") or "")
+                                crm_text = str(rec.get("crm_text") or "")
+                                owner = str(rec.get("owner") or "")
+
+                                attachment_rmk = ""
+                                attachment_atfilenm = ""
+                                attachmentnm = ""
+                                try:
+                                    attach = rec.get("attachment") or []
+                                    if attach and isinstance(attach, list):
+                                        attachment_rmk = str(attach[0].get("rmk") or "")
+                                        attachment_atfilenm = str(attach[0].get("atfilenm") or "")
+                                    attachmentnm = str(rec.get("attachmentnm") or "")
+                                except Exception:
+                                    pass
+
+                                basis = self.view_basis(crtid, filenm, ID)
+                                if len(basis) > 4000:
+                                    basis = ""
+
+                                docs.append(self.build_doc_tuple(
+                                    ID, name, crtid, sys_, crmyy, crmid, crmno, crtname, durdt, durnm,
+                                    filenm, crm_text, owner, attachment_rmk, attachment_atfilenm,
+                                    attachmentnm, basis, today_str, "Y", ""
+                                ))
 
-                try:
-                    if docs:
-                        logger.ctx.set_operation("DB_insert")
-                        logger.ctx.set_db(server=db['server'], database=db['database'], table=db['totb'], operation="INSERT")
-
-                        toSQL(self.cursor, db['totb'], docs)
-                        self.conn.commit()
-
-                        logger.log_db_operation("INSERT", db['database'], db['totb'], len(docs))
-                        logger.increment('records_success', len(docs))
-                        total_processed += len(docs)
-
-                except Exception as e:
-                    logger.log_db_error(e, "INSERT")
                     try:
-                        self.conn.rollback()
-                    except Exception:
-                        pass
-                    continue
-
-                time.sleep(self.delay)
+                        if docs:
+                            logger.ctx.set_operation("DB_insert")
+                            logger.ctx.set_db(server=db['server'], database=db['database'], table=db['totb'], operation="INSERT")
+
+                            toSQL(self.cursor, db['totb'], docs)
+                            self.conn.commit()
+
+                            logger.log_db_operation("INSERT", db['database'], db['totb'], len(docs))
+                            logger.increment('records_success', len(docs))
+                            total_processed += len(docs)
+                            quota.consume()
+                        queue.done(key)
+
+                    except Exception as e:
+                        logger.log_db_error(e, "INSERT")
+                        try:
+                            self.conn.rollback()
+                        except Exception:
+                            pass
+                        queue.fail(key, e)
+                        continue
 
             logger.log_stats({
                 'total_tasks': tasks,
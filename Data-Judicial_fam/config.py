@@ -21,3 +21,12 @@ wbinfo = {
     'url1': 'https://domestic.judicial.gov.tw/judbp/wkw/WHD9HN01/VIEW.htm'
 }
 
+crawler = {
+    'daily_limit': 10000,   # 每日處理上限 (distinct ID)
+    'cache_ttl': 30 * 86400,  # VIEW 詳細頁快取秒數 (0 = 不快取)
+    'adaptive': {           # 自適應速率 / 並行數 (common.adaptive)，上次結果存於 data/http_limits.json
+        'min_rate': 0.1,
+        'max_rate': 5.0,
+        'max_concurrency': 1,
+    },
+}
@@ -4,29 +4,28 @@ Created on Mon May  9 18:34:52 2022
 
 @author: admin
 """
+from common.db import get_pool
+from common.query import run
+from common.schema import ensure_indexes, stale_predicate
+
 
 def foo(num,obs):
     while num < obs:
         num = num + 1 
         yield num
 def src_obs(server,username,password,database,fromtb,totb):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
     script = f"""
     
-    select ( select count(*) from base_case_allID b
-            left join judicial_fam r on b.ID = r.ID 
-            where r.ID is null )
+    select ( select count(*) from [{fromtb}] b
+            where not exists (select 1 from [{totb}] r where r.ID = b.ID) )
    +
-    (select count(*) from judicial_fam 
-    where (select DATEDIFF(mm, update_date, getdate()))> = 3 )  
+    (select count(*) from [{totb}] 
+    where {stale_predicate('update_date')} )  
 	 
     """    
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
 def judicial(doc):
     judicial= []
@@ -47,9 +46,7 @@ def judicial(doc):
     })
     return judicial
 def toSQL(docs, totb, server, database, username, password):
-    import pymssql
-
-    with pymssql.connect(server=server, user=username, password=password, database=database) as conn:
+    with get_pool(server, username, password, database).connection() as conn:
         with conn.cursor() as cursor:
             data_keys = ','.join(docs[0].keys())
             data_symbols = ','.join(['%s' for _ in docs[0].keys()])
@@ -60,11 +57,9 @@ def toSQL(docs, totb, server, database, username, password):
 
 
 def dbfrom(server,username,password,database,fromtb,totb):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
-    
     script = f"""
+    if object_id('tempdb..#test') is not null drop table #test
+
     select distinct b.personi,b.ID,replace(convert(varchar(10),b.name),'?','') as name,b.casei,b.type,b.c,b.m,b.age,b.flg,r.rowid
     into #test
     from {fromtb} b
@@ -75,44 +70,40 @@ def dbfrom(server,username,password,database,fromtb,totb):
     insert into #test
     select distinct 0 as personi,ID,replace(convert(varchar(10),name),'?','')as name,0 as casei,0 as type,0 as c,0 as m,0 as age,'' as flg,rowid
     from [{totb}]
-    where (select DATEDIFF(mm, update_date, getdate()))> = 3 and ID != 'C220263848'
+    where {stale_predicate('update_date')} and ID != 'C220263848'
 	
     select * from #test order by flg desc 
 	--offset 0 row fetch next 1 rows only
     
     """
-    cursor.execute(script)
-    c_src = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        c_src = cursor.fetchall()
     return c_src
 
 def delete(server,username,password,database,totb,note,ID,rowid,register_no,item):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
-        
     script = f"""
     delete from [{totb}]
-    where id = '{ID}'  --and register_no = '{register_no}' and flag = '{item}'
-    
+    where id = %(ID)s  --and register_no = ... and flag = ...
     """
-    cursor.execute(script)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    run(get_pool(server, username, password, database), script, {'ID': ID})
 def exit_obs(server,username,password,database,totb):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
     script = f"""
     select count (distinct ID)
     from [{totb}]
     where  update_date > = convert(varchar(10),getdate(),111)
     """    
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return list(obs[0])[0]
\ No newline at end of file
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
+    return list(obs[0])[0]
+
+
+def ensure_work_indexes(server,username,password,database,fromtb,totb):
+    """待查詢名單用的索引：目標表 ID 比對、update_date 範圍查詢"""
+    return ensure_indexes(get_pool(server, username, password, database), [
+        {'table': totb, 'name': f'IX_{totb}_ID', 'columns': ['ID'], 'include': ['rowid']},
+        {'table': totb, 'name': f'IX_{totb}_update_date', 'columns': ['update_date'],
+         'include': ['ID', 'name', 'rowid']},
+        {'table': fromtb, 'name': f'IX_{fromtb}_ID', 'columns': ['ID']},
+    ])
@@ -8,14 +8,11 @@
 import os
 import sys
 import datetime
-import requests
 import json
 import re
 import time
-import urllib
 
 from bs4 import BeautifulSoup
-from urllib.parse import urlencode
 
 # Add parent directory to path for common module
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -23,6 +20,11 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import *
 from etl_func import *
 from common.logger import get_logger
+from common.schema import log_index_results
+from common.quota import DailyQuota
+from common.http import new_session
+from common.httpcache import get_cache
+from common.adaptive import set_adaptive
 
 # Initialize logger
 logger = get_logger('Data-Judicial_fam')
@@ -42,8 +44,11 @@ def run():
     url1 = wbinfo['url1']
 
     logger.log_db_connect(server, database, username)
+    limiter = set_adaptive(url, **crawler['adaptive'])
 
     try:
+        log_index_results(logger, ensure_work_indexes(server, username, password, database, fromtb, totb))
+
         obs = src_obs(server, username, password, database, fromtb, totb)
         logger.info(f"待處理筆數: {obs}")
 
@@ -60,7 +65,17 @@ def run():
         total_success = 0
         total_failed = 0
 
+        quota = DailyQuota(
+            'Data-Judicial_fam', crawler['daily_limit'],
+            counter=lambda: exit_obs(server, username, password, database, totb),
+        )
+
         for i in range(total_records):
+            # Check daily limit
+            if quota.exhausted:
+                logger.warning(f"已達每日上限 ({quota.used})")
+                break
+
             logger.log_progress(i + 1, total_records, f"record_{i + 1}")
 
             try:
@@ -73,7 +88,7 @@ def run():
                 logger.debug(f"處理: ID={ID}, name={name}")
 
                 # Create session and get token
-                req_session = requests.Session()
+                req_session = new_session(cache=get_cache('Data-Judicial_fam', crawler['cache_ttl'], urls=[url1]))
                 headers = {
                     'Host': 'domestic.judicial.gov.tw',
                     'Origin': 'https://domestic.judicial.gov.tw',
@@ -89,7 +104,7 @@ def run():
                 token_resp = req_session.post(set_token_url, headers=headers, timeout=30)
                 elapsed = time.time() - start_time
 
-                logger.log_response(token_resp.status_code, dict(token_resp.headers), f"[HTML: {len(token_resp.text)} chars]", elapsed)
+                logger.log_response(token_resp.status_code, token_resp.headers, lambda r=token_resp: f"[HTML: {len(r.text)} chars]", elapsed)
 
                 token = BeautifulSoup(token_resp.text, 'lxml').select('input[name=token]')[0]['value']
                 logger.debug(f"取得 token: {token[:20]}...")
@@ -114,7 +129,7 @@ def run():
                 resp = req_session.post(url, headers=headers, data=data, timeout=30)
                 elapsed = time.time() - start_time
 
-                logger.log_response(resp.status_code, dict(resp.headers), resp.text[:500] if len(resp.text) > 500 else resp.text, elapsed)
+                logger.log_response(resp.status_code, resp.headers, lambda r=resp: r.text[:500], elapsed)
 
                 soup = BeautifulSoup(resp.text, "lxml")
 
@@ -148,23 +163,18 @@ def run():
                     logger.ctx.set_operation("DB_insert")
                     logger.ctx.set_db(server=server, database=database, table=totb, operation="INSERT")
 
+                    db_start = time.perf_counter()
                     if len(rowid) == 0:
                         toSQL(judicial_result, totb, server, database, username, password)
-                        logger.log_db_operation("INSERT", database, totb, 1)
+                        logger.log_db_operation("INSERT", database, totb, 1, time.perf_counter() - db_start)
                     else:
                         delete(server, username, password, database, totb, note, ID, rowid, register_no, flag)
                         toSQL(judicial_result, totb, server, database, username, password)
-                        logger.log_db_operation("DELETE+INSERT", database, totb, 1)
+                        logger.log_db_operation("DELETE+INSERT", database, totb, 1, time.perf_counter() - db_start)
 
                     total_success += 1
                     logger.increment('records_success')
 
-                    # Check daily limit
-                    exit_o = exit_obs(server, username, password, database, totb)
-                    if exit_o >= 10000:
-                        logger.warning(f"已達每日上限 ({exit_o})")
-                        break
-
                 else:
                     # Data found - process each record
                     logger.info(f"ID={ID} 找到 {len(res)} 筆資料")
@@ -194,7 +204,7 @@ def run():
                         resp = req_session.post(url1, data=data1, timeout=30)
                         elapsed = time.time() - start_time
 
-                        logger.log_response(resp.status_code, dict(resp.headers), f"[HTML: {len(resp.text)} chars]", elapsed)
+                        logger.log_response(resp.status_code, resp.headers, lambda r=resp: f"[HTML: {len(r.text)} chars]", elapsed)
 
                         soup = BeautifulSoup(resp.text.replace('</br>', '').replace('<br/>', ''), "xml")
                         soup1 = soup.findAll('td')
@@ -289,30 +299,29 @@ def run():
                         logger.ctx.set_operation("DB_insert")
                         logger.ctx.set_db(server=server, database=database, table=totb, operation="INSERT")
 
+                        db_start = time.perf_counter()
                         if len(rowid) == 0:
                             toSQL(judicial_result, totb, server, database, username, password)
-                            logger.log_db_operation("INSERT", database, totb, 1)
+                            logger.log_db_operation("INSERT", database, totb, 1, time.perf_counter() - db_start)
                         else:
                             delete(server, username, password, database, totb, note, ID, rowid, register_no, item)
                             toSQL(judicial_result, totb, server, database, username, password)
-                            logger.log_db_operation("DELETE+INSERT", database, totb, 1)
+                            logger.log_db_operation("DELETE+INSERT", database, totb, 1, time.perf_counter() - db_start)
 
                         total_success += 1
                         logger.increment('records_success')
 
-                        # Check daily limit
-                        exit_o = exit_obs(server, username, password, database, totb)
-                        if exit_o >= 10000:
-                            logger.warning(f"已達每日上限 ({exit_o})")
-                            break
-
                 total_processed += 1
+                quota.consume()
 
             except Exception as e:
                 logger.log_exception(e, f"處理記錄 {i + 1} 時發生錯誤")
                 total_failed += 1
                 logger.increment('records_failed')
-                time.sleep(10)
+                # 網站錯誤已由自適應控制器降速；持續失敗才停止
+                if limiter.failing:
+                    logger.error(f"連續 {limiter.consecutive_failures} 次請求失敗，網站可能暫停服務，停止處理")
+                    break
                 continue
 
         logger.log_stats({
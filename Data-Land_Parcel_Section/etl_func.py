@@ -1,3 +1,7 @@
+from common.db import get_pool
+from common.bulk import bulk_insert
+
+
 def foo(num,obs):
     while num < obs:
         num = num + 1 
@@ -29,26 +33,25 @@ def toSQL(docs, totb, server, database, username, password):
     安全批次寫入到 totb（建議帶 schema，例如 'dbo.land_parcel_section_tmp'）
     docs: list[tuple]，欄位順序需與 SQL 欄位清單一致。
     """
-    import pymssql
     if not docs:
         return
 
-    col_list = """
-        [city_id],
-        [city],
-        [area_id],
-        [area],
-        [parcel_section_id],
-        [parcel_section],
-        [isword],
-        [updatetime]
-    """
-    sql = f"INSERT INTO {totb} ({col_list}) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)"
-
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
+    col_list = [
+        '[city_id]',
+        '[city]',
+        '[area_id]',
+        '[area]',
+        '[parcel_section_id]',
+        '[parcel_section]',
+        '[isword]',
+        '[updatetime]',
+    ]
+
+    pool = get_pool(server, username, password, database)
+    conn = pool.acquire()
     try:
         with conn.cursor() as cursor:
-            cursor.executemany(sql, docs)
+            bulk_insert(cursor, totb, docs, col_list)
         conn.commit()
         print(f"已插入 {len(docs)} 筆 → {totb}")
     except Exception as e:
@@ -58,22 +61,22 @@ def toSQL(docs, totb, server, database, username, password):
             print("第一筆資料：", docs[0])
         raise
     finally:
-        conn.close()
+        pool.release(conn)
 
 
 def truncate_table(server, username, password, database, table):
     """
     清空指定資料表（支援 schema），例如 table='dbo.land_parcel_section_tmp'
     """
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
+    pool = get_pool(server, username, password, database)
+    conn = pool.acquire()
     try:
         with conn.cursor() as cursor:
             cursor.execute(f"TRUNCATE TABLE {table};")
         conn.commit()
         print(f"已清空 {table}")
     finally:
-        conn.close()
+        pool.release(conn)
 
 
 def overwrite(server, username, password, database,
@@ -88,8 +91,6 @@ def overwrite(server, username, password, database,
 
     欄位集合以 tmp_table 與 target_table 欄位一致為前提。
     """
-    import pymssql
-
     # 組 MERGE 子句
     on_cond = ' AND '.join([f"T.[{k}] = S.[{k}]" for k in key_cols])
 
@@ -110,26 +111,27 @@ def overwrite(server, username, password, database,
     ;
     """
 
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
+    pool = get_pool(server, username, password, database)
+    conn = pool.acquire()
     try:
         with conn.cursor() as cursor:
             cursor.execute(merge_sql)
         conn.commit()
         print(f"overwrite 完成：{tmp_table} → {target_table}（update_when_matched={update_when_matched}）")
     finally:
-        conn.close()
+        pool.release(conn)
 
 
 def dbtest(server, username, password, database, table):
     """
     測試用：清空指定資料表
     """
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
+    pool = get_pool(server, username, password, database)
+    conn = pool.acquire()
     try:
         with conn.cursor() as cursor:
             cursor.execute(f"TRUNCATE TABLE {table};")
         conn.commit()
         print(f"dbtest: 已清空 {table}")
     finally:
-        conn.close()
+        pool.release(conn)
@@ -6,11 +6,8 @@ import os
 import sys
 import re
 import time
-import random
-import requests
 import xml.etree.ElementTree as ET
 from bs4 import BeautifulSoup
-from requests.adapters import HTTPAdapter, Retry
 
 # Add parent directory to path for common module
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -18,6 +15,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from etl_func import indata, toSQL, truncate_table, overwrite, is_all_chinese
 from config import *
 from common.logger import get_logger
+from common.http import make_retry, new_session, set_rate
+from common.httpcache import get_cache
 
 # Initialize logger
 logger = get_logger('Data-Land_Parcel_Section')
@@ -38,7 +37,8 @@ REFERER = f"{BASE}/EpaperApply/RVA_Input2"
 
 # ---- 參數 ----
 BATCH = 500                                  # 批次寫入量
-SLEEP_MIN, SLEEP_MAX = 0.3, 0.8              # 每次呼叫 API 的節流時間區間(秒)
+RATE = 2.0                                   # 每秒呼叫 API 次數上限 (token bucket 節流)
+CACHE_TTL = 7 * 24 * 3600                    # 縣市 / 鄉鎮 XML 快取秒數 (0 = 不快取)
 
 
 def run():
@@ -47,18 +47,16 @@ def run():
     logger.log_db_connect(server, database, username)
 
     # ===== requests session + retries =====
-    session = requests.Session()
-    retries = Retry(
-        total=4, backoff_factor=0.6,
-        status_forcelist=(429, 500, 502, 503, 504),
-        allowed_methods=["GET", "POST"]
+    set_rate(BASE, RATE)
+    session = new_session(
+        retries=make_retry(total=4, backoff=0.6, methods=("GET", "POST")),
+        headers={
+            "User-Agent": "Mozilla/5.0",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.8",
+        },
+        cache=get_cache('Data-Land_Parcel_Section', CACHE_TTL, urls=[XML_URL]),
     )
-    session.mount("https://", HTTPAdapter(max_retries=retries))
-    session.headers.update({
-        "User-Agent": "Mozilla/5.0",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.8",
-    })
 
     # ===== XML parse helper（處理 Big5 等多位元編碼） =====
     def parse_xml_with_encoding_fallback(data: bytes) -> ET.Element:
@@ -88,7 +86,7 @@ def run():
         resp.raise_for_status()
         elapsed = time.time() - start_time
 
-        logger.log_response(resp.status_code, dict(resp.headers), f"[XML: {len(resp.content)} bytes]", elapsed)
+        logger.log_response(resp.status_code, resp.headers, lambda r=resp: f"[XML: {len(r.content)} bytes]", elapsed)
 
         root = parse_xml_with_encoding_fallback(resp.content)
 
@@ -149,9 +147,6 @@ def run():
 
             logger.ctx.set_operation("fetch_sessions")
             for aj, a in enumerate(a_list, 1):
-                # 節流
-                time.sleep(random.uniform(SLEEP_MIN, SLEEP_MAX))
-
                 items = fetch_sessions(c["city_id"], a["area_id"])
                 for it in items:
                     s_name = (it["s_name"] or "").replace('𠯿', '鹽')
@@ -2,7 +2,9 @@
 """
 Database ETL functions for Legal Insurance System
 """
-import pymssql
+from common.db import get_pool
+from common.query import run
+from common.workqueue import WorkQueue
 
 
 def foo(num, obs):
@@ -14,24 +16,23 @@ def foo(num, obs):
 
 def src_obs(server, username, password, database, fromtb, totb,today):
     """Get count of pending cases (STATUS = 'N')"""
-    conn = pymssql.connect(server=server, user=username, password=password, database=database, charset='utf8')
-    cursor = conn.cursor()
     script = f"""
     SELECT COUNT(*) FROM INS_Legal_Insurtech WHERE STATUS = 'N' AND DataDt = '{today}'
     """
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database, charset='utf8').cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
 
 
-def dbfrom(server, username, password, database, fromtb, totb, today):
-    """Fetch one pending case data from database"""
-    conn = pymssql.connect(server=server, user=username, password=password, database=database, charset='utf8')
-    cursor = conn.cursor()
-
-    script = f"""
+def work_queue(server, username, password, database, fromtb, totb, today, batch_size=10):
+    """Pending cases (STATUS = 'N') as a batch-claim work queue keyed by CaseI"""
+    candidates = f"""
+    SELECT DISTINCT CaseI AS item_key, 0 AS priority
+    FROM [UCS_ReportDB].[dbo].[INS_Legal_Insurtech]
+    WHERE STATUS = 'N' AND DataDt = '{today}'
+    """
+    fetch = f"""
     WITH data AS (
         SELECT
             [UUID]
@@ -63,41 +64,36 @@ def dbfrom(server, username, password, database, fromtb, totb, today):
         FROM [UCS_ReportDB].[dbo].[INS_Legal_Insurtech] s
         WHERE STATUS = 'N' AND DataDt = '{today}'
     )
-    SELECT * FROM data WHERE seq = 1
-    ORDER BY Casei
-    OFFSET 0 ROW FETCH NEXT 1 ROWS ONLY
+    SELECT CONVERT(NVARCHAR(200), CaseI), * FROM data WHERE seq = 1 AND CaseI IN %s
     """
-    cursor.execute(script)
-    c_src = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
-    return c_src
+    return WorkQueue(get_pool(server, username, password, database, charset='utf8'),
+                     'Data-Legal_Insur', candidates, fetch, batch_size=batch_size)
 
 
 def update(server, username, password, database, totb, Notes, Casei, Order_Num, Account_Name,
            Payment_Type, Product_List, Transfer_Bank, Transfer_Account, Payment_Deadline,
            Transfer_Fee, Legal_Type, Status, today):
     """Update case information in database"""
-    conn = pymssql.connect(server=server, user=username, password=password, database=database, charset='utf8')
-    cursor = conn.cursor()
-
     script = f"""
     UPDATE [{totb}]
-    SET Notes = '{Notes}',
-        Order_Num = '{Order_Num}',
-        Account_Name = '{Account_Name}',
-        Payment_Type = '{Payment_Type}',
-        Product_List = '{Product_List}',
-        Transfer_Bank = '{Transfer_Bank}',
-        Transfer_Account = '{Transfer_Account}',
-        Payment_Deadline = '{Payment_Deadline}',
-        Transfer_Fee = '{Transfer_Fee}',
-        Legal_Type = '{Legal_Type}',
-        Status = '{Status}'
-    WHERE casei = '{Casei}' AND DataDt = '{today}'
+    SET Notes = %(Notes)s,
+        Order_Num = %(Order_Num)s,
+        Account_Name = %(Account_Name)s,
+        Payment_Type = %(Payment_Type)s,
+        Product_List = %(Product_List)s,
+        Transfer_Bank = %(Transfer_Bank)s,
+        Transfer_Account = %(Transfer_Account)s,
+        Payment_Deadline = %(Payment_Deadline)s,
+        Transfer_Fee = %(Transfer_Fee)s,
+        Legal_Type = %(Legal_Type)s,
+        Status = %(Status)s
+    WHERE casei = %(Casei)s AND DataDt = %(today)s
     """
-    cursor.execute(script)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    params = {
+        'Notes': Notes, 'Order_Num': Order_Num, 'Account_Name': Account_Name,
+        'Payment_Type': Payment_Type, 'Product_List': Product_List,
+        'Transfer_Bank': Transfer_Bank, 'Transfer_Account': Transfer_Account,
+        'Payment_Deadline': Payment_Deadline, 'Transfer_Fee': Transfer_Fee,
+        'Legal_Type': Legal_Type, 'Status': Status, 'Casei': Casei, 'today': today,
+    }
+    run(get_pool(server, username, password, database, charset='utf8'), script, params)
@@ -24,7 +24,7 @@ from playwright.sync_api import sync_playwright
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import db, vars
-from etl_func import src_obs, dbfrom, update, foo
+from etl_func import work_queue, update, foo
 from common.logger import get_logger
 
 # 抑制 SSL 警告 (因為 insurtech.lia-roc.org.tw 憑證有問題)
@@ -111,6 +111,7 @@ AGREEMENT_HTML = """
 """
 
 
+@logger.trace('send_otp')
 def send_otp_email(email_addr):
     """發送OTP驗證碼到指定郵箱"""
     url = "https://insurtech.lia-roc.org.tw/lia-creditor-record-server/api/otp/send"
@@ -134,7 +135,7 @@ def send_otp_email(email_addr):
             response = requests.post(url, data=email_addr, headers=headers, verify=False)
             elapsed = time.time() - start_time
 
-            logger.log_response(response.status_code, dict(response.headers), response.text[:200], elapsed)
+            logger.log_response(response.status_code, response.headers, lambda r=response: r.text[:200], elapsed)
 
             if response.status_code == 200:
                 logger.info("OTP 發送成功")
@@ -165,6 +166,7 @@ def send_otp_email(email_addr):
     return False
 
 
+@logger.trace('email_code')
 def get_verification_code_from_email(email_addr, email_password, max_retries=10):
     """從Gmail抓取驗證碼"""
     verification_code = ''
@@ -226,6 +228,7 @@ def get_verification_code_from_email(email_addr, email_password, max_retries=10)
     return verification_code
 
 
+@logger.trace('verify_case')
 def verify_and_submit_case(verify_code, email, name, phone, debtor_ids, legal_num, legal_court):
     """驗證OTP並提交案件資料 (使用 crr901w/verify API)"""
     url = "https://insurtech.lia-roc.org.tw/lia-creditor-record-server/api/crr901w/verify"
@@ -270,7 +273,7 @@ def verify_and_submit_case(verify_code, email, name, phone, debtor_ids, legal_nu
         response = requests.post(url, json=payload, headers=headers, timeout=30, verify=False)
         elapsed = time.time() - start_time
 
-        logger.log_response(response.status_code, dict(response.headers), response.text[:300], elapsed)
+        logger.log_response(response.status_code, response.headers, lambda r=response: r.text[:300], elapsed)
 
         # 提取 Token
         token = None
@@ -313,6 +316,7 @@ def verify_and_submit_case(verify_code, email, name, phone, debtor_ids, legal_nu
         return None
 
 
+@logger.trace('payment_request')
 def submit_payment_request(token, case_uuid, name, phone, email, compiled, company, address, debtor_count):
     """提交付款請求 (使用 crr201w/payment API)"""
     url = "https://insurtech.lia-roc.org.tw/lia-creditor-record-server/api/crr201w/payment"
@@ -347,7 +351,7 @@ def submit_payment_request(token, case_uuid, name, phone, email, compiled, compa
         response = requests.post(url, json=payload, headers=headers, timeout=30, verify=False)
         elapsed = time.time() - start_time
 
-        logger.log_response(response.status_code, dict(response.headers), response.text[:300], elapsed)
+        logger.log_response(response.status_code, response.headers, lambda r=response: r.text[:300], elapsed)
 
         if response.status_code == 200:
             json_response = response.json()
@@ -391,6 +395,7 @@ def submit_payment_request(token, case_uuid, name, phone, email, compiled, compa
         return None
 
 
+@logger.trace('ecpay_payment')
 def process_ecpay_with_playwright(payment_data, case_id, file_date):
     """使用 Playwright 處理綠界金流 (步驟 5、6、7 合併)"""
     if not payment_data or not payment_data.get('formFields'):
@@ -585,6 +590,7 @@ def process_ecpay_with_playwright(payment_data, case_id, file_date):
     return None
 
 
+@logger.trace('render_receipt')
 def create_printable_html_from_response(html_content):
     """從ECPay HTML提取並建立可列印格式"""
 
@@ -735,6 +741,7 @@ def create_printable_html_from_response(html_content):
     return printable_html
 
 
+@logger.trace('smb_upload')
 def upload_to_smb(local_file_path, remote_file_name, file_date):
     """上傳檔案到 SMB 共享目錄"""
     try:
@@ -797,6 +804,7 @@ def upload_to_smb(local_file_path, remote_file_name, file_date):
         return None
 
 
+@logger.trace('atm_info')
 def get_atm_info_and_save(retain_result, case_id, file_date):
     """取得ATM付款資訊並儲存"""
     if not retain_result or not retain_result.get('atm_form_fields'):
@@ -910,6 +918,7 @@ def get_atm_info_and_save(retain_result, case_id, file_date):
         return None
 
 
+@logger.trace('case')
 def process_single_case(case_data, today, file_date):
     """處理單一案件"""
     Casei = str(case_data[3])
@@ -953,7 +962,8 @@ def process_single_case(case_data, today, file_date):
     # 步驟 2: 取得驗證碼
     logger.info("步驟 2: 取得驗證碼")
     logger.debug("等待 15 秒...")
-    time.sleep(15)
+    with logger.span('otp_wait'):
+        time.sleep(15)
     verify_code = get_verification_code_from_email(Mail, PSD)
     if not verify_code:
         return False
@@ -971,7 +981,8 @@ def process_single_case(case_data, today, file_date):
                 verify_fail_count += 1
                 continue
             logger.debug("等待 15 秒...")
-            time.sleep(15)
+            with logger.span('otp_wait'):
+                time.sleep(15)
             verify_code = get_verification_code_from_email(Mail, PSD)
             if not verify_code:
                 verify_fail_count += 1
@@ -1054,14 +1065,16 @@ def process_single_case(case_data, today, file_date):
     logger.ctx.set_operation("DB_update")
     logger.ctx.set_db(server=db['server'], database=db['database'], table=db['totb'], operation="UPDATE")
 
-    update(db['server'], db['username'], db['password'], db['database'], db['totb'],
-           '調閱成功', Casei, atm_info.get('MerchantTradeNo', ''),
-           '中華民國人壽保險商業同業公會', 'ATM 櫃員機', atm_info.get('ItemName', ''),
-           atm_info.get('BankCode', ''), atm_info.get('vAccount', ''),
-           atm_info.get('ExpireDate', ''), atm_info.get('TradeAmount', ''),
-           '保險查詢費', 'F', today)
+    db_start = time.perf_counter()
+    with logger.span('db_update', table=db['totb']):
+        update(db['server'], db['username'], db['password'], db['database'], db['totb'],
+               '調閱成功', Casei, atm_info.get('MerchantTradeNo', ''),
+               '中華民國人壽保險商業同業公會', 'ATM 櫃員機', atm_info.get('ItemName', ''),
+               atm_info.get('BankCode', ''), atm_info.get('vAccount', ''),
+               atm_info.get('ExpireDate', ''), atm_info.get('TradeAmount', ''),
+               '保險查詢費', 'F', today)
 
-    logger.log_db_operation("UPDATE", db['database'], db['totb'], 1)
+    logger.log_db_operation("UPDATE", db['database'], db['totb'], 1, time.perf_counter() - db_start)
     logger.info(f"案件 {Casei} 處理完成！")
     logger.increment('records_success')
     return True
@@ -1085,8 +1098,9 @@ def run():
     try:
         os.makedirs(f'./{file_date}', exist_ok=True)
 
-        obs = src_obs(db['server'], db['username'], db['password'], db['database'],
-                      db['fromtb'], db['totb'], today)
+        queue = work_queue(db['server'], db['username'], db['password'], db['database'],
+                           db['fromtb'], db['totb'], today)
+        obs = queue.refill()
 
         initial_obs = obs
         logger.info(f"待處理案件數: {obs}")
@@ -1096,35 +1110,23 @@ def run():
             logger.task_end(success=True)
             return True
 
-        while obs > 0:
-            try:
-                cases = dbfrom(db['server'], db['username'], db['password'],
-                              db['database'], db['fromtb'], db['totb'], today)
-
-                if not cases:
-                    logger.warning("查詢案件時返回空列表，重新檢查待處理數量")
-                    obs = src_obs(db['server'], db['username'], db['password'], db['database'],
-                                 db['fromtb'], db['totb'], today)
-                    continue
-
-                case_data = cases[0]
+        with queue:
+            for key, case_data in queue:
                 total_processed += 1
                 logger.log_progress(total_processed, initial_obs, f"case_{total_processed}")
 
-                if process_single_case(case_data, today, file_date):
-                    total_success += 1
-                else:
-                    total_failed += 1
-
-                obs = src_obs(db['server'], db['username'], db['password'], db['database'],
-                             db['fromtb'], db['totb'], today)
+                try:
+                    if process_single_case(case_data, today, file_date):
+                        total_success += 1
+                        queue.done(key)
+                    else:
+                        total_failed += 1
+                        queue.fail(key, "process_single_case returned False")
 
-            except Exception as e:
-                logger.log_exception(e, "處理案件時發生錯誤")
-                total_failed += 1
-                total_processed += 1
-                obs = src_obs(db['server'], db['username'], db['password'], db['database'],
-                             db['fromtb'], db['totb'], today)
+                except Exception as e:
+                    logger.log_exception(e, "處理案件時發生錯誤")
+                    total_failed += 1
+                    queue.fail(key, e)
 
         logger.log_stats({
             'initial_cases': initial_obs,
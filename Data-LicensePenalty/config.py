@@ -21,6 +21,16 @@ wbinfo = {
     'captchaImg': 'https://www.mvdis.gov.tw/m3-emv-vil/captchaImg.jpg',
 }
 
-pics = {
-    'imgp': r'./valcode.png'
+crawler = {
+    'concurrency': 3,       # 同時查詢數 (mvdis 站點上限)
+    'rate': 6.0,            # Max requests per second (per host，驗證碼 GET + 查詢 POST 合計)
+    'burst': 3,             # Allowed back-to-back requests
+    'daily_limit': 50000,   # 每日查詢上限
+    'ocr_workers': 0,       # OCR 子程序數，0 = 程序內辨識
+}
+
+captcha = {
+    # 驗證碼字元集與長度，依網站驗證碼調整
+    'charset': '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
+    'length': (4, 6),
 }
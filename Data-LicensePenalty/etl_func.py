@@ -2,7 +2,16 @@
 """
 ETL functions for LicensePenalty crawler
 """
-import pymssql
+import re
+import threading
+
+from bs4 import BeautifulSoup
+
+from common.captcha import solve
+from common.db import get_pool
+from common.http import new_session
+from common.query import run
+from common.schema import stale_predicate
 
 
 def foo(num, obs):
@@ -12,27 +21,24 @@ def foo(num, obs):
 
 
 def src_obs(server, username, password, database, totb1):
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
-    cursor = conn.cursor()
     script = f"""
     select (select count(*)
     from [dbo].[{totb1}]
     where (status is null) and birthday is not null )
     +
     (select count(*) from [{totb1}]
-    where (select DATEDIFF(mm, updatetime, getdate()))> = 3 and status <> 'Y' and birthday is not null)
+    where {stale_predicate('updatetime')} and status <> 'Y' and birthday is not null)
     """
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
 
 
 def dbfrom(server, username, password, database, totb1):
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
-    cursor = conn.cursor()
     script = f"""
+    if object_id('tempdb..#test') is not null drop table #test
+
     select *
     into #test
     from [dbo].[{totb1}] as a
@@ -40,87 +46,159 @@ def dbfrom(server, username, password, database, totb1):
     insert into #test
     select  *
     from [{totb1}]
-    where (select DATEDIFF(mm, updatetime, getdate()))> = 3 and status <> 'Y' and birthday is not null
+    where {stale_predicate('updatetime')} and status <> 'Y' and birthday is not null
 
     select * from #test
     order by entitytype desc
     """
-    cursor.execute(script)
-    c_src = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        c_src = cursor.fetchall()
     return c_src
 
 
-def updateSQL(server, username, password, database, totb1, status, updatetime, ID, driver_type, driver_status, DRvaliddate):
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
-    cursor = conn.cursor()
+def updateSQL(server, username, password, database, totb1, status, updatetime, ID, driver_type, driver_status, DRvaliddate,
+              writer=None):
+    """更新查詢結果 (指定 writer 時交由背景寫入)"""
     script = f"""
     update [dbo].[{totb1}]
-    set driver_type = '{driver_type}', driver_status = '{driver_status}', DRvaliddate = '{DRvaliddate}',status = '{status}', updatetime = '{updatetime}'
-    where ID = '{ID}'
+    set driver_type = %(driver_type)s, driver_status = %(driver_status)s, DRvaliddate = %(DRvaliddate)s,status = %(status)s, updatetime = %(updatetime)s
+    where ID = %(ID)s
     """
-    cursor.execute(script)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    params = {
+        'driver_type': driver_type, 'driver_status': driver_status, 'DRvaliddate': DRvaliddate,
+        'status': status, 'updatetime': updatetime, 'ID': ID,
+    }
+    if writer is not None:
+        writer.execute(script, params, tag=ID, table=totb1)
+    else:
+        run(get_pool(server, username, password, database), script, params)
 
 
 def exit_obs(server, username, password, database, totb1):
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
-    cursor = conn.cursor()
     script = f"""
     select count (distinct ID)
     from [{totb1}]
     where  updatetime > = convert(varchar(10),getdate(),111)
     """
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
 
 
-def capcha_resp(url, captchaImg, imgp, q, ID, birthday):
+CAPTCHA_ERROR = '驗證碼輸入錯誤'
+
+
+class LicenseLookup:
     """
-    url: Post URL
-    captchaImg: Captcha image URL
-    imgp: Local path to save captcha image
-    q: Iteration count for OCR retry
-    ID: ID field for POST form data
-    birthday: Birthday field for POST form data
+    駕照違規查詢 (可多執行緒同時使用)
+
+    每個執行緒重用自己的 session (common.http.new_session：重試與 mvdis 主機速率限制)；
+    驗證碼圖片只在記憶體中處理，
+    回應先以字串比對驗證碼錯誤，成功時才交給 parse_license 解析。
+
+    Usage:
+        set_rate(url, crawler['rate'], crawler['burst'])
+        lookup = LicenseLookup(url, captchaImg, profile=get_profile('mvdis', **captcha))
+        html = lookup.query(ID, birthday)
+        driver_type, driver_status, DRvaliddate, status = parse_license(html)
+        lookup.close()
     """
-    from bs4 import BeautifulSoup
-    import requests
-    import ddddocr
-
-    while q < 100:
-        session = requests.session()
-        respimg = session.get(captchaImg)
-        img = open(imgp, 'wb')
-        img.write(respimg.content)
-        img.close()
-
-        ocr = ddddocr.DdddOcr()
-        with open(imgp, 'rb') as f:
-            img_bytes = f.read()
-            res = ocr.classification(img_bytes)
-
-        data = {
-            'stage': 'natural',
-            'method': 'queryResult',
-            'uid': f'{ID}',
-            'birthday': f'{birthday}',
-            'validateStr': f'{res}',
-        }
-
-        resp = session.post(url, data=data)
-        soup = BeautifulSoup(resp.text, "lxml")
-
-        if soup.find_all('span', string='驗證碼輸入錯誤') and '200' not in resp:
+
+    def __init__(self, url, captcha_url, profile=None, max_attempts=100, timeout=30):
+        """
+        url: Post URL
+        captcha_url: Captcha image URL
+        profile: common.captcha.CaptchaProfile; impossible results are skipped without POSTing
+        max_attempts: Captcha attempts per ID
+        timeout: HTTP timeout in seconds
+        """
+        self.url = url
+        self.captcha_url = captcha_url
+        self.profile = profile
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self.stats = {'queries': 0, 'attempts': 0, 'captcha_errors': 0, 'rejected': 0}
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            # session 綁定單一執行緒，一條連線即可
+            session = self._local.session = new_session(pool_size=1)
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def query(self, ID, birthday):
+        """查詢單一 ID，回傳結果頁 HTML；驗證碼重試用盡時 raise RuntimeError"""
+        session = self._session()
+        self._count('queries')
+
+        for _ in range(self.max_attempts):
+            self._count('attempts')
+            img_bytes = session.get(self.captcha_url, timeout=self.timeout).content
+            res = solve(img_bytes, self.profile)
+            if self.profile is not None and not self.profile.accept(res):
+                self._count('rejected')
+                continue
+
+            data = {
+                'stage': 'natural',
+                'method': 'queryResult',
+                'uid': f'{ID}',
+                'birthday': f'{birthday}',
+                'validateStr': f'{res}',
+            }
+            html = session.post(self.url, data=data, timeout=self.timeout).text
+
+            captcha_error = CAPTCHA_ERROR in html
+            if self.profile is not None:
+                self.profile.report(not captcha_error, img_bytes, res)
+            if not captcha_error:
+                return html
+            self._count('captcha_errors')
+
+        raise RuntimeError(f"驗證碼重試 {self.max_attempts} 次仍失敗: ID={ID}")
+
+    def close(self):
+        """關閉所有 session"""
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
             session.close()
-            q += 1
-            print('驗證碼輸入錯誤')
+
+
+def parse_license(html):
+    """
+    解析結果頁
+
+    Returns:
+        (driver_type, driver_status, DRvaliddate, status)
+    """
+    soup = BeautifulSoup(html, "lxml")
+    driver_type, driver_status, DRvaliddate, status = '', '', '', 'N'
+
+    driver_info = soup.find(class_='tb_list_std')
+    if driver_info:
+        if len(driver_info) == 5:
+            driver_status = soup.find('tbody').find('td').text
         else:
-            session.close()
-            return soup
+            cells = driver_info.find_all('tr')[1].find_all('td')
+            driver_type = re.sub(r"\s+", "", cells[0].text)
+            driver_status = re.sub(r"\s+", "", cells[1].text)
+            DRvaliddate = re.sub(r"\s+", "", cells[2].text)
+            if '死亡' in driver_status:
+                status = 'Y'
+    else:
+        driver_status = '查無汽機車駕照'
+
+    return driver_type, driver_status, DRvaliddate, status
@@ -7,13 +7,20 @@ import os
 import sys
 import re
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 # Add parent directory to path for common module
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import *
 from etl_func import *
+from common.db import get_pool
+from common.http import set_rate
 from common.logger import get_logger
+from common.ocrpool import configure_ocr
+from common.captcha import get_profile
+from common.quota import DailyQuota
+from common.writer import BackgroundWriter
 
 # Initialize logger
 logger = get_logger('Data-LicensePenalty')
@@ -23,18 +30,28 @@ server, database, username, password, totb1 = (
     db['server'], db['database'], db['username'], db['password'], db['totb1']
 )
 url, captchaImg = wbinfo['url'], wbinfo['captchaImg']
-imgp = pics['imgp']
+
+
+def on_write_error(tag, error):
+    """背景寫入失敗回報"""
+    logger.log_db_error(error, "UPDATE")
+    logger.warning(f"背景寫入失敗: {tag}")
+    # 該筆已在排入佇列時計為成功，寫入失敗改計為失敗
+    logger.increment('records_success', -1)
+    logger.increment('records_failed')
 
 
 def run():
     """Main execution function"""
     logger.task_start("駕照違規查詢")
+    configure_ocr(crawler.get('ocr_workers', 0))
     logger.log_db_connect(server, database, username)
 
     total_processed = 0
     total_success = 0
     total_failed = 0
-    q = 0
+    writer = None
+    lookup = None
 
     try:
         # Get record count and source data
@@ -50,78 +67,87 @@ def run():
         total_records = len(src)
         logger.info(f"取得 {total_records} 筆資料")
 
-        for i in range(total_records):
-            logger.log_progress(i + 1, total_records, f"record_{i + 1}")
-
-            try:
-                ID = re.sub(r"\s+", "", src[i][3])
-                birthday = ('0' + re.sub(r"\s+", "", src[i][4]).replace('/', ''))[-7:]
-
-                logger.ctx.set_data(ID=ID)
-                logger.debug(f"處理: ID={ID}, birthday={birthday}")
-
-                # Get captcha and submit query
-                logger.ctx.set_operation("query_license")
-                start_time = time.time()
-
-                resp = capcha_resp(url, captchaImg, imgp, q, ID, birthday)
-                elapsed = time.time() - start_time
-                logger.debug(f"查詢完成 ({elapsed:.2f}s)")
+        quota = DailyQuota(
+            'Data-LicensePenalty', crawler['daily_limit'],
+            counter=lambda: exit_obs(server, username, password, database, totb1),
+        )
+        if quota.exhausted:
+            logger.warning(f"已達上限 ({quota.used})，結束處理")
+            logger.task_end(success=True)
+            return True
 
-                driver_info = resp.find(class_='tb_list_std')
-                driver_type, driver_status, DRvaliddate, status, updatetime = (
-                    '', '', '', 'N', time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-                )
+        writer = BackgroundWriter(get_pool(server, username, password, database),
+                                  name='Data-LicensePenalty', on_error=on_write_error, logger=logger)
+        quota.sync = writer.flush       # 對帳前先寫完佇列，DB 筆數才包含已處理的資料
+        set_rate(url, crawler['rate'], crawler.get('burst', 1))    # 驗證碼與查詢同一主機，共用速率
+        lookup = LicenseLookup(url, captchaImg, profile=get_profile('mvdis', **captcha))
+        concurrency = max(crawler['concurrency'], 1)
+        logger.info(f"同時查詢數: {concurrency}")
+
+        records = iter(src)
+        pending = {}
+        exhausted = False
+
+        def submit_next():
+            """送出下一筆，回傳是否還有資料"""
+            for row in records:
+                ID = re.sub(r"\s+", "", row[3])
+                birthday = ('0' + re.sub(r"\s+", "", row[4]).replace('/', ''))[-7:]
+                pending[executor.submit(lookup.query, ID, birthday)] = ID
+                return True
+            return False
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='license') as executor:
+            for _ in range(concurrency):
+                if not submit_next():
+                    break
 
-                # Parse result
-                logger.ctx.set_operation("parse_result")
-                if driver_info:
-                    if len(driver_info) == 5:
-                        driver_status = resp.find('tbody').find('td').text
-                        logger.debug(f"駕照狀態(簡): {driver_status}")
-                    else:
-                        driver_type = re.sub(r"\s+", "", driver_info.find_all('tr')[1].find_all('td')[0].text)
-                        driver_status = re.sub(r"\s+", "", driver_info.find_all('tr')[1].find_all('td')[1].text)
-                        DRvaliddate = re.sub(r"\s+", "", driver_info.find_all('tr')[1].find_all('td')[2].text)
-                        if '死亡' in driver_status:
-                            status = 'Y'
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ID = pending.pop(future)
+                    total_processed += 1
+                    logger.log_progress(total_processed, total_records, f"record_{total_processed}")
+                    logger.ctx.set_data(ID=ID)
+
+                    try:
+                        logger.ctx.set_operation("parse_result")
+                        driver_type, driver_status, DRvaliddate, status = parse_license(future.result())
                         logger.debug(f"駕照類型: {driver_type}, 狀態: {driver_status}, 有效期: {DRvaliddate}")
-                else:
-                    driver_status = '查無汽機車駕照'
-                    logger.debug("查無汽機車駕照")
 
-                updatetime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+                        updatetime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
 
-                # Update database
-                logger.ctx.set_operation("DB_update")
-                logger.ctx.set_db(server=server, database=database, table=totb1, operation="UPDATE")
+                        # Update database
+                        logger.ctx.set_operation("DB_update")
+                        logger.ctx.set_db(server=server, database=database, table=totb1, operation="UPDATE")
 
-                updateSQL(server, username, password, database, totb1, status, updatetime, ID, driver_type, driver_status, DRvaliddate)
-                logger.log_db_operation("UPDATE", database, totb1, 1)
-                logger.info(f"更新完成: ID={ID}, 類型={driver_type}, 狀態={driver_status}")
+                        updateSQL(server, username, password, database, totb1, status, updatetime, ID, driver_type, driver_status, DRvaliddate,
+                                  writer=writer)
+                        logger.log_db_operation("UPDATE", database, totb1, 1)    # 延遲由 writer 在實際寫入時記錄
+                        logger.info(f"更新完成: ID={ID}, 類型={driver_type}, 狀態={driver_status}")
 
-                total_success += 1
-                total_processed += 1
-                logger.increment('records_success')
+                        total_success += 1
+                        logger.increment('records_success')
 
-                # Check exit condition
-                ex_obs = exit_obs(server, username, password, database, totb1)
-                if ex_obs >= 50000:
-                    logger.warning(f"已達上限 ({ex_obs})，結束處理")
-                    break
+                    except Exception as e:
+                        logger.log_exception(e, f"處理記錄 ID={ID} 時發生錯誤")
+                        total_failed += 1
+                        logger.increment('records_failed')
 
-            except Exception as e:
-                logger.log_exception(e, f"處理記錄 {i + 1} 時發生錯誤")
-                total_failed += 1
-                total_processed += 1
-                logger.increment('records_failed')
-                continue
+                    if exhausted:
+                        continue        # 已達上限：進行中的查詢照常寫入，不再扣配額
+                    if quota.consume():
+                        submit_next()
+                    else:
+                        exhausted = True
+                        logger.warning(f"已達上限 ({quota.used})，不再送出新查詢，等待進行中的 {len(pending)} 筆完成")
 
         logger.log_stats({
             'total_records': total_records,
             'total_processed': total_processed,
             'total_success': total_success,
             'total_failed': total_failed,
+            'lookup': lookup.stats,
         })
 
         logger.task_end(success=(total_failed == 0))
@@ -132,6 +158,12 @@ def run():
         logger.task_end(success=False)
         return False
 
+    finally:
+        if lookup is not None:
+            lookup.close()
+        if writer is not None:
+            writer.close()
+
 
 def main():
     """Main entry point"""
@@ -19,3 +19,9 @@ wbinfo = {
 pics = {
     'imgp': r'./captcha_01.jpg',
 }
+
+captcha = {
+    # 驗證碼字元集與長度，依網站驗證碼調整
+    'charset': '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
+    'length': (4, 6),
+}
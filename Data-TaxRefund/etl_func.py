@@ -2,29 +2,25 @@
 """
 ETL functions for TaxRefund crawler
 """
-import pymssql
+from common.db import get_pool
+from common.query import run
 
 
 def fromsql(host, user, password, database, src_tb):
-    conn = pymssql.connect(host=host, user=user, password=password, database=database)
-    cursor = conn.cursor(as_dict=True)
     script = f"""select * from {src_tb} where info is null and type = 'ONHAND-20240801_01' order by pid"""
-    cursor.execute(script)
-    sql_src = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(host, user, password, database).cursor(as_dict=True) as cursor:
+        cursor.execute(script)
+        sql_src = cursor.fetchall()
     return sql_src
 
 
-def updatesql(host, user, password, database, tar_tb, info, psid, pid):
-    conn = pymssql.connect(host=host, user=user, password=password, database=database)
-    cursor = conn.cursor(as_dict=True)
-    script = f"""update {tar_tb} set info = '{info}' where psid = {psid} and pid = '{pid}'"""
-    print(script)
-    cursor.execute(script)
-    conn.commit()
-    cursor.close()
-    conn.close()
+def updatesql(host, user, password, database, tar_tb, info, psid, pid, writer=None):
+    script = f"""update {tar_tb} set info = %(info)s where psid = %(psid)s and pid = %(pid)s"""
+    params = {'info': info, 'psid': psid, 'pid': pid}
+    if writer is not None:
+        writer.execute(script, params, tag=(psid, pid), table=tar_tb)
+    else:
+        run(get_pool(host, user, password, database), script, params)
 
 
 def retry_generator(data_list):
@@ -7,7 +7,6 @@ import sys
 import time
 
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-import ddddocr
 from datetime import datetime as dt
 
 # Add parent directory to path for common module
@@ -15,7 +14,10 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import *
 from etl_func import *
+from common.db import get_pool
 from common.logger import get_logger
+from common.captcha import get_profile, solve
+from common.writer import BackgroundWriter
 
 # Initialize logger
 logger = get_logger('Data-TaxRefund')
@@ -27,11 +29,22 @@ url = wbinfo['url']
 imgp = pics['imgp']
 
 
+def on_write_error(tag, error):
+    """背景寫入失敗回報"""
+    logger.log_db_error(error, "UPDATE")
+    logger.warning(f"背景寫入失敗: {tag}")
+    # 該筆已在排入佇列時計為成功，寫入失敗改計為失敗
+    logger.increment('records_success', -1)
+    logger.increment('records_failed')
+
+
 def run_playwright():
     """Main Playwright execution function"""
     logger.task_start("稅務退稅查詢")
     logger.log_db_connect(server, database, username)
     logger.info(f"目標網址: {url}")
+    writer = BackgroundWriter(get_pool(server, username, password, database),
+                              name='Data-TaxRefund', on_error=on_write_error, logger=logger)
 
     total_processed = 0
     total_success = 0
@@ -63,6 +76,8 @@ def run_playwright():
             total_records = len(src) if hasattr(src, '__len__') else 0
             logger.info(f"待處理筆數: {total_records}")
 
+            profile = get_profile('etax', **captcha)
+
             for record, attempt in retry_generator(src):
                 psid = record['psid']
                 pid = record['pid']
@@ -92,9 +107,15 @@ def run_playwright():
 
                     # OCR recognition
                     logger.ctx.set_operation("ocr_captcha")
-                    ocr = ddddocr.DdddOcr(show_ad=False)
-                    res = ocr.classification(img_bytes)
-                    logger.log_captcha_attempt(attempt + 1, True, res)
+                    ocr_start = time.perf_counter()
+                    res = solve(img_bytes, profile)
+                    ocr_elapsed = time.perf_counter() - ocr_start
+                    if not profile.accept(res):
+                        # 長度 / 字元不可能正確，不送出直接換一張
+                        logger.log_captcha_attempt(attempt + 1, False, res, ocr_elapsed)
+                        page.reload()
+                        continue
+                    logger.log_captcha_attempt(attempt + 1, True, res, ocr_elapsed)
 
                     # Fill captcha
                     page.fill('#captchaText', res)
@@ -113,6 +134,7 @@ def run_playwright():
                     try:
                         confirm_btn = page.query_selector('ngb-modal-window div.jhi-dialog div button')
                         if confirm_btn:
+                            profile.report(False, img_bytes, res)
                             logger.warning("發現錯誤彈窗，點擊確定並重試...")
                             confirm_btn.click()
                             page.reload()
@@ -120,6 +142,8 @@ def run_playwright():
                     except Exception:
                         pass
 
+                    profile.report(True, img_bytes, res)
+
                     # Get result text
                     logger.ctx.set_operation("parse_result")
                     info = page.inner_text('#resultArea div table tbody tr td').replace('\n', '')
@@ -131,8 +155,8 @@ def run_playwright():
                     logger.ctx.set_operation("DB_update")
                     logger.ctx.set_db(server=server, database=database, table=tar_tb, operation="UPDATE")
 
-                    updatesql(server, username, password, database, tar_tb, info, psid, pid)
-                    logger.log_db_operation("UPDATE", database, tar_tb, 1)
+                    updatesql(server, username, password, database, tar_tb, info, psid, pid, writer=writer)
+                    logger.log_db_operation("UPDATE", database, tar_tb, 1)    # 延遲由 writer 在實際寫入時記錄
                     logger.info(f"資料更新完成 psid={psid}, pid={pid}")
 
                     total_success += 1
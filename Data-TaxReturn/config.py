@@ -21,4 +21,17 @@ APinfo = {
     'imgf2':'captcha2.jpg',
     'imgp1':r'C:\Py_Project\project\TaxReturn\TaxReturn01\picture\captcha1.jpg',
     'imgp2':r'C:\Py_Project\project\TaxReturn\TaxReturn01\picture\captcha2.jpg',
-}
\ No newline at end of file
+}
+
+crawler = {
+    'captcha_ttl': 60,      # 預取驗證碼可用秒數
+    'ocr_workers': 0,       # OCR 子程序數，0 = 程序內辨識
+    'rate': 2.0,            # Max requests per second (per host，驗證碼 + 查詢 + 結果頁合計)
+    'burst': 3,             # Allowed back-to-back requests
+}
+
+captcha = {
+    # 驗證碼字元集與長度，依網站驗證碼調整
+    'charset': '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
+    'length': (4, 6),
+}
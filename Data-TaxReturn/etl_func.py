@@ -1,36 +1,30 @@
+from common.db import get_pool
+from common.query import run
+
+
 def foo(num,obs):
     while num < obs:
         num = num + 1 
         yield num
         
 def src_obs(server,username,password,database,fromtb,totb,entitytype):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
     script = f"""
     select count(*) from [{fromtb}]
     where (status <> 'done' or status is null) and type = '{entitytype}'"""  
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
 
 def dbfrom(server,username,password,database,fromtb,totb,entitytype):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
-    
     script = f"""
     select * from [{fromtb}] where (status <> 'done' or status is null) and type = '{entitytype}'
     order by psid
     offset 0 row fetch next 1 rows only
     """
-    cursor.execute(script)
-    c_src = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        c_src = cursor.fetchall()
     return c_src
 
 def toSQL(docs, totb, server, database, username, password):
@@ -85,34 +79,32 @@ def EL03_etl(doc):
     })
     return EL03_result
 
-def updatesql(server,username,password,database,status,info,INQCode,Taxreturnchannel,Taxreturnplat,taxreturndate,taxOffice,taxOfficeAddr,taxOfficePhone,entitytype,psid,pid,insertdate):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
-    
-    script = f"""
+def updatesql(server,username,password,database,status,info,INQCode,Taxreturnchannel,Taxreturnplat,taxreturndate,taxOffice,taxOfficeAddr,taxOfficePhone,entitytype,psid,pid,insertdate,
+              writer=None):
+    script = """
     update taxreturntb 
-    set info = '{info}' ,status = '{status}', INQCode = '{INQCode}', Taxreturnchannel = '{Taxreturnchannel}',Taxreturnplat='{Taxreturnplat}',
-                taxreturndate='{taxreturndate}',taxOffice = '{taxOffice}',taxOfficeAddr = '{taxOfficeAddr}',taxOfficePhone = '{taxOfficePhone}',
-                insertdate='{insertdate}',lastupdate='{insertdate}'
-    WHERE type='{entitytype}' and psid = '{psid}' and pid = '{pid}';
+    set info = %(info)s ,status = %(status)s, INQCode = %(INQCode)s, Taxreturnchannel = %(Taxreturnchannel)s,Taxreturnplat=%(Taxreturnplat)s,
+                taxreturndate=%(taxreturndate)s,taxOffice = %(taxOffice)s,taxOfficeAddr = %(taxOfficeAddr)s,taxOfficePhone = %(taxOfficePhone)s,
+                insertdate=%(insertdate)s,lastupdate=%(insertdate)s
+    WHERE type=%(entitytype)s and psid = %(psid)s and pid = %(pid)s;
     """
-    cursor.execute(script)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    params = {
+        'info': info, 'status': status, 'INQCode': INQCode, 'Taxreturnchannel': Taxreturnchannel,
+        'Taxreturnplat': Taxreturnplat, 'taxreturndate': taxreturndate, 'taxOffice': taxOffice,
+        'taxOfficeAddr': taxOfficeAddr, 'taxOfficePhone': taxOfficePhone, 'insertdate': insertdate,
+        'entitytype': entitytype, 'psid': psid, 'pid': pid,
+    }
+    if writer is not None:
+        writer.execute(script, params, tag=(psid, pid), table='taxreturntb')
+    else:
+        run(get_pool(server, username, password, database), script, params)
     return script
 
 def check_obs(server,username,password,database,fromtb,totb,entitytype):
-    import pymssql
-    conn = pymssql.connect(server=server, user=username, password=password, database = database)
-    cursor = conn.cursor()
     script = f"""
     select count(*) from [{totb}]
     where type = '{entitytype}'"""    
-    cursor.execute(script)
-    obs = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        obs = cursor.fetchall()
     return list(obs[0])[0]
\ No newline at end of file
@@ -8,7 +8,6 @@ import re
 import gc
 import time
 import requests
-import ddddocr
 from bs4 import BeautifulSoup
 from datetime import datetime as dt
 
@@ -17,18 +16,42 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import *
 from etl_func import *
+from common.db import get_pool
 from common.logger import get_logger
+from common.ocrpool import configure_ocr
+from common.captcha import CaptchaPipeline, get_profile
+from common.http import new_session, set_rate
+from common.writer import BackgroundWriter
 
 # Initialize logger
 logger = get_logger('Data-TaxReturn')
 
+
+def on_write_error(tag, error):
+    """背景寫入失敗回報"""
+    logger.log_db_error(error, "UPDATE")
+    logger.warning(f"背景寫入失敗: {tag}")
+    # 該筆已在排入佇列時計為成功，寫入失敗改計為失敗
+    logger.increment('records_success', -1)
+    logger.increment('records_failed')
+
 # Disable SSL warnings
 requests.packages.urllib3.disable_warnings()
 
+captcha_url = 'https://svc.tax.nat.gov.tw/svc/ibxValidateCode'
+
+
+def fetch_captcha(session):
+    """取得驗證碼圖片 (於 CaptchaPipeline 背景執行緒呼叫)"""
+    resp = session.get(captcha_url, verify=False, timeout=30)
+    resp.raise_for_status()
+    return resp.content
+
 
 def run():
     """Main execution function"""
     logger.task_start("綜合所得稅申報查詢")
+    configure_ocr(crawler.get('ocr_workers', 0))
 
     server = db['server']
     database = db['database']
@@ -41,6 +64,14 @@ def run():
     Apurl = APinfo['Apurl']
 
     logger.log_db_connect(server, database, username)
+    writer = BackgroundWriter(get_pool(server, username, password, database),
+                              name='Data-TaxReturn', on_error=on_write_error, logger=logger)
+    # 驗證碼 GET、查詢 POST 與結果頁 GET 同一主機，以每秒請求數限制取代固定間隔
+    set_rate(captcha_url, crawler['rate'], crawler.get('burst', 1))
+    # 每個 session 同時只有一個請求 (驗證碼或查詢)，連線池保留 1 條即可
+    captchas = CaptchaPipeline('Data-TaxReturn', fetch_captcha,
+                               session_factory=lambda: new_session(pool_size=1, verify=False),
+                               ttl=crawler['captcha_ttl'], profile=get_profile('tax_ibx', **captcha))
 
     try:
         while True:
@@ -57,6 +88,7 @@ def run():
             for i in range(total_records):
                 logger.log_progress(i + 1, total_records, f"record_{i + 1}")
 
+                token = None
                 try:
                     record = src[i] if hasattr(src, '__getitem__') else src
                     psid = record[0]
@@ -67,26 +99,16 @@ def run():
                     logger.ctx.set_data(psid=psid, pid=pid)
                     logger.debug(f"處理: psid={psid}, pid={pid}")
 
-                    time.sleep(0.5)
-
-                    # 建立 OCR 與 session
-                    ocr = ddddocr.DdddOcr(show_ad=False)
-                    session = requests.Session()
-
-                    # Step 1：取得驗證碼圖片並辨識
+                    # Step 1：取得預先辨識的驗證碼 (與上一筆查詢重疊準備，綁定各自的 session)
                     logger.ctx.set_operation("get_captcha")
-                    captcha_url = 'https://svc.tax.nat.gov.tw/svc/ibxValidateCode'
-
-                    start_time = time.time()
-                    logger.log_request("GET", captcha_url, None, None)
-
-                    captcha = session.get(captcha_url, verify=False, timeout=30)
-                    elapsed = time.time() - start_time
-
-                    logger.log_response(captcha.status_code, dict(captcha.headers), f"[Image: {len(captcha.content)} bytes]", elapsed)
+                    captchas.mark_record()
+                    token = captchas.get(timeout=60)
+                    if token is None:
+                        raise TimeoutError("驗證碼取得逾時")
 
-                    code = ocr.classification(captcha.content)
-                    logger.log_captcha_attempt(1, True, code)
+                    session = token.session
+                    code = token.code
+                    logger.log_captcha_attempt(1, True, code, token.solve_seconds)
 
                     # Step 2：送出查詢
                     logger.ctx.set_operation("query_tax")
@@ -104,9 +126,10 @@ def run():
                     response = session.post(post_url, data=data, verify=False, timeout=30)
                     elapsed = time.time() - start_time
 
-                    logger.log_response(response.status_code, dict(response.headers), response.text[:200] if len(response.text) > 200 else response.text, elapsed)
+                    logger.log_response(response.status_code, response.headers, lambda r=response: r.text[:200], elapsed)
 
                     # Step 3：如查詢成功，取得結果頁
+                    token.report(response.status_code == 200 and '"code":0' in response.text)
                     if response.status_code == 200 and '"code":0' in response.text:
                         logger.info("驗證成功，前往結果頁...")
 
@@ -125,7 +148,7 @@ def run():
                         result_response = session.get(result_url, headers=headers, verify=False, timeout=30)
                         elapsed = time.time() - start_time
 
-                        logger.log_response(result_response.status_code, dict(result_response.headers), f"[HTML: {len(result_response.text)} chars]", elapsed)
+                        logger.log_response(result_response.status_code, result_response.headers, lambda r=result_response: f"[HTML: {len(r.text)} chars]", elapsed)
 
                         soup = BeautifulSoup(result_response.text, 'html.parser')
 
@@ -236,9 +259,9 @@ def run():
 
                     updatesql(server, username, password, database, status, info, INQCode, Taxreturnchannel,
                               Taxreturnplat, taxreturndate, taxOffice, taxOfficeAddr, taxOfficePhone,
-                              entitytype, psid, pid, insertdate)
+                              entitytype, psid, pid, insertdate, writer=writer)
 
-                    logger.log_db_operation("UPDATE", database, totb, 1)
+                    logger.log_db_operation("UPDATE", database, totb, 1)    # 延遲由 writer 在實際寫入時記錄
                     logger.info(f"更新完成: psid={psid}, INQCode={INQCode}")
                     logger.increment('records_success')
 
@@ -247,10 +270,14 @@ def run():
                     logger.increment('records_failed')
                     time.sleep(2)
                     continue
+                finally:
+                    if token is not None:
+                        token.close()
 
             # 完成一輪後重新檢查
             break
 
+        captchas.close()
         logger.log_stats({
             'total_processed': total_records,
         })
@@ -259,6 +286,7 @@ def run():
         return True
 
     except Exception as e:
+        captchas.close()
         logger.log_exception(e, "執行過程發生錯誤")
         logger.task_end(success=False)
         return False
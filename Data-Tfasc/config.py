@@ -20,6 +20,11 @@ wbinfo = {
     'estate_url': 'https://www.tfasc.com.tw/Product/BuzRealEstate/Detail',
 }
 
+# Crawler settings
+crawler = {
+    'cache_ttl': 24 * 3600,     # 詳細頁 / 公告文件快取秒數 (0 = 不快取)
+}
+
 # Document download settings
 doc_download = {
     'font_path': r"NotoSansTC-Regular.ttf",
@@ -6,8 +6,6 @@ import re
 import os
 import time
 import datetime
-import requests
-import pymssql
 import pyodbc
 import chardet
 import pandas
@@ -16,6 +14,10 @@ from bs4 import BeautifulSoup
 from fpdf import FPDF
 
 from config import db, wbinfo, doc_download
+from common.db import get_pool
+from common.bulk import bulk_insert_docs
+from common.query import fetch_value
+from common.http import get_session, make_retry
 
 
 # ============================================================
@@ -27,37 +29,24 @@ def toSQL(docs, table, server, database, username, password):
     with pyodbc.connect(conn_cmd) as cnxn:
         cnxn.autocommit = False
         with cnxn.cursor() as cursor:
-            data_keys = ','.join(docs[0].keys())
-            data_symbols = ','.join(['?' for _ in range(len(docs[0].keys()))])
-            insert_cmd = """INSERT INTO {} ({})
-            VALUES ({})""".format(table, data_keys, data_symbols)
-            data_values = [tuple(doc.values()) for doc in docs]
-            cursor.executemany(insert_cmd, data_values)
+            bulk_insert_docs(cursor, table, docs)
             cnxn.commit()
 
 
 def exist_number(number, session):
-    conn = pymssql.connect(server=db['server'], user=db['username'], password=db['password'], database=db['database'])
-    cursor = conn.cursor()
-    script = f"""
+    script = """
     select count(*) from tfasc_wbt_auction_tb
-    where number = '{number}' and session = '{session}'
+    where number = %(number)s and session = %(session)s
     """
-    cursor.execute(script)
-    counts = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return counts[0][0]
+    return fetch_value(get_pool(db['server'], db['username'], db['password'], db['database']),
+                       script, {'number': number, 'session': session}, default=0)
 
 
 def exist_auction():
-    conn = pymssql.connect(server=db['server'], user=db['username'], password=db['password'], database=db['database'])
-    cursor = conn.cursor()
     script = f"""select distinct auction_info_i from tfasc_auction_info_owner_tb"""
-    cursor.execute(script)
-    qry = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_pool(db['server'], db['username'], db['password'], db['database']).cursor() as cursor:
+        cursor.execute(script)
+        qry = cursor.fetchall()
 
     exist_number = []
     for i in range(len(qry)):
@@ -74,9 +63,6 @@ def dedup(data, dup_number_list, pkey):
 
 def dbfrom_doc_download(server, username, password, database, yesterday):
     """Get document list for download"""
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
-    cursor = conn.cursor()
-
     script = f"""
     select distinct
         auc.court + '_' + replace(convert(varchar(max), auc.number), '?', '') + '_' + auc.date + '.pdf' as a,
@@ -86,11 +72,9 @@ def dbfrom_doc_download(server, username, password, database, yesterday):
         on auc.referi = tf.rowid
     where auc.entrydate >= '{yesterday}'
     """
-    cursor.execute(script)
-    c_src = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
+        c_src = cursor.fetchall()
     return c_src
 
 
@@ -186,7 +170,8 @@ def http_get_bytes(url, timeout=None, retries=None):
     last_exc = None
     for i in range(retries + 1):
         try:
-            r = requests.get(
+            # 重試由本迴圈負責，session 不再重試 (避免次數相乘)
+            r = get_session('Data-Tfasc-doc', retries=make_retry(total=0)).get(
                 url,
                 headers={"User-Agent": "Mozilla/5.0"},
                 timeout=timeout,
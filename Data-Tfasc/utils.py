@@ -4,12 +4,18 @@ Utility functions for Tfasc crawler - Web parsing
 """
 import regex as re
 import traceback
-import requests
 import pandas
 from datetime import datetime
 from bs4 import BeautifulSoup
 
-from config import wbinfo
+from config import wbinfo, crawler
+from common.http import get_session
+from common.httpcache import get_cache
+
+
+def _static_session():
+    """詳細頁與公告文件內容不常變動，重跑時由回應快取取得"""
+    return get_session('Data-Tfasc-static', cache=get_cache('Data-Tfasc', crawler['cache_ttl']))
 
 
 def num_transformer(num):
@@ -31,7 +37,7 @@ def getSection():
         "qDateBegin": "",
     }
 
-    resp_json = requests.post(url, data=data).json()
+    resp_json = get_session('Data-Tfasc').post(url, data=data).json()
     docs = []
     for section in resp_json['Data']:
         docs.append({
@@ -60,7 +66,7 @@ def getBuzBidTime(data):
     }
 
     url = wbinfo['detail_url']
-    resp_json = requests.post(url, data=req_data).json()
+    resp_json = get_session('Data-Tfasc').post(url, data=req_data).json()
     docs = []
     for item in resp_json['Data']:
         if str(item['FileRoot']) != 'None':
@@ -107,7 +113,7 @@ def getEstate(doc, proxy=''):
         proxies = {'http': proxy, 'https': proxy}
     else:
         proxies = {}
-    resp = requests.get(doc['estate_url'], proxies=proxies)
+    resp = _static_session().get(doc['estate_url'], proxies=proxies)
     dom = BeautifulSoup(resp.text, 'lxml')
     if '財產所有人' in dom.select('.panel-heading span')[0].text:
         doc['owner'] = dom.select('.panel-heading span')[0].text.split('：')[-1].strip('（） │|\r')
@@ -264,7 +270,7 @@ def getOwner(raw_tb, regexp):
 
 
 def getBulletin(document, number):
-    resp = requests.get(document)
+    resp = _static_session().get(document)
     resp.encoding = 'big5'
     resp_text = resp.text
     content, doc_tb = resp_text.split('附表：')
@@ -5,9 +5,9 @@ ETL functions for HR-EMP employee data sync
 import time
 import logging
 import pymssql
-import requests
 
 from config import db, api, dataschema
+from common.http import get_session
 
 logger = logging.getLogger(__name__)
 
@@ -52,28 +52,6 @@ def safe_execute(cursor, sql, params=None, max_retry=5):
     raise Exception("SQL Deadlock retried too many times, abort.")
 
 
-def get_existing_employees(conn):
-    """取得現有員工資料"""
-    try:
-        cursor = conn.cursor()
-        cursor.execute('SELECT empi, name, cname, department, empstatus FROM emp')
-        employees = cursor.fetchall()
-        cursor.close()
-
-        emp_dict = {}
-        for emp in employees:
-            emp_dict[int(emp[0])] = {
-                'name': emp[1],
-                'cname': emp[2],
-                'department': emp[3],
-                'empstatus': emp[4]
-            }
-        return emp_dict
-    except Exception as e:
-        logger.error(f"Failed to get existing employees: {e}")
-        raise
-
-
 def login():
     """登入 API 系統"""
     data = {
@@ -91,7 +69,7 @@ def login():
     headers = {'Content-type': 'application/json'}
 
     try:
-        response = requests.post(api['system_url'], json=data, headers=headers, timeout=60)
+        response = get_session('HR-EMP').post(api['system_url'], json=data, headers=headers, timeout=60)
         response.raise_for_status()
         result = response.json()
         if result.get('Result'):
@@ -135,7 +113,7 @@ def fetch_employee_data(session_id):
     headers = {'Content-type': 'application/json'}
 
     try:
-        response = requests.post(api['business_url'], json=data, headers=headers, timeout=120)
+        response = get_session('HR-EMP').post(api['business_url'], json=data, headers=headers, timeout=120)
         response.raise_for_status()
         result = response.json()
         datatable = result.get('DataTable', [])
@@ -12,24 +12,71 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import *
 from etl_func import (
-    get_database_connection, safe_execute, get_existing_employees,
+    get_database_connection,
     login, fetch_employee_data, safe_str, get_empstatus, get_leftdate
 )
 from common.logger import get_logger
+from common.bulk import merge_upsert
 
 # Initialize logger
 logger = get_logger('HR-EMP')
 
 
-def process_employee_data(datatable, existing_employees):
-    """處理員工資料並更新資料庫"""
+EMP_COLUMNS = [
+    'empi', 'name', 'cname', 'department', 'costcenter',
+    'empstatus', 'JOBLEVELNAME', 'leftdate', 'Company', 'INS_DAT',
+    'BIRTHDATE', 'jobname', 'ext', 'ID', 'lastupdate',
+]
+
+
+def process_employee_data(datatable):
+    """處理員工資料並以暫存表 + MERGE 一次更新資料庫"""
     if not datatable:
         logger.warning("No employee data to process")
         return 0, 0, 0
 
-    insert_count = 0
-    update_count = 0
     error_count = 0
+    rows = []
+
+    now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    total_records = len(datatable)
+
+    logger.ctx.set_operation("normalize_employee")
+    for idx, raw in enumerate(datatable, 1):
+        try:
+            logger.log_progress(idx, total_records, f"employee_{idx}")
+
+            # 正規化鍵名 -> 全大寫
+            employee_data = {(k.upper() if isinstance(k, str) else k): v for k, v in raw.items()}
+
+            emp_id = int(employee_data.get('SYS_VIEWID'))
+            name = safe_str(employee_data.get('SYS_ENGNAME'))
+            cname = safe_str(employee_data.get('SYS_NAME'))
+            department = safe_str(employee_data.get('TMP_DEPARTNAME'))
+            costcenter = safe_str(employee_data.get('TMP_PROFITID'))
+            joblevel = safe_str(employee_data.get('TMP_LEVELNAME'))
+            company = safe_str(employee_data.get('TMP_DECCOMPANYNAME'))
+            ins_dat = safe_str(employee_data.get('STARTDATE'))
+            birthdate = safe_str(employee_data.get('BIRTHDATE'))
+            jobname = safe_str(employee_data.get('TMP_DUTYNAME'))
+            ext = safe_str(employee_data.get('OFFICETEL1'))
+            idno = safe_str(employee_data.get('IDNO'))
+
+            raw_status = employee_data.get('JOBSTATUS') or employee_data.get('JOBSTATUS'.upper())
+            empstatus = get_empstatus(raw_status)
+            leftdate = get_leftdate(empstatus, employee_data)
+
+            rows.append((
+                emp_id, name, cname, department, costcenter,
+                empstatus, joblevel, leftdate, company, ins_dat,
+                birthdate, jobname, ext, idno, now_str
+            ))
+
+        except Exception as e:
+            error_count += 1
+            logger.increment('records_failed')
+            logger.warning(f"Error processing employee {raw.get('SYS_VIEWID', 'unknown')}: {e}")
+            continue
 
     conn = None
     cursor = None
@@ -37,81 +84,16 @@ def process_employee_data(datatable, existing_employees):
         conn = get_database_connection()
         cursor = conn.cursor()
 
-        update_sql = """
-            UPDATE emp
-            SET [name]=%s, [cname]=%s, [department]=%s, [lastupdate]=%s,
-                [costcenter]=%s, [empstatus]=%s, [JOBLEVELNAME]=%s,
-                [leftdate]=%s, [Company]=%s, [INS_DAT]=%s, [BIRTHDATE]=%s,
-                [jobname]=%s, [ext]=%s, [ID]=%s
-            WHERE [empi]=%s
-        """
-
-        insert_sql = """
-            INSERT INTO emp (
-              [empi], [name], [cname], [department], [costcenter],
-              [empstatus], [JOBLEVELNAME], [leftdate], [Company], [INS_DAT],
-              [BIRTHDATE], [jobname], [ext], [ID], [lastupdate]
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-
-        now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        total_records = len(datatable)
-
-        for idx, raw in enumerate(datatable, 1):
-            try:
-                logger.log_progress(idx, total_records, f"employee_{idx}")
-
-                # 正規化鍵名 -> 全大寫
-                employee_data = {(k.upper() if isinstance(k, str) else k): v for k, v in raw.items()}
-
-                emp_id = int(employee_data.get('SYS_VIEWID'))
-                name = safe_str(employee_data.get('SYS_ENGNAME'))
-                cname = safe_str(employee_data.get('SYS_NAME'))
-                department = safe_str(employee_data.get('TMP_DEPARTNAME'))
-                costcenter = safe_str(employee_data.get('TMP_PROFITID'))
-                joblevel = safe_str(employee_data.get('TMP_LEVELNAME'))
-                company = safe_str(employee_data.get('TMP_DECCOMPANYNAME'))
-                ins_dat = safe_str(employee_data.get('STARTDATE'))
-                birthdate = safe_str(employee_data.get('BIRTHDATE'))
-                jobname = safe_str(employee_data.get('TMP_DUTYNAME'))
-                ext = safe_str(employee_data.get('OFFICETEL1'))
-                idno = safe_str(employee_data.get('IDNO'))
-
-                raw_status = employee_data.get('JOBSTATUS') or employee_data.get('JOBSTATUS'.upper())
-                empstatus = get_empstatus(raw_status)
-                leftdate = get_leftdate(empstatus, employee_data)
-
-                logger.ctx.set_data(emp_id=emp_id, cname=cname)
-
-                if emp_id in existing_employees:
-                    logger.ctx.set_operation("update_employee")
-                    params = (
-                        name, cname, department, now_str,
-                        costcenter, empstatus, joblevel,
-                        leftdate, company, ins_dat, birthdate,
-                        jobname, ext, idno, emp_id
-                    )
-                    safe_execute(cursor, update_sql, params)
-                    update_count += 1
-                    logger.increment('records_updated')
-                else:
-                    logger.ctx.set_operation("insert_employee")
-                    params = (
-                        emp_id, name, cname, department, costcenter,
-                        empstatus, joblevel, leftdate, company, ins_dat,
-                        birthdate, jobname, ext, idno, now_str
-                    )
-                    safe_execute(cursor, insert_sql, params)
-                    insert_count += 1
-                    logger.increment('records_inserted')
-
-            except Exception as e:
-                error_count += 1
-                logger.increment('records_failed')
-                logger.warning(f"Error processing employee {raw.get('SYS_VIEWID', 'unknown')}: {e}")
-                continue
-
+        logger.ctx.set_operation("merge_employee")
+        logger.ctx.set_db(server=db['server'], database=db['database'], table='emp', operation="MERGE")
+        insert_count, update_count = merge_upsert(
+            cursor, 'emp', rows, EMP_COLUMNS, key_columns=['empi'], deadlock_retries=5
+        )
         conn.commit()
+
+        logger.increment('records_inserted', insert_count)
+        logger.increment('records_updated', update_count)
+        logger.log_db_operation("MERGE", db['database'], 'emp', insert_count + update_count)
         logger.info(f'員工資料處理完成 - 總筆數: {update_count + insert_count}, 更新: {update_count}, 新增: {insert_count}, 錯誤: {error_count}')
 
         return insert_count, update_count, error_count
@@ -146,14 +128,7 @@ def run():
 
         logger.info("API 登入成功")
 
-        # 2. 取得現有員工資料
-        logger.ctx.set_operation("get_existing_employees")
-        conn = get_database_connection()
-        existing_employees = get_existing_employees(conn)
-        conn.close()
-        logger.info(f"現有員工數: {len(existing_employees)}")
-
-        # 3. 從 API 取得員工資料
+        # 2. 從 API 取得員工資料
         logger.ctx.set_operation("fetch_employee_data")
         datatable = fetch_employee_data(session_id)
         if not datatable:
@@ -163,13 +138,12 @@ def run():
 
         logger.info(f"從 API 取得員工資料: {len(datatable)} 筆")
 
-        # 4. 處理並更新資料庫
+        # 3. 處理並更新資料庫
         logger.ctx.set_operation("process_employee_data")
-        insert_count, update_count, error_count = process_employee_data(datatable, existing_employees)
+        insert_count, update_count, error_count = process_employee_data(datatable)
 
         logger.log_stats({
             'total_from_api': len(datatable),
-            'existing_employees': len(existing_employees),
             'inserted': insert_count,
             'updated': update_count,
             'errors': error_count,
@@ -3,34 +3,50 @@
 ETL functions for HR-EMP_Clockin - Employee clock-in records sync
 """
 import json
-import requests
-import pymssql
 
 from config import db, api
+from common.db import get_pool
+from common.bulk import bulk_insert_docs
+from common.http import get_session
 
 
-def delete_records(server, username, password, database, totb):
-    """Delete all records from table"""
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
-    cursor = conn.cursor()
-    script = f"DELETE FROM [{totb}]"
-    cursor.execute(script)
-    conn.commit()
-    cursor.close()
-    conn.close()
+def replace_records(docs, totb, server, database, username, password, chunk=500):
+    """
+    清空資料表並寫入今日資料 (DELETE 與寫入在同一交易)
 
+    每段先以 savepoint 批次寫入，失敗時回到 savepoint 逐筆重試，只略過有問題的那幾筆；
+    死鎖、斷線等讓交易失效的錯誤則整個 rollback，保留原本的資料。
 
-def toSQL(docs, totb, server, database, username, password):
-    """Insert records to SQL Server"""
-    with pymssql.connect(server=server, user=username, password=password, database=database) as cnxn:
+    Returns:
+        (寫入筆數, [(doc, error), ...] 失敗的資料)
+    """
+    inserted = 0
+    failed = []
+    with get_pool(server, username, password, database).connection() as cnxn:
         cnxn.autocommit(False)
         with cnxn.cursor() as cursor:
-            data_keys = ','.join(docs[0].keys())
-            data_symbols = ','.join(['%s' for _ in range(len(docs[0].keys()))])
-            insert_cmd = f"INSERT INTO {totb} ({data_keys}) VALUES ({data_symbols})"
-            data_values = [tuple(doc.values()) for doc in docs]
-            cursor.executemany(insert_cmd, data_values)
+            cursor.execute(f"DELETE FROM [{totb}]")
+            for i in range(0, len(docs), chunk):
+                part = docs[i:i + chunk]
+                cursor.execute("SAVE TRANSACTION clockin_chunk")
+                try:
+                    inserted += bulk_insert_docs(cursor, totb, part)
+                    continue
+                except Exception:
+                    cursor.execute("ROLLBACK TRANSACTION clockin_chunk")
+                for doc in part:
+                    cursor.execute("SAVE TRANSACTION clockin_row")
+                    try:
+                        inserted += bulk_insert_docs(cursor, totb, [doc])
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TRANSACTION clockin_row")
+                        failed.append((doc, e))
+            if docs and not inserted:
+                # 全部失敗時不清空資料表
+                cnxn.rollback()
+                raise RuntimeError(f"{len(docs)} 筆全部寫入失敗，保留原資料: {failed[0][1]}")
             cnxn.commit()
+    return inserted, failed
 
 
 def clockin_records_etl(doc):
@@ -155,7 +171,7 @@ def login():
         }
     }
     data_json = json.dumps(data)
-    response = requests.post(api['main_url'], data=data_json, headers=headers)
+    response = get_session('HR-EMP_Clockin').post(api['main_url'], data=data_json, headers=headers)
     result = response.json()
 
     if result.get('Result'):
@@ -198,6 +214,6 @@ def fetch_clockin_data(session_id, getdate):
         }
     }
     data_json = json.dumps(data)
-    response = requests.post(api['api_url'], data=data_json, headers=headers)
+    response = get_session('HR-EMP_Clockin').post(api['api_url'], data=data_json, headers=headers)
     result = response.json()
     return result.get('DataSet', {}).get('ReportBody', [])
@@ -11,7 +11,7 @@ import datetime
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import *
-from etl_func import delete_records, toSQL, clockin_records_etl, login, fetch_clockin_data
+from etl_func import replace_records, clockin_records_etl, login, fetch_clockin_data
 from common.logger import get_logger
 
 # Initialize logger
@@ -47,18 +47,17 @@ def run():
 
         logger.info("API 登入成功")
 
-        # Delete existing records
-        logger.ctx.set_operation("delete_records")
-        logger.ctx.set_db(server=server, database=database, table=totb, operation="DELETE")
-        delete_records(server, username, password, database, totb)
-        logger.log_db_operation("DELETE", database, totb, 0)
-
         # Fetch clock-in data
         logger.ctx.set_operation("fetch_clockin_data")
         data = fetch_clockin_data(session_id, getdate)
         logger.info(f"取得打卡資料: {len(data)} 筆")
 
         if not data:
+            # 與原本相同：沒有資料時仍清空資料表
+            logger.ctx.set_operation("delete_records")
+            logger.ctx.set_db(server=server, database=database, table=totb, operation="DELETE")
+            replace_records([], totb, server, database, username, password)
+            logger.log_db_operation("DELETE", database, totb, 0)
             logger.info("沒有打卡資料需要同步")
             logger.task_end(success=True)
             return True
@@ -67,6 +66,7 @@ def run():
         logger.ctx.set_operation("process_records")
         logger.ctx.set_db(server=server, database=database, table=totb, operation="INSERT")
 
+        clockin_rows = []
         for i in range(len(data)):
             total_processed += 1
             logger.log_progress(total_processed, len(data), f"record_{total_processed}")
@@ -179,10 +179,7 @@ def run():
                     update_date
                 )
 
-                clockin_result = clockin_records_etl(docs)
-                toSQL(clockin_result, totb, server, database, username, password)
-                total_success += 1
-                logger.increment('records_success')
+                clockin_rows.extend(clockin_records_etl(docs))
 
             except Exception as e:
                 total_failed += 1
@@ -190,6 +187,22 @@ def run():
                 logger.warning(f"處理記錄 {i+1} 時發生錯誤: {e}")
                 continue
 
+        # 清空並批次寫入 (同一交易，失敗時保留原資料)
+        if clockin_rows:
+            logger.ctx.set_operation("replace_records")
+            try:
+                total_success, failed_rows = replace_records(clockin_rows, totb, server, database, username, password)
+                logger.increment('records_success', total_success)
+                for doc, e in failed_rows:
+                    logger.warning(f"寫入失敗 SYS_ROWID={doc.get('SYS_ROWID')}: {e}")
+                total_failed += len(failed_rows)
+                logger.increment('records_failed', len(failed_rows))
+            except Exception as e:
+                logger.log_db_error(e, "INSERT")
+                logger.warning("寫入失敗，已 rollback，資料表保留原資料")
+                total_failed += len(clockin_rows)
+                logger.increment('records_failed', len(clockin_rows))
+
         logger.log_db_operation("INSERT", database, totb, total_success)
 
         logger.log_stats({
@@ -5,9 +5,9 @@ ETL functions for HR-EMP_Salary - Employee salary data sync
 import time
 import logging
 import pymssql
-import requests
 
 from config import db, api
+from common.http import get_session
 
 logger = logging.getLogger(__name__)
 
@@ -79,7 +79,7 @@ def login():
     headers = {"Content-type": "application/json"}
 
     try:
-        resp = requests.post(api['sys_url'], json=payload, headers=headers, timeout=60)
+        resp = get_session('HR-Emp_Salary').post(api['sys_url'], json=payload, headers=headers, timeout=60)
         resp.raise_for_status()
         result = resp.json()
         if result.get("Result"):
@@ -111,7 +111,7 @@ def fetch_salary_data(session_id):
     headers = {"Content-type": "application/json"}
 
     try:
-        resp = requests.post(api['biz_url'], json=payload, headers=headers, timeout=120)
+        resp = get_session('HR-Emp_Salary').post(api['biz_url'], json=payload, headers=headers, timeout=120)
         resp.raise_for_status()
         result = resp.json()
         salary_rows = (result.get("DataSet", {}) or {}).get("ReportBody", []) or []
@@ -12,43 +12,32 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import *
 from etl_func import (
-    safe_execute, get_db_connection, get_existing_emp_ids,
+    get_db_connection,
     login, fetch_salary_data
 )
 from common.logger import get_logger
+from common.bulk import merge_upsert
 
 # Initialize logger
 logger = get_logger('HR-Emp_Salary')
 
 
+SALARY_COLUMNS = ['empi', 'name', 'cname', 'department', 'costcenter', 'BaseSalary', 'lastupdate']
+
+
 def process_salary_data(salary_rows, cursor, conn):
-    """Process salary data and update database"""
+    """Process salary data and apply it with a single staged MERGE"""
     if not salary_rows:
         logger.warning("沒有可處理的薪資資料")
         return 0, 0, 0
 
-    update_sql = """
-        UPDATE emp
-        SET [BaseSalary]=%s, [lastupdate]=%s
-        WHERE [empi]=%s
-    """
-    insert_sql = """
-        INSERT INTO emp (
-            [empi], [name], [cname], [department], [costcenter],
-            [BaseSalary], [lastupdate]
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-    """
-
     now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    insert_count = 0
-    update_count = 0
     error_count = 0
     total_records = len(salary_rows)
+    rows = []
 
     try:
-        existed = get_existing_emp_ids(cursor)
-        logger.info(f"現有員工數: {len(existed)}")
-
+        logger.ctx.set_operation("normalize_salary")
         for idx, r in enumerate(salary_rows, 1):
             logger.log_progress(idx, total_records, f"salary_{idx}")
 
@@ -66,27 +55,25 @@ def process_salary_data(salary_rows, cursor, conn):
                 dept = row.get("TMP_DEPARTNAME") or None
                 costcenter = row.get("TMP_PROFITID") or None
 
-                logger.ctx.set_data(empi=empi, cname=cname)
-
-                if empi in existed:
-                    logger.ctx.set_operation("update_salary")
-                    params = (salary, now_str, empi)
-                    safe_execute(cursor, update_sql, params)
-                    update_count += 1
-                    logger.increment('records_updated')
-                else:
-                    logger.ctx.set_operation("insert_salary")
-                    params = (empi, engname, cname, dept, costcenter, salary, now_str)
-                    safe_execute(cursor, insert_sql, params)
-                    insert_count += 1
-                    logger.increment('records_inserted')
+                rows.append((empi, engname, cname, dept, costcenter, salary, now_str))
 
             except Exception as e:
                 error_count += 1
                 logger.increment('records_failed')
                 logger.warning(f"處理 EMPLOYEEID={r.get('EMPLOYEEID')} 發生錯誤: {e}")
 
+        # 已存在只更新薪資與時間，不存在則新增完整欄位
+        logger.ctx.set_operation("merge_salary")
+        logger.ctx.set_db(server=db['server'], database=db['database'], table='emp', operation="MERGE")
+        insert_count, update_count = merge_upsert(
+            cursor, 'emp', rows, SALARY_COLUMNS, key_columns=['empi'],
+            update_columns=['BaseSalary', 'lastupdate'], deadlock_retries=5
+        )
         conn.commit()
+
+        logger.increment('records_inserted', insert_count)
+        logger.increment('records_updated', update_count)
+        logger.log_db_operation("MERGE", db['database'], 'emp', insert_count + update_count)
         logger.info(f"薪資資料處理完成 - 總筆數: {insert_count + update_count}, 更新: {update_count}, 新增: {insert_count}, 錯誤: {error_count}")
 
         return insert_count, update_count, error_count
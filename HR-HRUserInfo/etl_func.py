@@ -3,26 +3,22 @@
 ETL functions for HR-HRUserInfo - User info sync from HR API
 """
 import json
-import requests
-import pymssql
 
 from config import api, USER_FIELDS
+from common.db import get_pool
+from common.http import get_session
 
 
 def delete_records(server, username, password, database, totb):
     """Delete all records from table"""
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
-    cursor = conn.cursor()
     script = f"DELETE FROM [{totb}]"
-    cursor.execute(script)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with get_pool(server, username, password, database).cursor() as cursor:
+        cursor.execute(script)
 
 
 def toSQL(docs, totb, server, database, username, password):
     """Insert records to SQL Server"""
-    with pymssql.connect(server=server, user=username, password=password, database=database) as conn:
+    with get_pool(server, username, password, database).connection() as conn:
         conn.autocommit(False)
         with conn.cursor() as cursor:
             data_keys = ','.join(docs[0].keys())
@@ -53,7 +49,7 @@ def login():
         }
     }
     data_json = json.dumps(data)
-    response = requests.post(api['main_url'], data=data_json, headers=headers, verify=False)
+    response = get_session('HR-HRUserInfo').post(api['main_url'], data=data_json, headers=headers, verify=False)
     result = response.json()
 
     if result.get('Result'):
@@ -80,6 +76,6 @@ def fetch_userinfo_data(session_id):
         }
     }
     data_json = json.dumps(data)
-    response = requests.post(api['api_url'], data=data_json, headers=headers, verify=False)
+    response = get_session('HR-HRUserInfo').post(api['api_url'], data=data_json, headers=headers, verify=False)
     result = response.json()
     return result.get('DataSet', {}).get('ReportBody', [])
@@ -8,10 +8,10 @@ from datetime import datetime
 from email.mime.text import MIMEText
 from email.header import Header
 
-import requests
 import pandas as pd
 
 from config import api, mail, SALARY_THRESHOLD, WORKING_MONTHS_HIGH_SALARY, WORKING_MONTHS_LOW_SALARY
+from common.http import get_session
 
 
 def login():
@@ -29,7 +29,7 @@ def login():
         }
     }
     data_json = json.dumps(data)
-    response = requests.post(api['main_url'], data=data_json, headers=headers)
+    response = get_session('HR-Insur_Amount').post(api['main_url'], data=data_json, headers=headers)
     result = response.json()
 
     if result.get('Result'):
@@ -60,7 +60,7 @@ def fetch_insurance_records(session_id):
         }
     }
     data_json = json.dumps(data)
-    response = requests.post(api['api_url'], data=data_json, headers=headers)
+    response = get_session('HR-Insur_Amount').post(api['api_url'], data=data_json, headers=headers)
     result = response.json()
     print(result)
     return result.get('DataTable', [])
@@ -79,7 +79,7 @@ def get_insurance_amount(session_id, sys_id):
         }
     }
     data_json = json.dumps(data)
-    response = requests.post(api['api_url'], data=data_json, headers=headers)
+    response = get_session('HR-Insur_Amount').post(api['api_url'], data=data_json, headers=headers)
     result = response.json()
 
     target = next(
@@ -143,7 +143,7 @@ def fetch_employee_data(session_id):
         }
     }
     data_json = json.dumps(data)
-    response = requests.post(api['api_url'], data=data_json, headers=headers)
+    response = get_session('HR-Insur_Amount').post(api['api_url'], data=data_json, headers=headers)
     result = response.json()
     return result.get('DataSet', {}).get('ReportBody', [])
 
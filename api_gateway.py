@@ -11,6 +11,7 @@ API 文件:
 """
 from fastapi import FastAPI, BackgroundTasks, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import subprocess
@@ -20,6 +21,8 @@ import os
 from datetime import datetime
 from pathlib import Path
 
+from common.metrics import METRICS_ENV, merge_prometheus
+
 # 建立 FastAPI 應用
 app = FastAPI(
     title="Crawlab API Gateway",
@@ -42,6 +45,9 @@ tasks: Dict[str, dict] = {}
 # 專案根目錄
 BASE_PATH = Path(__file__).parent
 
+# 爬蟲 task_end 輸出的指標檔 (common.metrics)
+METRICS_PATH = Path(os.environ.get(METRICS_ENV) or BASE_PATH / "data" / "metrics")
+
 
 # === 資料模型 ===
 
@@ -259,6 +265,33 @@ async def get_module_logs(module: str, lines: int = 100):
         raise HTTPException(status_code=500, detail=f"讀取 Log 失敗: {str(e)}")
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus 指標 (所有模組最近一次執行的延遲直方圖與吞吐量)
+    """
+    texts = [f.read_text(encoding="utf-8") for f in sorted(METRICS_PATH.glob("*.prom"))]
+    return PlainTextResponse(merge_prometheus(texts), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/v1/metrics/{module}")
+async def get_module_metrics(module: str):
+    """
+    取得模組最近一次執行的指標摘要 (HTTP / 資料庫 / OCR 延遲百分位數與 records/s)
+
+    - **module**: 模組名稱
+    """
+    metrics_file = METRICS_PATH / f"{module}.json"
+
+    if not metrics_file.exists():
+        raise HTTPException(status_code=404, detail="指標檔案不存在")
+
+    try:
+        return json.loads(metrics_file.read_text(encoding="utf-8"))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"讀取指標失敗: {str(e)}")
+
+
 # === 背景任務 ===
 
 async def run_crawler_task(task_id: str, module: str, callback_url: str = None):
@@ -282,7 +315,10 @@ async def run_crawler_task(task_id: str, module: str, callback_url: str = None):
             capture_output=True,
             text=True,
             timeout=3600,  # 1 小時超時
-            cwd=str(BASE_PATH)
+            cwd=str(BASE_PATH),
+            env={**os.environ,
+                 'CRAWLAB_LOG_ASYNC': '1',                 # stdout 為 pipe，Log 改由背景執行緒寫入
+                 METRICS_ENV: str(METRICS_PATH)}           # 指標輸出到 /metrics 讀取的目錄
         )
 
         end_time = datetime.now()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: common.bulk.bulk_insert vs row-by-row executemany
+以 SQLite 記憶體資料庫模擬 SQL Server，每次 execute 加上固定延遲模擬網路 round trip
+
+pymssql 的 executemany 實際上是逐筆 execute，因此 baseline 以逐筆 execute 模擬。
+
+Usage:
+    python bench_bulk_insert.py
+    python bench_bulk_insert.py --rows 20000 --rtt-ms 1.0 --cols 8
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common.bulk import bulk_insert, chunk_rows
+
+# SQLite 舊版單一語句參數上限為 999
+SQLITE_MAX_PARAMS = 999
+
+
+class LatencyCursor:
+    """包裝 sqlite3 cursor，每次 execute 加上 round trip 延遲"""
+
+    def __init__(self, cursor, rtt: float):
+        self._cursor = cursor
+        self._rtt = rtt
+        self.round_trips = 0
+
+    def execute(self, sql, params=()):
+        self.round_trips += 1
+        if self._rtt:
+            time.sleep(self._rtt)
+        return self._cursor.execute(sql, params)
+
+    def executemany(self, sql, rows):
+        # 與 pymssql 相同：逐筆送出
+        for row in rows:
+            self.execute(sql, row)
+
+
+def make_rows(n_rows: int, n_cols: int):
+    return [tuple(f"r{i}_c{j}" for j in range(n_cols)) for i in range(n_rows)]
+
+
+def run_case(name, rows, columns, rtt, loader):
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"CREATE TABLE t ({', '.join(c + ' TEXT' for c in columns)})")
+    cursor = LatencyCursor(conn.cursor(), rtt)
+
+    start = time.perf_counter()
+    loader(cursor, rows, columns)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+
+    count = conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+    conn.close()
+    assert count == len(rows), f"{name}: expected {len(rows)} rows, got {count}"
+    return elapsed, cursor.round_trips
+
+
+def load_executemany(cursor, rows, columns):
+    sql = f"INSERT INTO t ({','.join(columns)}) VALUES ({','.join(['?'] * len(columns))})"
+    cursor.executemany(sql, rows)
+
+
+def load_bulk(cursor, rows, columns):
+    chunk = chunk_rows(len(columns), max_params=SQLITE_MAX_PARAMS)
+    bulk_insert(cursor, 't', rows, columns, chunk=chunk, placeholder='?')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk insert benchmark (SQLite stand-in)')
+    parser.add_argument('--rows', type=int, default=5000, help='資料筆數')
+    parser.add_argument('--cols', type=int, default=8, help='欄位數')
+    parser.add_argument('--rtt-ms', type=float, default=0.5, help='模擬每次 round trip 延遲 (ms)')
+    args = parser.parse_args()
+
+    columns = [f"c{j}" for j in range(args.cols)]
+    rows = make_rows(args.rows, args.cols)
+    rtt = args.rtt_ms / 1000
+
+    print(f"rows={args.rows} cols={args.cols} rtt={args.rtt_ms}ms")
+    print(f"{'method':<14}{'seconds':>10}{'round trips':>14}{'rows/s':>12}")
+    print('-' * 50)
+
+    results = {}
+    for name, loader in (('executemany', load_executemany), ('bulk_insert', load_bulk)):
+        elapsed, trips = run_case(name, rows, columns, rtt, loader)
+        results[name] = elapsed
+        print(f"{name:<14}{elapsed:>10.3f}{trips:>14}{args.rows / elapsed:>12.0f}")
+
+    print('-' * 50)
+    print(f"speedup: {results['executemany'] / results['bulk_insert']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
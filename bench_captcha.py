@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: 以離線驗證碼語料評估 OCR 延遲、吞吐量與正確率
+語料由 CRAWLAB_CAPTCHA_CORPUS 收集 (見 common.captcha.CaptchaCorpus)，不需連線網站。
+
+正確率只計算網站接受的樣本 (其 code 即正確答案)；
+false_reject 為正確答案卻被 profile.accept 擋下的比例，用來檢查 profile 設定是否過嚴。
+
+Usage:
+    python bench_captcha.py --corpus ./data/captcha_corpus
+    python bench_captcha.py --corpus ./data/captcha_corpus --site liaroc --raw
+    python bench_captcha.py --corpus ./data/captcha_corpus --workers 4
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common.captcha import CaptchaCorpus, CaptchaProfile, get_solver
+from common.ocrpool import configure_ocr
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def run_site(name, profile_data, samples, raw, workers, limit):
+    profile = None if raw else CaptchaProfile.from_dict(name, profile_data)
+    images = []
+    for sample in samples[:limit] if limit else samples:
+        with open(sample['path'], 'rb') as f:
+            images.append((f.read(), sample))
+
+    solver = get_solver()
+    latencies = []
+    results = []
+
+    start = time.perf_counter()
+    if workers:
+        submitted = [(time.perf_counter(), solver.submit(image, profile), sample) for image, sample in images]
+        for t0, future, sample in submitted:
+            code = future.result()
+            latencies.append(time.perf_counter() - t0)
+            results.append((code, sample))
+    else:
+        for image, sample in images:
+            t0 = time.perf_counter()
+            code = solver.classify(image, profile)
+            latencies.append(time.perf_counter() - t0)
+            results.append((code, sample))
+    elapsed = time.perf_counter() - start
+
+    labeled = [(code, s) for code, s in results if s['accepted']]
+    correct = sum(1 for code, s in labeled if code == s['code'])
+    false_reject = sum(1 for _, s in labeled if profile is not None and not profile.accept(s['code']))
+
+    return {
+        'samples': len(results),
+        'labeled': len(labeled),
+        'accuracy': correct / len(labeled) if labeled else 0.0,
+        'false_reject': false_reject / len(labeled) if labeled else 0.0,
+        'avg_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'per_sec': len(results) / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Captcha OCR benchmark (offline corpus)')
+    parser.add_argument('--corpus', default='./data/captcha_corpus', help='語料目錄')
+    parser.add_argument('--site', default=None, help='只評估指定網站')
+    parser.add_argument('--raw', action='store_true', help='不套用網站 profile (字元集、長度、前處理)')
+    parser.add_argument('--workers', type=int, default=0, help='OCR 子程序數，0 = 程序內辨識')
+    parser.add_argument('--limit', type=int, default=0, help='每個網站最多評估筆數')
+    args = parser.parse_args()
+
+    corpus = CaptchaCorpus.load(args.corpus, args.site)
+    if not corpus:
+        print(f"找不到語料: {args.corpus}")
+        return
+
+    pool = configure_ocr(args.workers)
+    # 模型載入不計入延遲
+    (pool or get_solver()).warmup()
+
+    mode = 'raw' if args.raw else 'profile'
+    print(f"corpus={args.corpus} mode={mode} workers={args.workers}")
+    print(f"{'site':<14}{'samples':>9}{'labeled':>9}{'accuracy':>10}{'false_rej':>11}"
+          f"{'avg ms':>9}{'p95 ms':>9}{'img/s':>9}")
+    print('-' * 80)
+
+    for name, (profile_data, samples) in corpus.items():
+        r = run_site(name, profile_data, samples, args.raw, args.workers, args.limit)
+        print(f"{name:<14}{r['samples']:>9}{r['labeled']:>9}{r['accuracy']:>10.1%}{r['false_reject']:>11.1%}"
+              f"{r['avg_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['per_sec']:>9.1f}")
+
+    configure_ocr(0)
+
+
+if __name__ == '__main__':
+    main()
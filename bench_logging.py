@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: 每筆記錄的 Log 開銷 (HTTP 請求 / 回應追蹤 + 除錯訊息 + 進度)
+模擬 Judicial / Court_Auction 每筆記錄的呼叫順序，不連線、不寫入實際 Log 檔。
+
+eager: 舊呼叫方式 - 呼叫端先組 dict(response.headers)、response.text[:500] 與 f-string
+lazy:  新呼叫方式 - 傳入 headers 物件與 lambda，只有該層級啟用 (或發生錯誤需要上下文) 時才計算
+
+requests 的 Response.text 每次存取都會重新解碼，因此 eager 模式在 INFO 層級也要付出解碼成本。
+
+Usage:
+    python bench_logging.py
+    python bench_logging.py --records 20000 --body-kb 80
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common.logger import CrawlabLogger
+
+
+class FakeResponse:
+    """與 requests.Response 相同：text 每次存取都重新解碼"""
+
+    def __init__(self, body: bytes):
+        self.status_code = 200
+        self.content = body
+        self.headers = {f"X-Header-{i}": f"value-{i}" for i in range(12)}
+        self.headers['Set-Cookie'] = 'session=abc'
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+
+def record_eager(logger, response, form_data, i):
+    logger.ctx.set_operation("scrape_page")
+    logger.log_request("POST", "https://example.gov.tw/QUERY.htm", {'User-Agent': 'x'}, form_data)
+    logger.log_response(response.status_code, dict(response.headers),
+                        response.text[:500] if len(response.text) > 500 else response.text, 0.12)
+    logger.debug(f"第 {i} 筆解析完成: {form_data}")
+    logger.log_progress(i, 10 ** 9, f"record_{i}")
+
+
+def record_lazy(logger, response, form_data, i):
+    logger.ctx.set_operation("scrape_page")
+    logger.log_request("POST", "https://example.gov.tw/QUERY.htm", {'User-Agent': 'x'}, form_data)
+    logger.log_response(response.status_code, response.headers, lambda r=response: r.text[:500], 0.12)
+    logger.debug(lambda: f"第 {i} 筆解析完成: {form_data}")
+    logger.log_progress(i, 10 ** 9, f"record_{i}")
+
+
+def run_case(level, mode, records, response):
+    logger = CrawlabLogger(f'bench-{level}-{mode}', log_dir=tempfile.mkdtemp())
+    devnull = open(os.devnull, 'w', encoding='utf-8')
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(logging.Formatter('%(asctime)s | %(levelname)-8s | %(name)s | %(message)s'))
+    logger.logger.handlers = [handler]
+    logger.logger.setLevel(logging.DEBUG if level == 'DEBUG' else logging.INFO)
+
+    func = record_eager if mode == 'eager' else record_lazy
+    form_data = {'crmyy': '113', 'crmid': '司執', 'crmno': '012345', 'pageNum': '1', 'pageSize': '100'}
+
+    start = time.perf_counter()
+    for i in range(1, records + 1):
+        func(logger, response, form_data, i)
+    elapsed = time.perf_counter() - start
+    devnull.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-record logging overhead benchmark')
+    parser.add_argument('--records', type=int, default=5000, help='模擬筆數')
+    parser.add_argument('--body-kb', type=int, default=40, help='模擬回應大小 (KB)')
+    args = parser.parse_args()
+
+    response = FakeResponse(('<td>資料</td>' * (args.body_kb * 1024 // 16)).encode('utf-8'))
+
+    print(f"records={args.records} body={args.body_kb}KB")
+    print(f"{'level':<8}{'mode':<8}{'seconds':>10}{'us/record':>12}")
+    print('-' * 38)
+    for level in ('INFO', 'DEBUG'):
+        results = {}
+        for mode in ('eager', 'lazy'):
+            elapsed = run_case(level, mode, args.records, response)
+            results[mode] = elapsed
+            print(f"{level:<8}{mode:<8}{elapsed:>10.3f}{elapsed / args.records * 1e6:>12.1f}")
+        print(f"{'':<8}speedup: {results['eager'] / results['lazy']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,42 @@ Crawlab Common Module
 Shared utilities for all crawler modules
 """
 
-from .logger import CrawlabLogger, get_logger
+from .logger import CrawlabLogger, ErrorAggregator, get_logger, flush_logs
+from .metrics import Histogram, Metrics, merge_prometheus
+from .tracing import Tracer
+from .db import ConnectionPool, PoolTimeout, get_pool, pool_stats, close_all
+from .workqueue import WorkQueue, queue_stats
+from .bulk import bulk_insert, bulk_insert_docs, merge_upsert, insert_missing
+from .quota import DailyQuota, QuotaExhausted, quota_stats
+from .keyindex import KeyIndex, index_stats
+from .query import execute, fetch_all, fetch_value, run, query_stats
+from .writer import BackgroundWriter, flush_all, writer_stats
+from .schema import ensure_index, ensure_indexes, stale_predicate
+from .captcha import (CaptchaSolver, CaptchaProfile, CaptchaPipeline, CaptchaCorpus, get_solver, get_profile,
+                      solve, enable_capture, captcha_stats)
+from .ocrpool import OcrPool, configure_ocr, ocr_pool_stats
+from .http import TokenBucket, get_session, new_session, set_rate, make_retry, http_stats
+from .httpcache import ResponseCache, get_cache, http_cache_stats
+from .replay import FixtureStore, ReplayServer, enable_record, enable_replay, replay_stats
+from .adaptive import AimdController, set_adaptive, get_controller, adaptive_stats
 
-__all__ = ['CrawlabLogger', 'get_logger']
+__all__ = [
+    'CrawlabLogger', 'ErrorAggregator', 'get_logger', 'flush_logs',
+    'Histogram', 'Metrics', 'merge_prometheus',
+    'Tracer',
+    'ConnectionPool', 'PoolTimeout', 'get_pool', 'pool_stats', 'close_all',
+    'WorkQueue', 'queue_stats',
+    'bulk_insert', 'bulk_insert_docs', 'merge_upsert', 'insert_missing',
+    'DailyQuota', 'QuotaExhausted', 'quota_stats',
+    'KeyIndex', 'index_stats',
+    'execute', 'fetch_all', 'fetch_value', 'run', 'query_stats',
+    'BackgroundWriter', 'flush_all', 'writer_stats',
+    'ensure_index', 'ensure_indexes', 'stale_predicate',
+    'CaptchaSolver', 'CaptchaProfile', 'CaptchaPipeline', 'CaptchaCorpus', 'get_solver', 'get_profile',
+    'solve', 'enable_capture', 'captcha_stats',
+    'OcrPool', 'configure_ocr', 'ocr_pool_stats',
+    'TokenBucket', 'get_session', 'new_session', 'set_rate', 'make_retry', 'http_stats',
+    'ResponseCache', 'get_cache', 'http_cache_stats',
+    'FixtureStore', 'ReplayServer', 'enable_record', 'enable_replay', 'replay_stats',
+    'AimdController', 'set_adaptive', 'get_controller', 'adaptive_stats',
+]
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Adaptive Module
+自適應請求速率 / 並行數 (AIMD) - 網站當天負載不同，固定間隔不是太慢就是太兇
+
+Features:
+- 回應正常時每個 interval 加法提高速率 (+increase) 與並行數 (+1)
+- 429 / 5xx、逾時 / 連線錯誤、延遲突增 (> spike_factor × 平均延遲) 時乘法降低 (× decrease)
+- urllib3 內部重試過程中的 429 / 5xx 也計入 (Retry.history)
+- 連續失敗次數 (failing) 供模組判斷網站是否已停止服務
+- 每個主機學到的速率 / 並行數存於 JSON (CRAWLAB_HTTP_LIMITS，預設 ./data/http_limits.json)，下次由此開始
+- 統計於 logger.task_end 時自動併入 CrawlabLogger stats
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from . import http
+from .http import TokenBucket
+from .logger import CrawlabLogger
+
+LIMITS_ENV = 'CRAWLAB_HTTP_LIMITS'
+DEFAULT_LIMITS = './data/http_limits.json'
+BACKOFF_STATUS = (429, 500, 502, 503, 504)
+
+
+class AimdController:
+    """
+    單一主機的 AIMD 速率 / 並行數控制器 (執行緒安全)
+
+    Usage:
+        from common.adaptive import set_adaptive
+
+        limiter = set_adaptive(wbinfo['url'], min_rate=0.2, max_rate=3.0, max_concurrency=2)
+        resp = session.post(url, ...)              # 經 common.http 的請求自動受控
+        if resp.status_code >= 500 and limiter.failing:
+            raise SystemExit("網站持續錯誤，程式正常停止")
+    """
+
+    def __init__(self, host: str, min_rate: float = 0.2, max_rate: float = 10.0,
+                 rate: Optional[float] = None, max_concurrency: int = 4,
+                 concurrency: Optional[int] = None, increase: float = 0.2, decrease: float = 0.5,
+                 interval: float = 1.0, spike_factor: float = 3.0, fail_limit: int = 10,
+                 backoff_status: Iterable[int] = BACKOFF_STATUS, min_concurrency: int = 1):
+        """
+        Args:
+            host: 主機名稱
+            min_rate / max_rate: 每秒請求數範圍
+            rate: 起始速率 (預設 min_rate 與 max_rate 的中間值)
+            max_concurrency: 並行數上限
+            concurrency: 起始並行數 (預設 1)
+            increase: 每個 interval 增加的每秒請求數
+            decrease: 降速倍率 (0.5 = 減半)
+            interval: 調整間隔秒數 (降速後至少等待此時間才會再次調整)
+            spike_factor: 延遲超過平均值幾倍視為突增
+            fail_limit: 連續失敗幾次後 failing 為 True
+            backoff_status: 觸發降速的狀態碼
+            min_concurrency: 並行數下限 (例如驗證碼預取與查詢需同時進行時設為 2)
+        """
+        self.host = host
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max(max_concurrency, 1)
+        self.min_concurrency = min(max(min_concurrency, 1), self.max_concurrency)
+        self.increase = increase
+        self.decrease = decrease
+        self.interval = interval
+        self.spike_factor = spike_factor
+        self.fail_limit = fail_limit
+        self.backoff_status = frozenset(backoff_status)
+
+        self.rate = self._clamp_rate(rate if rate else (min_rate + max_rate) / 2)
+        self.concurrency = self._clamp_concurrency(concurrency or 1)
+        self.bucket = TokenBucket(self.rate)
+
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._last_change = time.monotonic() - interval    # 第一次異常即可降速
+        self._successes = 0
+        self._latency: Optional[float] = None      # 正常回應延遲的 EWMA
+        self._samples = 0
+        self.consecutive_failures = 0
+
+        self.stats: Dict[str, Any] = {
+            'requests': 0,
+            'increases': 0,
+            'decreases': 0,
+            'reasons': {},
+            'min_rate_seen': self.rate,
+            'max_rate_seen': self.rate,
+        }
+
+    def _clamp_rate(self, rate: float) -> float:
+        return min(max(rate, self.min_rate), self.max_rate)
+
+    def _clamp_concurrency(self, concurrency: int) -> int:
+        return min(max(int(concurrency), self.min_concurrency), self.max_concurrency)
+
+    # ========== 請求 ==========
+
+    def enter(self):
+        """等待並行名額與速率 token (common.http adapter 送出前呼叫)"""
+        with self._cond:
+            while self._inflight >= self.concurrency:
+                self._cond.wait()
+            self._inflight += 1
+        self.bucket.acquire()
+
+    def exit(self, elapsed: float, response=None, error: Optional[BaseException] = None):
+        """釋放並行名額並依結果調整 (common.http adapter 收到回應後呼叫)"""
+        with self._cond:
+            self._inflight -= 1
+            self._cond.notify()
+        self.observe(elapsed, response, error)
+
+    @property
+    def failing(self) -> bool:
+        """連續失敗次數已達 fail_limit"""
+        return self.consecutive_failures >= self.fail_limit
+
+    # ========== 調整 ==========
+
+    def _signal(self, elapsed: float, response, error) -> Optional[str]:
+        """判斷是否需要降速，回傳原因 (None 表示正常)"""
+        if error is not None:
+            return 'timeout' if 'timeout' in type(error).__name__.lower() else 'error'
+
+        retries = getattr(getattr(response, 'raw', None), 'retries', None)
+        for attempt in getattr(retries, 'history', ()) or ():
+            if attempt.status in self.backoff_status or attempt.error is not None:
+                return f"retry_{attempt.status or 'error'}"
+
+        if response.status_code in self.backoff_status:
+            return str(response.status_code)
+        if (self._latency is not None and self._samples >= 10
+                and elapsed > self._latency * self.spike_factor):
+            return 'latency'
+        return None
+
+    def observe(self, elapsed: float, response=None, error: Optional[BaseException] = None):
+        """記錄一次請求結果"""
+        with self._lock:
+            self.stats['requests'] += 1
+            reason = self._signal(elapsed, response, error)
+            now = time.monotonic()
+
+            if reason is not None:
+                self.consecutive_failures += 1
+                self._successes = 0
+                if now - self._last_change >= self.interval:
+                    self._apply(self.rate * self.decrease, int(self.concurrency * self.decrease), now)
+                    self.stats['decreases'] += 1
+                    self.stats['reasons'][reason] = self.stats['reasons'].get(reason, 0) + 1
+                return
+
+            self.consecutive_failures = 0
+            self._samples += 1
+            self._latency = elapsed if self._latency is None else self._latency * 0.9 + elapsed * 0.1
+            self._successes += 1
+            if now - self._last_change >= self.interval and self._successes >= self.concurrency:
+                if self.rate < self.max_rate or self.concurrency < self.max_concurrency:
+                    self._apply(self.rate + self.increase, self.concurrency + 1, now)
+                    self.stats['increases'] += 1
+                self._successes = 0
+
+    def _apply(self, rate: float, concurrency: int, now: float):
+        self.rate = self._clamp_rate(rate)
+        self.bucket.set_rate(self.rate)
+        self._last_change = now
+        self.stats['min_rate_seen'] = min(self.stats['min_rate_seen'], self.rate)
+        self.stats['max_rate_seen'] = max(self.stats['max_rate_seen'], self.rate)
+        with self._cond:
+            self.concurrency = self._clamp_concurrency(concurrency)
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得統計資訊"""
+        with self._lock:
+            stats = dict(self.stats, reasons=dict(self.stats['reasons']))
+            stats['rate'] = round(self.rate, 3)
+            stats['concurrency'] = self.concurrency
+            stats['avg_ms'] = round(self._latency * 1000, 1) if self._latency is not None else 0.0
+            stats['consecutive_failures'] = self.consecutive_failures
+        stats['min_rate_seen'] = round(stats['min_rate_seen'], 3)
+        stats['max_rate_seen'] = round(stats['max_rate_seen'], 3)
+        stats['rate_wait_seconds'] = round(self.bucket.waited, 3)
+        return stats
+
+
+# ========== 管理 ==========
+
+_controllers: Dict[str, AimdController] = {}
+_lock = threading.Lock()
+
+
+def _limits_path() -> str:
+    return os.environ.get(LIMITS_ENV) or DEFAULT_LIMITS
+
+
+def load_limits() -> Dict[str, Dict[str, Any]]:
+    """讀取上次執行學到的每個主機速率 / 並行數"""
+    try:
+        with open(_limits_path(), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_limits():
+    """保存目前每個主機的速率 / 並行數 (與既有檔案合併)"""
+    with _lock:
+        controllers = list(_controllers.values())
+    if not controllers:
+        return
+    limits = load_limits()
+    for controller in controllers:
+        limits[controller.host] = {
+            'rate': round(controller.rate, 3),
+            'concurrency': controller.concurrency,
+            'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+    path = _limits_path()
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(limits, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def set_adaptive(host: str, **kwargs) -> AimdController:
+    """
+    啟用主機的自適應速率 / 並行數 (取代 set_rate 的固定速率)
+
+    起始值優先使用上次執行保存的結果 (仍限制在 min / max 範圍內)。
+
+    Args:
+        host: 主機名稱或完整 URL
+        kwargs: 傳給 AimdController 的參數
+
+    Returns:
+        AimdController
+    """
+    name = http._host(host)
+    with _lock:
+        controller = _controllers.get(name)
+        if controller is None:
+            saved = load_limits().get(name, {})
+            kwargs.setdefault('rate', saved.get('rate'))
+            kwargs.setdefault('concurrency', saved.get('concurrency'))
+            controller = _controllers[name] = AimdController(name, **kwargs)
+            http.set_controller(name, controller)
+    return controller
+
+
+def get_controller(host: str) -> Optional[AimdController]:
+    """取得主機的控制器 (未啟用時 None)"""
+    return _controllers.get(http._host(host))
+
+
+def adaptive_stats() -> Dict[str, Any]:
+    """每個主機的自適應狀態 (供 logger.task_end 使用)"""
+    return {host: c.get_stats() for host, c in list(_controllers.items())}
+
+
+CrawlabLogger.register_stats_provider('http_adaptive', adaptive_stats)
+CrawlabLogger.register_task_end_hook('http_adaptive', save_limits)
+atexit.register(save_limits)
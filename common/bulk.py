@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Bulk Insert Module
+共用批次寫入 - 取代逐筆 round trip 的 executemany
+
+Features:
+- 多列 VALUES 分段寫入 (pymssql executemany 實際上是逐筆 execute)
+- pyodbc 自動啟用 fast_executemany (參數陣列一次送出)
+- 依 SQL Server 限制自動切段 (每段最多 1000 列 / 2100 個參數)
+- 維持既有 toSQL 的 (docs, table) 呼叫方式
+- 暫存表 + 單一 MERGE 的 upsert，回傳新增/更新筆數
+- 暫存表 + NOT EXISTS 的集合式去重寫入 (取代逐筆 SELECT 檢查重複)
+- 死鎖 (1205) 時 rollback 後整段重試 (建暫存表、寫入、MERGE、刪暫存表)
+"""
+
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# SQL Server 限制: INSERT ... VALUES 最多 1000 列；單一語句最多 2100 個參數
+MAX_VALUES_ROWS = 1000
+MAX_PARAMS = 2100
+DEADLOCK_ERROR = '1205'
+
+
+def _is_pyodbc(cursor) -> bool:
+    return hasattr(cursor, 'fast_executemany')
+
+
+def chunk_rows(n_cols: int, max_params: Optional[int] = MAX_PARAMS,
+               max_rows: int = MAX_VALUES_ROWS) -> int:
+    """
+    計算每段可寫入的列數
+
+    Args:
+        n_cols: 欄位數
+        max_params: 單一語句參數上限 (None 表示參數於用戶端展開，無上限)
+        max_rows: 單一 VALUES 列數上限
+    """
+    if max_params:
+        return max(1, min(max_rows, max_params // max(n_cols, 1)))
+    return max_rows
+
+
+def build_insert(table: str, columns: Sequence[str], n_rows: int,
+                 placeholder: str = '%s') -> str:
+    """組出 INSERT INTO table (cols) VALUES (...),(...) 語句"""
+    row = '(' + ','.join([placeholder] * len(columns)) + ')'
+    return f"INSERT INTO {table} ({','.join(columns)}) VALUES " + ','.join([row] * n_rows)
+
+
+def bulk_insert(cursor, table: str, rows: Iterable[Sequence[Any]], columns: Sequence[str],
+                chunk: Optional[int] = None, placeholder: str = '%s') -> int:
+    """
+    批次寫入 (不 commit，交由呼叫端控制交易)
+
+    Args:
+        cursor: pymssql 或 pyodbc cursor
+        table: 目標資料表
+        rows: 資料列 (tuple / list)，順序需與 columns 一致
+        columns: 欄位名稱
+        chunk: 每段列數 (預設依驅動與欄位數計算)
+        placeholder: 參數符號 (pymssql 為 %s；其他 DB-API 驅動依其 paramstyle)
+
+    Returns:
+        寫入筆數
+    """
+    rows = [tuple(r) for r in rows]
+    if not rows:
+        return 0
+
+    if _is_pyodbc(cursor):
+        # pyodbc: 以參數陣列一次送出，效能等同 TVP 且不受 VALUES 1000 列限制
+        cursor.fast_executemany = True
+        sql = build_insert(table, columns, 1, placeholder='?')
+        cursor.executemany(sql, rows)
+        return len(rows)
+
+    # pymssql 參數在用戶端展開成字面值，只受 VALUES 1000 列限制
+    size = chunk or chunk_rows(len(columns), max_params=None)
+    full_sql = None
+    for i in range(0, len(rows), size):
+        part = rows[i:i + size]
+        if len(part) == size:
+            full_sql = full_sql or build_insert(table, columns, size, placeholder)
+            sql = full_sql
+        else:
+            sql = build_insert(table, columns, len(part), placeholder)
+        cursor.execute(sql, tuple(v for r in part for v in r))
+    return len(rows)
+
+
+def bulk_insert_docs(cursor, table: str, docs: List[Dict[str, Any]],
+                     chunk: Optional[int] = None) -> int:
+    """
+    以 dict 清單批次寫入 (欄位取自第一筆的 keys，與既有 toSQL 相同)
+
+    Returns:
+        寫入筆數
+    """
+    if not docs:
+        return 0
+    columns = list(docs[0].keys())
+    return bulk_insert(cursor, table, [tuple(d[k] for k in columns) for d in docs],
+                       columns, chunk=chunk)
+
+
+def _quote(column: str) -> str:
+    """欄位名稱加上 [] (已加者不重複)"""
+    return column if column.startswith('[') else f'[{column}]'
+
+
+def _is_deadlock(error: Exception) -> bool:
+    return bool(getattr(error, 'args', None)) and DEADLOCK_ERROR in str(error.args[0])
+
+
+def _retry_unit(cursor, unit: Callable[[], Tuple[int, int]], retries: int) -> Tuple[int, int]:
+    """
+    執行 unit，死鎖時 rollback 後整段重試
+
+    死鎖犧牲者的整個交易已被 SQL Server 回滾，#stage 暫存表也一併消失，
+    只重試失敗的那一句會找不到暫存表，必須從建暫存表重來。
+    """
+    for attempt in range(retries + 1):
+        try:
+            return unit()
+        except Exception as e:
+            if attempt >= retries or not _is_deadlock(e):
+                raise
+            cursor.connection.rollback()
+            time.sleep(1 + attempt * 0.5)
+
+
+def _stage(cursor, table: str, rows: Iterable[Sequence[Any]], columns: List[str],
+           key_columns: List[str], execute: Callable) -> Optional[str]:
+    """
+    依 key 去重後寫入 #stage 暫存表 (欄位型別取自目標表)
+
+    Returns:
+        暫存表名稱 (無資料時為 None)
+    """
+    # MERGE / NOT EXISTS 比對時同一 key 只保留一筆 (以最後一筆為準)
+    key_idx = [columns.index(k) for k in key_columns]
+    deduped: Dict[Tuple, Tuple] = {}
+    for r in rows:
+        r = tuple(r)
+        deduped[tuple(r[i] for i in key_idx)] = r
+    if not deduped:
+        return None
+
+    stage = '#stage_' + re.sub(r'\W', '_', table)
+    execute(cursor, f"""
+    IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE {stage};
+    SELECT TOP 0 {', '.join(columns)} INTO {stage} FROM {table};
+    """)
+    bulk_insert(cursor, stage, list(deduped.values()), columns)
+    return stage
+
+
+def merge_upsert(cursor, table: str, rows: Iterable[Sequence[Any]], columns: Sequence[str],
+                 key_columns: Sequence[str], update_columns: Optional[Sequence[str]] = None,
+                 execute: Optional[Callable] = None, deadlock_retries: int = 0) -> Tuple[int, int]:
+    """
+    暫存表 + 單一 MERGE 的 upsert (不 commit，交由呼叫端控制交易)
+
+    1. 以目標表欄位型別建立 #stage 暫存表
+    2. bulk_insert 一次寫入暫存表
+    3. MERGE 到目標表，以 OUTPUT $action 統計新增/更新筆數
+
+    Args:
+        cursor: pymssql cursor
+        table: 目標資料表
+        rows: 資料列，順序需與 columns 一致 (相同 key 以最後一筆為準)
+        columns: 欄位名稱 (新增時寫入的欄位)
+        key_columns: 比對用的鍵欄位
+        update_columns: 已存在時更新的欄位 (預設為 columns 扣除 key_columns)
+        execute: 執行 SQL 的函式 execute(cursor, sql) (不可自行重試死鎖，交由 deadlock_retries)
+        deadlock_retries: 死鎖時整段重試次數；重試前會 rollback，須為交易中的第一個操作
+
+    Returns:
+        (inserted, updated)
+    """
+    execute = execute or (lambda cur, sql: cur.execute(sql))
+    columns = [_quote(c) for c in columns]
+    key_columns = [_quote(c) for c in key_columns]
+    if update_columns is None:
+        update_columns = [c for c in columns if c not in key_columns]
+    else:
+        update_columns = [_quote(c) for c in update_columns]
+
+    rows = [tuple(r) for r in rows]
+    col_sql = ', '.join(columns)
+    on_sql = ' AND '.join(f"T.{k} = S.{k}" for k in key_columns)
+    set_sql = ', '.join(f"T.{c} = S.{c}" for c in update_columns)
+    matched_sql = f"WHEN MATCHED THEN UPDATE SET {set_sql}" if update_columns else ""
+
+    def unit():
+        stage = _stage(cursor, table, rows, columns, key_columns, execute)
+        if stage is None:
+            return 0, 0
+        execute(cursor, f"""
+        SET NOCOUNT ON;
+        DECLARE @actions TABLE (act NVARCHAR(10));
+
+        MERGE {table} AS T
+        USING {stage} AS S
+            ON {on_sql}
+        {matched_sql}
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT ({col_sql})
+            VALUES ({', '.join(f'S.{c}' for c in columns)})
+        OUTPUT $action INTO @actions;
+
+        DROP TABLE {stage};
+
+        SELECT
+            ISNULL(SUM(CASE WHEN act = 'INSERT' THEN 1 ELSE 0 END), 0),
+            ISNULL(SUM(CASE WHEN act = 'UPDATE' THEN 1 ELSE 0 END), 0)
+        FROM @actions;
+        """)
+        inserted, updated = cursor.fetchone()
+        return int(inserted), int(updated)
+
+    return _retry_unit(cursor, unit, deadlock_retries)
+
+
+def insert_missing(cursor, table: str, rows: Iterable[Sequence[Any]], columns: Sequence[str],
+                   key_columns: Sequence[str], execute: Optional[Callable] = None,
+                   deadlock_retries: int = 0) -> Tuple[int, int]:
+    """
+    只寫入 key 尚不存在的資料列 (不 commit，交由呼叫端控制交易)
+
+    暫存表一次寫入後以單一 INSERT ... SELECT ... WHERE NOT EXISTS 比對，
+    取代逐筆 SELECT COUNT(*) 檢查重複。目標表應建立 key 的 UNIQUE INDEX
+    (WITH IGNORE_DUP_KEY = ON)，並行執行時的競爭由索引擋下。
+
+    Args:
+        cursor: pymssql cursor
+        table: 目標資料表
+        rows: 資料列，順序需與 columns 一致
+        columns: 欄位名稱
+        key_columns: 判斷重複的鍵欄位
+        execute: 執行 SQL 的函式 execute(cursor, sql) (不可自行重試死鎖，交由 deadlock_retries)
+        deadlock_retries: 死鎖時整段重試次數；重試前會 rollback，須為交易中的第一個操作
+
+    Returns:
+        (inserted, skipped)
+    """
+    execute = execute or (lambda cur, sql: cur.execute(sql))
+    rows = [tuple(r) for r in rows]
+    columns = [_quote(c) for c in columns]
+    key_columns = [_quote(c) for c in key_columns]
+
+    col_sql = ', '.join(columns)
+    on_sql = ' AND '.join(f"T.{k} = S.{k}" for k in key_columns)
+
+    def unit():
+        stage = _stage(cursor, table, rows, columns, key_columns, execute)
+        if stage is None:
+            return 0, 0
+        execute(cursor, f"""
+        SET NOCOUNT ON;
+        DECLARE @inserted INT;
+
+        INSERT INTO {table} ({col_sql})
+        SELECT {', '.join(f'S.{c}' for c in columns)}
+        FROM {stage} AS S
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {table} AS T WITH (UPDLOCK, HOLDLOCK)
+            WHERE {on_sql}
+        );
+        SET @inserted = @@ROWCOUNT;
+
+        DROP TABLE {stage};
+
+        SELECT @inserted;
+        """)
+        inserted = int(cursor.fetchone()[0])
+        return inserted, len(rows) - inserted
+
+    return _retry_unit(cursor, unit, deadlock_retries)
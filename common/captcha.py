@@ -0,0 +1,813 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Captcha Module
+共用驗證碼辨識 - 每個程序只載入一次 ddddocr 模型
+
+Features:
+- 第一次辨識時才載入 ddddocr (ONNX 模型)，之後整個程序共用同一個引擎
+- 執行緒安全：載入與辨識皆以 lock 保護
+- 載入模型時將 fd 2 暫時導向 devnull (ONNX Runtime 由 C++ 直接寫 fd 2)，並把 ONNX Runtime
+  log 等級調為 ERROR；辨識時不再切換 stderr
+- 載入耗時、辨識次數、平均 / 最大延遲、錯誤數等統計於 logger.task_end 時自動併入 CrawlabLogger stats
+- CaptchaProfile：各網站的字元集 (ddddocr set_ranges)、長度、大小寫、圖片前處理；
+  不可能正確的辨識結果在送出前就丟棄，並統計網站端驗證成功率
+- CaptchaCorpus：選用的語料收集 (環境變數 CRAWLAB_CAPTCHA_CORPUS 或 enable_capture())，
+  保存驗證碼圖片、辨識結果與網站是否接受，供 bench_captcha.py 離線評估
+- CaptchaPipeline：背景預先取得並辨識下一張驗證碼 (各自獨立 session)，與目前的查詢重疊執行；
+  超過有效時間的驗證碼自動丟棄，統計每筆資料節省的等待時間；
+  session 用完歸還小型 session 池重複使用 (保留連線，不必每張驗證碼重新 TLS 交握)
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from .logger import CrawlabLogger
+
+
+_stderr_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def suppress_stderr():
+    """
+    暫時將 fd 2 導向 devnull (只在載入模型時使用)
+
+    ONNX Runtime 的訊息由 C++ 直接寫入 fd 2，替換 sys.stderr 擋不住；
+    fd 為整個程序共用，期間其他執行緒的 stderr 輸出也會被丟棄，因此只包住一次性的模型載入
+    """
+    with _stderr_lock:
+        try:
+            sys.stderr.flush()
+        except Exception:
+            pass
+        saved = os.dup(2)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        try:
+            os.dup2(devnull, 2)
+            yield
+        finally:
+            os.dup2(saved, 2)
+            os.close(devnull)
+            os.close(saved)
+
+
+def _quiet_onnxruntime():
+    """ONNX Runtime 預設 log 等級為 WARNING，調為 ERROR (辨識時的警告不再輸出)"""
+    try:
+        import onnxruntime
+        onnxruntime.set_default_logger_severity(3)
+    except Exception:
+        pass
+
+
+def load_engine(**engine_kwargs):
+    """載入 ddddocr 引擎 (抑制載入時的 ONNX Runtime 訊息)"""
+    import ddddocr
+
+    _quiet_onnxruntime()
+    with suppress_stderr():
+        return ddddocr.DdddOcr(**engine_kwargs)
+
+
+# ========== 網站設定 ==========
+
+class CaptchaProfile:
+    """
+    單一網站的驗證碼設定
+
+    Usage:
+        from common.captcha import get_profile, solve
+
+        profile = get_profile('liaroc', charset='abcdefghijklmnopqrstuvwxyz0123456789',
+                              length=5, case='lower')
+
+        code = solve(captcha_img, profile)
+        if not profile.accept(code):
+            ...                             # 不可能正確，直接換下一張，不送出查詢
+        ...
+        profile.report('<CaptchaError>' not in result)
+    """
+
+    def __init__(self, name: str, charset: Optional[str] = None,
+                 length: Union[int, Tuple[int, int], None] = None, case: Optional[str] = None,
+                 preprocess: Optional[Callable[[bytes], bytes]] = None):
+        """
+        Args:
+            name: 網站名稱 (統計用)
+            charset: 允許的字元 (傳給 ddddocr set_ranges，並用於檢查結果)
+            length: 驗證碼長度，或 (最短, 最長)
+            case: 'lower' / 'upper' 統一大小寫，None 不轉換
+            preprocess: 圖片前處理 preprocess(bytes) -> bytes，例如 grayscale
+        """
+        self.name = name
+        self.charset = charset
+        if isinstance(length, int):
+            length = (length, length)
+        self.length = length
+        self.case = case
+        self.preprocess = preprocess
+        self._allowed = set(charset) if charset else None
+
+        self.stats: Dict[str, Any] = {
+            'solved': 0,
+            'rejected': 0,      # 送出前丟棄 (每筆即省下一次查詢往返)
+            'submitted': 0,
+            'accepted': 0,      # 網站端驗證通過
+        }
+
+    def prepare(self, image: bytes) -> bytes:
+        """辨識前的圖片前處理"""
+        return self.preprocess(image) if self.preprocess else image
+
+    def normalize(self, code: str) -> str:
+        """去除空白並統一大小寫"""
+        code = ''.join((code or '').split())
+        if self.case == 'lower':
+            code = code.lower()
+        elif self.case == 'upper':
+            code = code.upper()
+        return code
+
+    def accept(self, code: str) -> bool:
+        """檢查辨識結果是否可能正確 (長度、字元集)"""
+        ok = bool(code)
+        if ok and self.length:
+            ok = self.length[0] <= len(code) <= self.length[1]
+        if ok and self._allowed is not None:
+            ok = all(c in self._allowed for c in code)
+        with _profiles_lock:
+            self.stats['solved'] += 1
+            if not ok:
+                self.stats['rejected'] += 1
+        return ok
+
+    def report(self, ok: bool, image: Optional[bytes] = None, code: Optional[str] = None):
+        """
+        回報送出後網站端的驗證結果
+
+        Args:
+            ok: 網站是否接受
+            image: 原始驗證碼圖片 (語料收集啟用時保存)
+            code: 送出的辨識結果
+        """
+        with _profiles_lock:
+            self.stats['submitted'] += 1
+            if ok:
+                self.stats['accepted'] += 1
+        corpus = _corpus
+        if corpus is not None and image is not None:
+            corpus.record(self, image, code, ok)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """設定內容 (語料保存用；preprocess 僅保存函式名稱)"""
+        return {
+            'charset': self.charset,
+            'length': list(self.length) if self.length else None,
+            'case': self.case,
+            'preprocess': getattr(self.preprocess, '__name__', None),
+        }
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict[str, Any]) -> 'CaptchaProfile':
+        """由 to_dict() 的內容還原 (preprocess 僅支援本模組提供的函式)"""
+        length = data.get('length')
+        preprocess = PREPROCESSORS.get(data.get('preprocess') or '')
+        return cls(name, charset=data.get('charset'), length=tuple(length) if length else None,
+                   case=data.get('case'), preprocess=preprocess)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        取得統計資訊
+
+        success_rate 為網站端通過率，1 / success_rate 約為每筆需要的查詢往返次數
+        """
+        stats = dict(self.stats)
+        stats['success_rate'] = round(stats['accepted'] / stats['submitted'], 4) if stats['submitted'] else 0.0
+        stats['reject_rate'] = round(stats['rejected'] / stats['solved'], 4) if stats['solved'] else 0.0
+        return stats
+
+
+def grayscale(image: bytes) -> bytes:
+    """前處理：轉灰階 (PIL 為 ddddocr 相依套件)"""
+    import io
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.open(io.BytesIO(image)).convert('L').save(buf, format='PNG')
+    return buf.getvalue()
+
+
+PREPROCESSORS: Dict[str, Callable[[bytes], bytes]] = {'grayscale': grayscale}
+
+
+def _ctc_decode(charsets: Sequence[str], probability: Sequence[Sequence[float]]) -> str:
+    """set_ranges 後 probability=True 的輸出以 greedy CTC 解碼 (合併重複、去除空白)"""
+    chars = []
+    last = None
+    for row in probability:
+        idx = max(range(len(row)), key=row.__getitem__)
+        if idx != last and charsets[idx]:
+            chars.append(charsets[idx])
+        last = idx
+    return ''.join(chars)
+
+
+# ========== 辨識引擎 ==========
+
+class CaptchaSolver:
+    """
+    共用 ddddocr 引擎 (請用 get_solver() 取得，不要自行建立)
+
+    Usage:
+        from common.captcha import get_solver, solve
+
+        code = solve(captcha_img)               # 預設引擎
+
+        solver = get_solver()
+        solver.warmup()                         # 啟動時先載入模型 (選用)
+        code = solver.classify(captcha_img)
+    """
+
+    def __init__(self, name: str = 'default', **engine_kwargs):
+        """
+        Args:
+            name: 名稱 (統計用)
+            engine_kwargs: 傳給 ddddocr.DdddOcr 的參數 (show_ad 預設 False)
+        """
+        engine_kwargs.setdefault('show_ad', False)
+        self.name = name
+        self.engine_kwargs = engine_kwargs
+
+        self._engine = None
+        self._ranges: Optional[str] = None
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+        self.stats: Dict[str, Any] = {
+            'loads': 0,
+            'load_seconds': 0.0,
+            'calls': 0,
+            'errors': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+        }
+
+    @property
+    def loaded(self) -> bool:
+        return self._engine is not None
+
+    def _get_engine(self):
+        """取得引擎，尚未載入時載入 (double-checked locking)"""
+        engine = self._engine
+        if engine is not None:
+            return engine
+        with self._load_lock:
+            if self._engine is None:
+                start = time.perf_counter()
+                self._engine = load_engine(**self.engine_kwargs)
+                self.stats['loads'] += 1
+                self.stats['load_seconds'] += time.perf_counter() - start
+            return self._engine
+
+    def warmup(self) -> 'CaptchaSolver':
+        """預先載入模型"""
+        self._get_engine()
+        return self
+
+    def classify(self, image: bytes, profile: Optional[CaptchaProfile] = None) -> str:
+        """
+        辨識驗證碼
+
+        Args:
+            image: 圖片內容 (PNG / JPEG bytes)
+            profile: 網站設定 (前處理、字元集、大小寫)
+
+        Returns:
+            辨識結果 (未檢查 profile.accept)
+        """
+        engine = self._get_engine()
+        start = time.perf_counter()
+        try:
+            if profile is not None:
+                image = profile.prepare(image)
+            charset = profile.charset if profile is not None else None
+            with self._lock:
+                if charset:
+                    if self._ranges != charset:
+                        engine.set_ranges(charset)
+                        self._ranges = charset
+                    out = engine.classification(image, probability=True)
+                    result = _ctc_decode(out['charsets'], out['probability'])
+                else:
+                    result = engine.classification(image)
+        except Exception:
+            self._record(time.perf_counter() - start, error=True)
+            raise
+        self._record(time.perf_counter() - start)
+        return profile.normalize(result) if profile is not None else result
+
+    def _record(self, elapsed: float, error: bool = False):
+        ms = elapsed * 1000
+        with _solvers_lock:
+            self.stats['calls'] += 1
+            self.stats['total_ms'] += ms
+            self.stats['max_ms'] = max(self.stats['max_ms'], ms)
+            if error:
+                self.stats['errors'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得統計資訊"""
+        stats = dict(self.stats)
+        stats['avg_ms'] = round(stats['total_ms'] / stats['calls'], 2) if stats['calls'] else 0.0
+        stats['total_ms'] = round(stats['total_ms'], 1)
+        stats['max_ms'] = round(stats['max_ms'], 2)
+        stats['load_seconds'] = round(stats['load_seconds'], 3)
+        return stats
+
+
+# ========== 語料收集 ==========
+
+CORPUS_ENV = 'CRAWLAB_CAPTCHA_CORPUS'
+
+
+def _image_ext(image: bytes) -> str:
+    if image[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if image[:3] == b'GIF':
+        return 'gif'
+    return 'jpg'
+
+
+class CaptchaCorpus:
+    """
+    驗證碼語料 (圖片 + 辨識結果 + 網站是否接受)
+
+    目錄結構:
+        <root>/<site>/profile.json      網站設定 (CaptchaProfile.to_dict)
+        <root>/<site>/labels.jsonl      {"file", "code", "accepted", "ts"} 每行一筆
+        <root>/<site>/<檔名>.png / .jpg
+
+    網站接受的樣本，其 code 即為正確答案；未接受的樣本僅知道該結果錯誤。
+
+    Usage:
+        export CRAWLAB_CAPTCHA_CORPUS=./data/captcha_corpus     # 或 enable_capture(path)
+
+        token.report(ok)                            # CaptchaPipeline：自動保存
+        profile.report(ok, img_bytes, code)         # 直接呼叫 solve() 的模組
+
+        python bench_captcha.py --corpus ./data/captcha_corpus
+    """
+
+    def __init__(self, root: str, max_per_site: int = 5000):
+        """
+        Args:
+            root: 語料目錄
+            max_per_site: 每個網站最多保存的樣本數
+        """
+        self.root = root
+        self.max_per_site = max_per_site
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self.stats: Dict[str, Any] = {'saved': 0, 'skipped': 0, 'errors': 0}
+
+    def _site_dir(self, profile: CaptchaProfile) -> str:
+        """建立網站目錄，第一次時寫入 profile.json 並計算既有樣本數"""
+        site_dir = os.path.join(self.root, profile.name)
+        if profile.name not in self._counts:
+            os.makedirs(site_dir, exist_ok=True)
+            with open(os.path.join(site_dir, 'profile.json'), 'w', encoding='utf-8') as f:
+                json.dump(profile.to_dict(), f, ensure_ascii=False, indent=2)
+            labels = os.path.join(site_dir, 'labels.jsonl')
+            count = 0
+            if os.path.exists(labels):
+                with open(labels, encoding='utf-8') as f:
+                    count = sum(1 for _ in f)
+            self._counts[profile.name] = count
+        return site_dir
+
+    def record(self, profile: CaptchaProfile, image: bytes, code: Optional[str], accepted: bool):
+        """保存一筆樣本 (失敗只計數，不影響爬取)"""
+        try:
+            with self._lock:
+                site_dir = self._site_dir(profile)
+                count = self._counts[profile.name]
+                if count >= self.max_per_site:
+                    self.stats['skipped'] += 1
+                    return
+                filename = f"{time.strftime('%Y%m%d_%H%M%S')}_{count:06d}.{_image_ext(image)}"
+                with open(os.path.join(site_dir, filename), 'wb') as f:
+                    f.write(image)
+                with open(os.path.join(site_dir, 'labels.jsonl'), 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'file': filename, 'code': code, 'accepted': bool(accepted),
+                                        'ts': time.strftime('%Y-%m-%d %H:%M:%S')},
+                                       ensure_ascii=False) + '\n')
+                self._counts[profile.name] = count + 1
+                self.stats['saved'] += 1
+        except Exception:
+            self.stats['errors'] += 1
+
+    @staticmethod
+    def load(root: str, site: Optional[str] = None):
+        """
+        讀取語料
+
+        Returns:
+            {site: (profile_dict, [{'path', 'code', 'accepted'}, ...])}
+        """
+        result = {}
+        sites = [site] if site else sorted(os.listdir(root))
+        for name in sites:
+            site_dir = os.path.join(root, name)
+            labels = os.path.join(site_dir, 'labels.jsonl')
+            if not os.path.isfile(labels):
+                continue
+            profile = {}
+            profile_path = os.path.join(site_dir, 'profile.json')
+            if os.path.isfile(profile_path):
+                with open(profile_path, encoding='utf-8') as f:
+                    profile = json.load(f)
+            samples = []
+            with open(labels, encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    samples.append({'path': os.path.join(site_dir, entry['file']),
+                                    'code': entry.get('code'), 'accepted': entry.get('accepted', False)})
+            result[name] = (profile, samples)
+        return result
+
+
+# ========== 預取管線 ==========
+
+class SolvedCaptcha:
+    """
+    已辨識的驗證碼
+
+    驗證碼綁定取得時的 session (cookie)，送出查詢必須使用同一個 session
+    """
+    __slots__ = ('code', 'session', 'fetched_at', 'fetch_seconds', 'solve_seconds', 'profile', 'image',
+                 'release')
+
+    def __init__(self, code: str, session: Any, fetched_at: float,
+                 fetch_seconds: float, solve_seconds: float,
+                 profile: Optional[CaptchaProfile] = None, image: Optional[bytes] = None,
+                 release: Optional[Callable[[Any], None]] = None):
+        self.code = code
+        self.release = release
+        self.image = image
+        self.session = session
+        self.fetched_at = fetched_at
+        self.fetch_seconds = fetch_seconds
+        self.solve_seconds = solve_seconds
+        self.profile = profile
+
+    @property
+    def age(self) -> float:
+        """取得後經過的秒數"""
+        return time.monotonic() - self.fetched_at
+
+    def report(self, ok: bool):
+        """回報網站端驗證結果 (計入 profile 成功率)"""
+        if self.profile is not None:
+            self.profile.report(ok, self.image, self.code)
+
+    def close(self):
+        """查詢結束：session 歸還來源的 session 池 (沒有 session 池時關閉)"""
+        session, self.session = self.session, None
+        if session is None:
+            return
+        if self.release is not None:
+            self.release(session)
+        else:
+            _close_session(session)
+
+
+def _close_session(session: Any):
+    close = getattr(session, 'close', None)
+    if close:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+class CaptchaPipeline:
+    """
+    驗證碼預取管線
+
+    背景執行緒以 session 池中閒置的 session 取得驗證碼圖片並辨識，放入緩衝區；
+    目前的查詢送出時下一張驗證碼已在準備，驗證碼錯誤重試也不必再等 GET + OCR。
+    token.close() 後 session 歸還池中，同一時間每個 session 只綁定一張驗證碼。
+
+    Usage:
+        from common.captcha import CaptchaPipeline
+
+        def fetch_captcha(session):
+            resp = session.get(captcha_url, verify=False, timeout=10)
+            resp.raise_for_status()
+            return resp.content
+
+        captchas = CaptchaPipeline('Data-Insurance', fetch_captcha,
+                                   session_factory=requests.Session, ttl=60,
+                                   profile=get_profile('liaroc', **captcha))
+        try:
+            for record in records:
+                captchas.mark_record()
+                token = captchas.get(timeout=30)
+                resp = token.session.post(url, data=build_payload(token.code, ...))
+                token.report('<CaptchaError>' not in resp.text)
+                ...
+        finally:
+            captchas.close()
+    """
+
+    def __init__(self, name: str, fetch: Callable[[Any], bytes], session_factory: Callable[[], Any],
+                 ttl: float = 60.0, depth: int = 1, solver: Optional[CaptchaSolver] = None,
+                 profile: Optional[CaptchaProfile] = None, max_rejects: int = 10,
+                 retry_delay: float = 1.0, pool_size: Optional[int] = None):
+        """
+        Args:
+            name: 名稱 (統計用，通常為模組名稱)
+            fetch: fetch(session) 回傳驗證碼圖片 bytes，失敗時 raise
+            session_factory: 建立新 session 的函式 (例如 requests.Session)
+            ttl: 驗證碼可用秒數 (應小於網站的驗證碼有效時間，保留送出查詢的時間)
+            depth: 緩衝區預先準備的驗證碼數
+            solver: 辨識引擎 (預設 get_solver())
+            profile: 網站設定，不通過 profile.accept 的結果直接丟棄並重新取得
+            max_rejects: 連續丟棄超過此數時照常放行 (避免 profile 設定錯誤時完全停擺)
+            retry_delay: 取得 / 辨識失敗後等待秒數
+            pool_size: 保留的閒置 session 數 (預設 depth + 1：緩衝區內的驗證碼加上查詢中的一張)
+        """
+        self.name = name
+        self.fetch = fetch
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.depth = max(depth, 1)
+        self.solver = solver or get_solver()
+        self.profile = profile
+        self.max_rejects = max_rejects
+        self._rejects = 0
+        self.retry_delay = retry_delay
+        self.pool_size = pool_size if pool_size is not None else self.depth + 1
+
+        self._idle: List[Any] = []
+        self._buffer: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.stats: Dict[str, Any] = {
+            'records': 0,
+            'prepared': 0,
+            'taken': 0,
+            'ready_hits': 0,        # get() 時緩衝區已有可用驗證碼
+            'expired': 0,
+            'rejected': 0,
+            'errors': 0,
+            'sessions_created': 0,
+            'sessions_reused': 0,
+            'wait_seconds': 0.0,    # get() 實際等待的時間
+            'prep_seconds': 0.0,    # 被取用驗證碼的 GET + OCR 時間
+        }
+
+        self._thread = threading.Thread(target=self._worker, name=f"captcha-{name}", daemon=True)
+        self._thread.start()
+
+        with _pipelines_lock:
+            _pipelines[name] = self
+
+    # ========== session 池 ==========
+
+    def _acquire(self) -> Any:
+        with self._cond:
+            if self._idle:
+                self.stats['sessions_reused'] += 1
+                return self._idle.pop()
+            self.stats['sessions_created'] += 1
+        return self.session_factory()
+
+    def _release(self, session: Any):
+        """歸還 session (已關閉或池已滿時直接關閉)"""
+        with self._cond:
+            if not self._closed and len(self._idle) < self.pool_size:
+                self._idle.append(session)
+                return
+        _close_session(session)
+
+    # ========== 背景執行緒 ==========
+
+    def _prune(self):
+        """丟棄過期的驗證碼 (需持有 _cond)"""
+        while self._buffer and self._buffer[0].age >= self.ttl:
+            self._buffer.popleft().close()
+            self.stats['expired'] += 1
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    self._prune()
+                    if len(self._buffer) < self.depth:
+                        break
+                    oldest = self._buffer[0].age
+                    self._cond.wait(max(self.ttl - oldest, 0.05))
+                if self._closed:
+                    return
+
+            session = self._acquire()
+            try:
+                start = time.monotonic()
+                image = self.fetch(session)
+                fetched = time.monotonic()
+                code = self.solver.classify(image, self.profile)
+                solved = time.monotonic()
+            except Exception:
+                self.stats['errors'] += 1
+                _close_session(session)
+                time.sleep(self.retry_delay)
+                continue
+
+            if self.profile is not None and not self.profile.accept(code):
+                self._rejects += 1
+                if self._rejects <= self.max_rejects:
+                    self.stats['rejected'] += 1
+                    self._release(session)      # 換一張驗證碼，session 可直接重用
+                    continue
+            self._rejects = 0
+
+            token = SolvedCaptcha(code, session, fetched, fetched - start, solved - fetched, self.profile,
+                                  image if _corpus is not None else None, release=self._release)
+            with self._cond:
+                self._buffer.append(token)
+                self.stats['prepared'] += 1
+                self._cond.notify_all()
+
+    # ========== 取用 ==========
+
+    def get(self, timeout: Optional[float] = None) -> Optional[SolvedCaptcha]:
+        """
+        取得一張可用的驗證碼 (先進先出)，取用後同時觸發背景準備下一張
+
+        Returns:
+            SolvedCaptcha，timeout 內沒有可用驗證碼時 None
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            self._prune()
+            ready = bool(self._buffer)
+            while not self._buffer:
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining if remaining is not None else self.ttl)
+                self._prune()
+            token = self._buffer.popleft()
+            self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            self.stats['taken'] += 1
+            self.stats['ready_hits'] += int(ready)
+            self.stats['wait_seconds'] += waited
+            self.stats['prep_seconds'] += token.fetch_seconds + token.solve_seconds
+        return token
+
+    def mark_record(self):
+        """記錄開始處理一筆資料 (用於計算每筆節省的時間)"""
+        self.stats['records'] += 1
+
+    def close(self):
+        """停止背景執行緒並關閉緩衝區內與閒置的 session"""
+        with self._cond:
+            self._closed = True
+            tokens, self._buffer = list(self._buffer), deque()
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for token in tokens:
+            token.close()
+        for session in idle:
+            _close_session(session)
+        self._thread.join(5)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        取得統計資訊
+
+        hidden_seconds = 被取用驗證碼的準備時間 - 實際等待時間，即與查詢重疊而省下的時間
+        """
+        stats = dict(self.stats)
+        hidden = max(stats['prep_seconds'] - stats['wait_seconds'], 0.0)
+        stats['hidden_seconds'] = round(hidden, 3)
+        stats['hidden_ms_per_record'] = round(hidden * 1000 / stats['records'], 1) if stats['records'] else 0.0
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+        stats['prep_seconds'] = round(stats['prep_seconds'], 3)
+        stats['buffered'] = len(self._buffer)
+        return stats
+
+
+# ========== 管理 ==========
+
+_solvers: Dict[str, CaptchaSolver] = {}
+_solvers_lock = threading.Lock()
+_pipelines: Dict[str, CaptchaPipeline] = {}
+_profiles: Dict[str, CaptchaProfile] = {}
+_service: Any = None
+_corpus: Optional[CaptchaCorpus] = None
+_profiles_lock = threading.Lock()
+_pipelines_lock = threading.Lock()
+
+
+def set_service(service: Any):
+    """
+    以外部辨識服務取代預設引擎 (common.ocrpool.configure_ocr 使用)
+
+    service 需提供 classify(image, profile) / warmup() / get_stats()；None 恢復程序內辨識
+    """
+    global _service
+    _service = service
+
+
+def get_solver(name: str = 'default', **engine_kwargs) -> CaptchaSolver:
+    """
+    取得 (建立) 共用引擎
+
+    已透過 set_service 啟用辨識服務時，預設引擎改由該服務提供
+
+    Args:
+        name: 名稱，相同名稱共用同一個引擎
+        engine_kwargs: 第一次建立時傳給 ddddocr.DdddOcr 的參數
+    """
+    if name == 'default' and _service is not None:
+        return _service
+    solver = _solvers.get(name)
+    if solver is None:
+        with _solvers_lock:
+            solver = _solvers.get(name)
+            if solver is None:
+                solver = _solvers[name] = CaptchaSolver(name, **engine_kwargs)
+    return solver
+
+
+def get_profile(name: str, **kwargs) -> CaptchaProfile:
+    """
+    取得 (建立) 網站設定
+
+    Args:
+        name: 網站名稱，相同名稱共用同一份設定與統計
+        kwargs: 第一次建立時傳給 CaptchaProfile 的參數
+    """
+    with _profiles_lock:
+        profile = _profiles.get(name)
+        if profile is None:
+            profile = _profiles[name] = CaptchaProfile(name, **kwargs)
+    return profile
+
+
+def solve(image: bytes, profile: Optional[CaptchaProfile] = None, name: str = 'default') -> str:
+    """以共用引擎辨識驗證碼"""
+    return get_solver(name).classify(image, profile)
+
+
+def enable_capture(root: Optional[str] = None, **kwargs) -> Optional[CaptchaCorpus]:
+    """
+    啟用語料收集
+
+    Args:
+        root: 語料目錄，None 表示停用
+        kwargs: 傳給 CaptchaCorpus 的其他參數
+    """
+    global _corpus
+    _corpus = CaptchaCorpus(root, **kwargs) if root else None
+    return _corpus
+
+
+def captcha_stats() -> Dict[str, Any]:
+    """彙整所有辨識引擎統計 (供 logger.task_end 使用)"""
+    with _solvers_lock:
+        solvers = list(_solvers.values())
+    stats = {s.name: s.get_stats() for s in solvers if s.stats['loads'] or s.stats['calls']}
+    with _pipelines_lock:
+        pipelines = list(_pipelines.values())
+    if pipelines:
+        stats['pipelines'] = {p.name: p.get_stats() for p in pipelines}
+    with _profiles_lock:
+        profiles = list(_profiles.values())
+    if profiles:
+        stats['profiles'] = {p.name: p.get_stats() for p in profiles}
+    if _corpus is not None:
+        stats['corpus'] = dict(_corpus.stats)
+    return stats
+
+
+CrawlabLogger.register_stats_provider('captcha', captcha_stats)
+
+if os.environ.get(CORPUS_ENV):
+    enable_capture(os.environ[CORPUS_ENV])
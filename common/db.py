@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Shared Database Module
+共用資料庫模組 - 以連線池取代各 etl_func 每次呼叫都重新連線
+
+Features:
+- 依連線參數 (server/user/database) 共用的 pymssql 連線池
+- 閒置連線自動健康檢查 (SELECT 1) 與逾時回收
+- connection() / cursor() context manager，自動 commit / rollback
+- 連線池統計 (取得次數、等待時間、建立/重用/關閉次數)
+- 統計於 logger.task_end 時自動併入 CrawlabLogger stats
+- 程式結束時自動關閉所有連線
+"""
+
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from .logger import CrawlabLogger
+
+
+# ========== 連線池 ==========
+
+class PoolTimeout(Exception):
+    """等待可用連線逾時"""
+
+
+class ConnectionPool:
+    """
+    pymssql 連線池
+
+    Usage:
+        from common.db import get_pool
+
+        pool = get_pool(server, username, password, database)
+
+        # 自動 commit / rollback
+        with pool.cursor() as cursor:
+            cursor.execute("UPDATE ... WHERE ID = %s", (doc_id,))
+
+        # 需要自行控制交易時
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            ...
+            conn.commit()
+    """
+
+    def __init__(self, server: str, user: str, password: str, database: str,
+                 max_size: int = 4, idle_timeout: float = 600,
+                 health_check_interval: float = 30, acquire_timeout: float = 60,
+                 **connect_kwargs):
+        """
+        Args:
+            server / user / password / database: pymssql 連線參數
+            max_size: 最大連線數
+            idle_timeout: 閒置超過此秒數的連線直接關閉重建
+            health_check_interval: 閒置超過此秒數的連線取用前先執行 SELECT 1
+            acquire_timeout: 連線全數使用中時的最長等待秒數
+            **connect_kwargs: 其他 pymssql.connect 參數 (例如 charset)
+        """
+        self.server = server
+        self.user = user
+        self.password = password
+        self.database = database
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle: List[Tuple[Any, float]] = []  # (conn, last_used)
+        self._in_use = 0
+        self._closed = False
+
+        self.stats: Dict[str, Any] = {
+            'acquires': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'connections_closed': 0,
+            'health_check_failures': 0,
+            'acquire_wait_seconds': 0.0,
+            'acquire_wait_max_seconds': 0.0,
+        }
+
+    def _count(self, key: str):
+        """遞增統計計數器 (連線建立/關閉/檢查在鎖外進行，計數仍需持鎖)"""
+        with self._cond:
+            self.stats[key] += 1
+
+    def _connect(self):
+        """建立新連線"""
+        import pymssql
+
+        conn = pymssql.connect(server=self.server, user=self.user,
+                               password=self.password, database=self.database,
+                               **self.connect_kwargs)
+        self._count('connections_created')
+        return conn
+
+    def _close(self, conn):
+        """關閉連線 (忽略錯誤)"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._count('connections_closed')
+
+    def _is_healthy(self, conn) -> bool:
+        """以 SELECT 1 檢查連線是否仍可用"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            self._count('health_check_failures')
+            return False
+
+    def acquire(self):
+        """取得連線 (池中無可用連線且已達上限時等待)"""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("ConnectionPool 已關閉")
+                if self._idle or self._in_use < self.max_size:
+                    break
+                remaining = self.acquire_timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"等待連線逾時 ({self.acquire_timeout}s): "
+                        f"{self.server}/{self.database}"
+                    )
+                self._cond.wait(remaining)
+
+            idle = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+            wait = time.monotonic() - start
+            self.stats['acquires'] += 1
+            self.stats['acquire_wait_seconds'] += wait
+            self.stats['acquire_wait_max_seconds'] = max(
+                self.stats['acquire_wait_max_seconds'], wait)
+
+        # 連線建立與健康檢查不持有鎖，避免阻塞其他執行緒
+        try:
+            if idle is not None:
+                conn, last_used = idle
+                idle_for = time.monotonic() - last_used
+                if idle_for > self.idle_timeout:
+                    self._close(conn)
+                elif idle_for <= self.health_check_interval or self._is_healthy(conn):
+                    self._count('connections_reused')
+                    return conn
+                else:
+                    self._close(conn)
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, discard: bool = False):
+        """
+        歸還連線
+
+        Args:
+            conn: acquire() 取得的連線
+            discard: True 時直接關閉不放回池中 (例如連線已發生錯誤)
+        """
+        if not discard:
+            try:
+                conn.rollback()  # 確保未提交的交易不會帶到下一個使用者
+            except Exception:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """取得連線的 context manager，離開時自動歸還"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            # 發生錯誤時連線狀態不明，若 rollback 失敗即丟棄
+            self.release(conn, discard=not _safe_rollback(conn))
+            raise
+        else:
+            self.release(conn)
+
+    @contextmanager
+    def cursor(self, as_dict: bool = False):
+        """取得 cursor 的 context manager，成功 commit、失敗 rollback"""
+        with self.connection() as conn:
+            cursor = conn.cursor(as_dict=True) if as_dict else conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            finally:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    def resize(self, max_size: int):
+        """調整最大連線數"""
+        with self._cond:
+            self.max_size = max(max_size, 1)
+            self._cond.notify_all()
+
+    def close(self):
+        """關閉池中所有閒置連線，使用中的連線歸還時關閉"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得統計資訊"""
+        with self._cond:
+            stats = dict(self.stats)
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._in_use
+        stats['acquire_wait_seconds'] = round(stats['acquire_wait_seconds'], 3)
+        stats['acquire_wait_max_seconds'] = round(stats['acquire_wait_max_seconds'], 3)
+        return stats
+
+
+def _safe_rollback(conn) -> bool:
+    """rollback 並回傳是否成功"""
+    try:
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
+# ========== 連線池管理 ==========
+
+_pools: Dict[Tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(server: str, username: str, password: str, database: str,
+             max_size: Optional[int] = None, **connect_kwargs) -> ConnectionPool:
+    """
+    取得共用連線池 (相同連線參數共用同一個池)
+
+    Args:
+        server / username / password / database: 連線參數
+        max_size: 最大連線數 (指定時會調整既有池的大小)
+        **connect_kwargs: 其他 pymssql.connect 參數 (例如 charset='utf8')
+
+    Returns:
+        ConnectionPool 實例
+    """
+    key = (server, username, database, tuple(sorted(connect_kwargs.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(server, username, password, database,
+                                  max_size=max_size or 4, **connect_kwargs)
+            _pools[key] = pool
+        elif max_size and max_size != pool.max_size:
+            pool.resize(max_size)
+    return pool
+
+
+def pool_stats() -> Dict[str, Any]:
+    """彙整所有連線池統計 (供 logger.task_end 使用)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    if not pools:
+        return {}
+
+    total: Dict[str, Any] = {}
+    for pool in pools:
+        for k, v in pool.get_stats().items():
+            if k == 'acquire_wait_max_seconds':
+                total[k] = max(total.get(k, 0), v)
+            else:
+                total[k] = total.get(k, 0) + v
+    total['pools'] = len(pools)
+    total['acquire_wait_seconds'] = round(total['acquire_wait_seconds'], 3)
+    return total
+
+
+def close_all():
+    """關閉所有連線池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+CrawlabLogger.register_stats_provider('db_pool', pool_stats)
+atexit.register(close_all)
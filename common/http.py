@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab HTTP Module
+共用 HTTP session - 連線池、重試與每個主機的請求速率限制
+
+Features:
+- get_session(): 依名稱共用 requests.Session，HTTPAdapter 依並行數設定連線池大小 (keep-alive)
+- urllib3 Retry：連線錯誤與 429 / 5xx 自動退避重試 (只重試冪等方法，POST 不重送)，遵守 Retry-After
+- set_rate(): 每個主機的 token bucket，取代固定 time.sleep；處理回應的時間不再白白浪費
+- 每個主機的請求數、錯誤數、狀態碼、延遲百分位數 (p50 / p90 / p99)、限速等待時間
+- 錄製 / 重播 (common.replay)：CRAWLAB_HTTP_RECORD / CRAWLAB_HTTP_REPLAY 環境變數，離線測試並行數與速率
+- 選用的磁碟回應快取 (common.httpcache)：TTL 內不發出請求，過期以 ETag / Last-Modified 重新驗證
+- 統計於 logger.task_end 時自動併入 CrawlabLogger stats
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import replay
+from .httpcache import ResponseCache
+from .logger import CrawlabLogger
+
+DEFAULT_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+# ========== 速率限制 ==========
+
+class TokenBucket:
+    """
+    Token bucket 速率限制 (執行緒安全)
+
+    Usage:
+        bucket = TokenBucket(rate=2.0, burst=1)     # 每秒 2 次
+        bucket.acquire()                            # 必要時阻塞至有 token
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: 每秒補充的 token 數 (即每秒請求數)
+            burst: bucket 容量 (允許的瞬間連續請求數)
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self) -> float:
+        """取得一個 token，回傳等待秒數"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += wait
+        # 先預扣 token 再睡，多執行緒同時取用時會自然排隊
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def set_rate(self, rate: float):
+        """調整速率 (已累積的 token 以原速率結算)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.rate = rate
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def set_rate(host: str, rate: Optional[float], burst: int = 1):
+    """
+    設定主機的請求速率
+
+    Args:
+        host: 主機名稱 (例如 'aomp109.judicial.gov.tw') 或完整 URL
+        rate: 每秒請求數，None / 0 表示不限速
+        burst: 允許的瞬間連續請求數
+    """
+    host = _host(host)
+    with _buckets_lock:
+        if rate:
+            _buckets[host] = TokenBucket(rate, burst)
+        else:
+            _buckets.pop(host, None)
+
+
+# 自適應控制器 (common.adaptive.AimdController)，設定後取代該主機的固定速率
+_controllers: Dict[str, Any] = {}
+
+
+def set_controller(host: str, controller):
+    """
+    設定主機的自適應控制器 (供 common.adaptive 使用)
+
+    controller 需提供 enter() 與 exit(elapsed, response=None, error=None)；None 表示移除
+    """
+    host = _host(host)
+    with _buckets_lock:
+        if controller is not None:
+            _controllers[host] = controller
+        else:
+            _controllers.pop(host, None)
+
+
+def _host(url: str) -> str:
+    return (urlsplit(url).hostname or url).lower() if '://' in url else url.lower()
+
+
+# ========== 統計 ==========
+
+class _HostStats:
+    __slots__ = ('requests', 'errors', 'status', 'latencies', 'total_seconds')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.status: Dict[int, int] = {}
+        self.latencies: deque = deque(maxlen=2048)
+        self.total_seconds = 0.0
+
+
+_hosts: Dict[str, _HostStats] = {}
+_hosts_lock = threading.Lock()
+
+
+def _record(host: str, elapsed: float, status: Optional[int]):
+    with _hosts_lock:
+        stats = _hosts.get(host)
+        if stats is None:
+            stats = _hosts[host] = _HostStats()
+        stats.requests += 1
+        stats.total_seconds += elapsed
+        stats.latencies.append(elapsed)
+        if status is None:
+            stats.errors += 1
+        else:
+            stats.status[status] = stats.status.get(status, 0) + 1
+            if status >= 400:
+                stats.errors += 1
+
+
+def _percentile(ordered, pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+# ========== Session ==========
+
+class RateLimitedAdapter(HTTPAdapter):
+    """送出前依主機取得 token，並記錄每個主機的延遲與狀態碼；設定 cache 時先查詢回應快取"""
+
+    cache: Optional[ResponseCache] = None
+
+    def send(self, request, **kwargs):
+        cache = self.cache
+        key = cache.key_for(request) if cache is not None else None
+        if key is None:
+            return self._send(request, **kwargs)
+
+        cached = cache.lookup(key)
+        if cached is not None:
+            meta, body = cached
+            if cache.is_fresh(meta):
+                cache.touch(key, len(body))
+                return cache.build_response(meta, body, request, self)
+            request.headers.update(cache.conditional_headers(meta))
+
+        response = self._send(request, **kwargs)
+        if cached is not None and response.status_code == 304:
+            response.content            # 304 沒有 body，讀完後連線歸還連線池
+            response.close()
+            cache.refresh(key, meta, body)
+            cache.count('revalidated')
+            return cache.build_response(meta, body, request, self)
+
+        cache.count('misses')
+        cache.store(key, response)
+        return response
+
+    def _send(self, request, **kwargs):
+        host = _host(request.url)
+        controller = _controllers.get(host)
+        if controller is not None:
+            controller.enter()              # 自適應：並行數 + 速率
+        else:
+            bucket = _buckets.get(host)
+            if bucket is not None:
+                bucket.acquire()
+
+        replay.redirect(request, host)      # 重播模式：改送本機 stand-in server
+
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            _record(host, elapsed, None)
+            if controller is not None:
+                controller.exit(elapsed, error=e)
+            raise
+        elapsed = time.perf_counter() - start
+        _record(host, elapsed, response.status_code)
+        if controller is not None:
+            controller.exit(elapsed, response=response)
+        replay.record(host, request, response)
+        return response
+
+
+def make_retry(total: int = 3, backoff: float = 0.5,
+               status_forcelist: Iterable[int] = DEFAULT_RETRY_STATUS,
+               methods: Optional[Iterable[str]] = None) -> Retry:
+    """
+    建立重試策略 (預設只重試冪等方法；POST 等非冪等請求不會被重送)
+
+    Args:
+        total: 最多重試次數
+        backoff: 退避係數 (backoff * 2 ** (n - 1) 秒)
+        status_forcelist: 需重試的狀態碼
+        methods: 允許重試的 HTTP 方法，None 為 urllib3 預設 (冪等方法)；
+                 查詢用 POST 可傳入 ('GET', 'POST')
+    """
+    kwargs = {}
+    if methods is not None:
+        kwargs['allowed_methods'] = frozenset(m.upper() for m in methods)
+    return Retry(total=total, connect=total, read=total, backoff_factor=backoff,
+                 status_forcelist=tuple(status_forcelist), raise_on_status=False,
+                 respect_retry_after_header=True, **kwargs)
+
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def new_session(pool_size: int = 10, retries: Optional[Retry] = None,
+                headers: Optional[Dict[str, str]] = None, verify: bool = True,
+                cache: Optional[ResponseCache] = None) -> requests.Session:
+    """
+    建立新的 session (連線池、重試、速率限制)；需要獨立 cookie 時使用
+
+    Args:
+        pool_size: 每個主機保留的連線數 (應 >= 並行數)
+        retries: 重試策略 (預設 make_retry())
+        headers: 預設 headers
+        verify: SSL 驗證
+        cache: 回應快取 (common.httpcache.get_cache)，None 表示不快取
+    """
+    session = requests.Session()
+    adapter = RateLimitedAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                 max_retries=retries if retries is not None else make_retry())
+    adapter.cache = cache
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.verify = verify
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def get_session(name: str = 'default', **kwargs) -> requests.Session:
+    """
+    取得 (建立) 共用 session
+
+    Usage:
+        from common.http import get_session, set_rate
+
+        set_rate('aomp109.judicial.gov.tw', 1.0)        # 每秒 1 次
+        session = get_session('Data-Judicial_139', verify=False, headers={...})
+        response = session.get(url, timeout=30)
+
+    Args:
+        name: 名稱，相同名稱共用同一個 session (與 cookie)
+        kwargs: 第一次建立時傳給 new_session 的參數
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = _sessions[name] = new_session(**kwargs)
+    return session
+
+
+def http_stats() -> Dict[str, Any]:
+    """彙整每個主機的請求統計 (供 logger.task_end 使用)"""
+    with _hosts_lock:
+        hosts = {h: (s.requests, s.errors, dict(s.status), sorted(s.latencies), s.total_seconds)
+                 for h, s in _hosts.items()}
+    with _buckets_lock:
+        waits = {h: (b.rate, b.waited) for h, b in _buckets.items()}
+
+    stats = {}
+    for host, (count, errors, status, ordered, total) in hosts.items():
+        entry = {
+            'requests': count,
+            'errors': errors,
+            'status': status,
+            'avg_ms': round(total * 1000 / count, 1) if count else 0.0,
+            'p50_ms': round(_percentile(ordered, 50) * 1000, 1),
+            'p90_ms': round(_percentile(ordered, 90) * 1000, 1),
+            'p99_ms': round(_percentile(ordered, 99) * 1000, 1),
+        }
+        if host in waits:
+            entry['rate'] = waits[host][0]
+            entry['rate_wait_seconds'] = round(waits[host][1], 3)
+        stats[host] = entry
+    return stats
+
+
+CrawlabLogger.register_stats_provider('http', http_stats)
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab HTTP Cache Module
+磁碟 HTTP 回應快取 - 重跑時不再重新下載沒有變動的詳細頁 / 文件
+
+Features:
+- 以 method + URL + body 為 key (查詢型 POST 也可快取)
+- TTL 內直接回傳快取，不發出請求 (也不佔用 set_rate 的請求額度)
+- TTL 過期後以 ETag / Last-Modified 條件請求重新驗證，304 時沿用快取內容
+- 每個模組各自的目錄、TTL 與 URL 前綴 (只快取指定的 URL)
+- 超過容量上限時依 LRU 刪除最久未使用的項目
+- 命中 / 未命中 / 重新驗證等統計於 logger.task_end 時自動併入 CrawlabLogger stats
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .logger import CrawlabLogger
+
+CACHE_ENV = 'CRAWLAB_HTTP_CACHE'
+DEFAULT_ROOT = './data/http_cache'
+
+# body 已解壓縮、不再分段，這些 header 不能原樣重播
+_DROP_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length', 'set-cookie', 'connection')
+
+
+class ResponseCache:
+    """
+    磁碟 HTTP 回應快取 (執行緒安全)
+
+    Usage:
+        from common.http import get_session
+        from common.httpcache import get_cache
+
+        cache = get_cache('Data-Judicial_cdbc3', ttl=crawler['cache_ttl'], urls=[wbinfo['view_url']])
+        session = get_session('Data-Judicial_cdbc3', cache=cache)
+        r = session.post(wbinfo['view_url'], data=data1)     # 第二次執行時直接由快取回傳
+    """
+
+    def __init__(self, name: str, ttl: float, root: Optional[str] = None,
+                 urls: Optional[Sequence[str]] = None, max_mb: float = 256):
+        """
+        Args:
+            name: 名稱 (快取子目錄)
+            ttl: 快取有效秒數，過期後重新驗證
+            root: 快取根目錄 (預設 CRAWLAB_HTTP_CACHE 或 ./data/http_cache)
+            urls: 只快取這些前綴開頭的 URL，None 表示全部
+            max_mb: 容量上限 (MB)
+        """
+        self.name = name
+        self.ttl = ttl
+        self.urls = tuple(urls) if urls else None
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.path = os.path.join(root or os.environ.get(CACHE_ENV) or DEFAULT_ROOT, name)
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()   # key -> bytes，最舊在前
+        self._bytes = 0
+        self.stats: Dict[str, Any] = {
+            'hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'stored': 0,
+            'evicted': 0,
+            'saved_bytes': 0,
+        }
+        self._load_index()
+
+    # ========== 索引 ==========
+
+    def _files(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.path, key[:2], key)
+        return base + '.bin', base + '.json'
+
+    def _load_index(self):
+        """啟動時掃描既有快取，依最後使用時間 (mtime) 排序"""
+        found = []
+        for sub in os.listdir(self.path):
+            folder = os.path.join(self.path, sub)
+            if not os.path.isdir(folder):
+                continue
+            for fname in os.listdir(folder):
+                if not fname.endswith('.bin'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(folder, fname))
+                except OSError:
+                    continue
+                found.append((st.st_mtime, fname[:-4], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+
+    def _evict(self):
+        """超過容量時刪除最久未使用的項目 (呼叫端持有 lock)"""
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.stats['evicted'] += 1
+            for path in self._files(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # ========== 查詢 ==========
+
+    def key_for(self, request) -> Optional[str]:
+        """計算快取 key；不在快取範圍內 (URL 不符、串流 body) 時回傳 None"""
+        if self.urls is not None and not request.url.startswith(self.urls):
+            return None
+        body = request.body
+        if body is None:
+            body = b''
+        elif isinstance(body, str):
+            body = body.encode('utf-8')
+        elif not isinstance(body, bytes):
+            return None
+        digest = hashlib.sha256()
+        digest.update(request.method.upper().encode())
+        digest.update(b'\0' + request.url.encode('utf-8') + b'\0')
+        digest.update(body)
+        return digest.hexdigest()
+
+    def lookup(self, key: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        """讀取快取項目，回傳 (meta, body)；不存在時 None"""
+        body_path, meta_path = self._files(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return meta, body
+
+    def is_fresh(self, meta: Dict[str, Any]) -> bool:
+        return time.time() - meta.get('stored_at', 0) < self.ttl
+
+    @staticmethod
+    def conditional_headers(meta: Dict[str, Any]) -> Dict[str, str]:
+        """重新驗證用的條件 header"""
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    # ========== 寫入 ==========
+
+    def store(self, key: str, response) -> bool:
+        """儲存 200 回應 (Cache-Control: no-store 除外)，回傳是否已儲存"""
+        if response.status_code != 200:
+            return False
+        if 'no-store' in response.headers.get('Cache-Control', '').lower():
+            return False
+
+        body = response.content
+        meta = {
+            'url': response.url,
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() not in _DROP_HEADERS},
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'stored_at': time.time(),
+        }
+        self._write(key, meta, body)
+        with self._lock:
+            self.stats['stored'] += 1
+        return True
+
+    def refresh(self, key: str, meta: Dict[str, Any], body: bytes):
+        """304：更新儲存時間，沿用原內容"""
+        meta['stored_at'] = time.time()
+        self._write(key, meta, body)
+
+    def _write(self, key: str, meta: Dict[str, Any], body: bytes):
+        body_path, meta_path = self._files(key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        for path, data, mode in ((body_path, body, 'wb'),
+                                 (meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'), 'wb')):
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, mode) as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        with self._lock:
+            self._bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(body)
+            self._bytes += len(body)
+            self._evict()
+
+    def touch(self, key: str, size: int):
+        """標記為最近使用 (LRU)"""
+        try:
+            os.utime(self._files(key)[0])
+        except OSError:
+            pass
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            self.stats['saved_bytes'] += size
+
+    def count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    # ========== 回應 ==========
+
+    @staticmethod
+    def build_response(meta: Dict[str, Any], body: bytes, request, connection=None) -> Response:
+        """由快取內容組出 requests.Response"""
+        response = Response()
+        response.status_code = meta['status']
+        response.reason = meta.get('reason') or 'OK'
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response._content = body
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = connection
+        return response
+
+    def clear(self):
+        """刪除所有快取項目"""
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        for key in keys:
+            for path in self._files(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得統計資訊"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['mb'] = round(self._bytes / 1024 / 1024, 2)
+        lookups = stats['hits'] + stats['misses'] + stats['revalidated']
+        stats['hit_rate'] = round((stats['hits'] + stats['revalidated']) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+# ========== 管理 ==========
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str, ttl: Optional[float], **kwargs) -> Optional[ResponseCache]:
+    """
+    取得 (建立) 模組的回應快取
+
+    Args:
+        name: 名稱，相同名稱共用同一個快取
+        ttl: 快取有效秒數，None / 0 表示不使用快取 (回傳 None)
+        kwargs: 第一次建立時傳給 ResponseCache 的參數 (root, urls, max_mb)
+
+    Returns:
+        ResponseCache，停用時 None (可直接傳給 new_session / get_session)
+    """
+    if not ttl:
+        return None
+    cache = _caches.get(name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(name)
+            if cache is None:
+                cache = _caches[name] = ResponseCache(name, ttl, **kwargs)
+    return cache
+
+
+def http_cache_stats() -> Dict[str, Any]:
+    """所有快取的統計 (供 logger.task_end 使用)"""
+    return {name: cache.get_stats() for name, cache in list(_caches.items())}
+
+
+CrawlabLogger.register_stats_provider('http_cache', http_cache_stats)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Key Index Module
+本地持久化去重索引 - 取代每次執行全表 SELECT DISTINCT + list 逐一比對
+
+Features:
+- SQLite 檔案保存已知 key 與同步水位 (watermark)，重新執行時不需全表掃描
+- 以 watermark (例如 entrydate) 增量同步 DB 新增的 key
+- 記憶體 set 查詢 O(1)
+- 本次執行新寫入的 key 可即時加入索引
+- 命中率、索引大小、同步筆數等統計於 logger.task_end 時自動併入 CrawlabLogger stats
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from .logger import CrawlabLogger
+
+# watermark 統一存成與各模組 toSQL 相同的字串格式，SQL Server 可直接比較
+WATERMARK_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+def _as_watermark(value: Any) -> Optional[str]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.strftime(WATERMARK_FORMAT)
+    return str(value)
+
+
+# ========== 去重索引 ==========
+
+class KeyIndex:
+    """
+    本地持久化 key 索引
+
+    Usage:
+        from common.keyindex import KeyIndex
+
+        index = KeyIndex('./data/existing_pdfs.sqlite', name='court_auction_pdfs')
+
+        # fetch(since) 回傳 (key, watermark) 清單；since 為 None 時表示首次全量同步
+        index.sync(lambda since: get_existing_pdfs(server, username, password,
+                                                    database, totb, since))
+
+        if pdf_filename in index:
+            ...                         # 已存在，跳過
+        index.add(pdf_filename)         # 寫入 DB 後加入索引
+    """
+
+    def __init__(self, path: str, name: Optional[str] = None):
+        """
+        Args:
+            path: SQLite 檔案路徑 (目錄不存在時自動建立)
+            name: 名稱 (統計用，預設為檔名)
+        """
+        self.path = path
+        self.name = name or os.path.splitext(os.path.basename(path))[0]
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+        CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+        """)
+
+        self._keys: Set[str] = {r[0] for r in self._conn.execute("SELECT key FROM keys")}
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'watermark'").fetchone()
+        self.watermark: Optional[str] = row[0] if row else None
+
+        self.stats: Dict[str, Any] = {
+            'loaded': len(self._keys),
+            'synced': 0,
+            'sync_seconds': 0.0,
+            'added': 0,
+            'lookups': 0,
+            'hits': 0,
+        }
+
+        with _indexes_lock:
+            _indexes[self.name] = self
+
+    def sync(self, fetch: Callable[[Optional[str]], Iterable[Tuple[str, Any]]]) -> int:
+        """
+        增量同步
+
+        Args:
+            fetch: fetch(since) 回傳 since 之後 (含) 的 (key, watermark)；
+                   since 為 None 時應回傳全部
+
+        Returns:
+            新加入索引的 key 數
+        """
+        start = time.monotonic()
+        watermark = self.watermark
+        new_keys = []
+        for key, mark in fetch(self.watermark):
+            if key not in self._keys:
+                new_keys.append(key)
+            mark = _as_watermark(mark)
+            if mark is not None and (watermark is None or mark > watermark):
+                watermark = mark
+
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO keys (key) VALUES (?)",
+                                   ((k,) for k in new_keys))
+            if watermark is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('watermark', ?)",
+                    (watermark,))
+            self._conn.commit()
+            self._keys.update(new_keys)
+            self.watermark = watermark
+            self.stats['synced'] += len(new_keys)
+            self.stats['sync_seconds'] += time.monotonic() - start
+        return len(new_keys)
+
+    def add(self, key: str):
+        """加入 key (寫入 DB 成功後呼叫)"""
+        with self._lock:
+            if key in self._keys:
+                return
+            self._keys.add(key)
+            self._conn.execute("INSERT OR IGNORE INTO keys (key) VALUES (?)", (key,))
+            self._conn.commit()
+            self.stats['added'] += 1
+
+    def rebuild(self):
+        """清空索引與 watermark，下次 sync 重新全量同步 (例如 DB 資料被刪除後)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM keys")
+            self._conn.execute("DELETE FROM meta WHERE name = 'watermark'")
+            self._conn.commit()
+            self._keys.clear()
+            self.watermark = None
+
+    def __contains__(self, key: str) -> bool:
+        # add() 會在背景寫入執行緒 (on_success) 呼叫，查詢與統計同樣持鎖
+        with self._lock:
+            hit = key in self._keys
+            self.stats['lookups'] += 1
+            if hit:
+                self.stats['hits'] += 1
+        return hit
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def close(self):
+        """關閉 SQLite 連線"""
+        with self._lock:
+            self._conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得統計資訊"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._keys)
+        stats['hit_rate'] = round(stats['hits'] / stats['lookups'], 4) if stats['lookups'] else 0.0
+        stats['sync_seconds'] = round(stats['sync_seconds'], 3)
+        stats['watermark'] = self.watermark
+        return stats
+
+
+# ========== 統計 ==========
+
+_indexes: Dict[str, KeyIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def index_stats() -> Dict[str, Any]:
+    """彙整所有索引統計 (供 logger.task_end 使用)"""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    return {i.name: i.get_stats() for i in indexes}
+
+
+CrawlabLogger.register_stats_provider('key_index', index_stats)
@@ -12,19 +12,48 @@ Features:
 - 錯誤上下文記錄
 - 重試機制追蹤
 - 統計資訊彙整
+- 錯誤彙整：依 (例外類型, 程式位置, 操作) 分組計數，只保留一份範例 stack trace 與固定長度的最近錯誤，記憶體不隨錯誤數成長
 - 檔案 + Console 雙輸出
 - JSON 格式 Log (可選)
+- 選用的背景寫入模式 (QueueHandler / QueueListener)：格式化與磁碟 / stdout 寫入移到背景執行緒
+- 巢狀 span 追蹤 (common.tracing)：logger.span() / @logger.trace() 記錄 wall / CPU time，task_end 輸出 Chrome trace 或 speedscope
+- 延遲直方圖與吞吐量 (common.metrics)：HTTP / 資料庫 / OCR 延遲與 records/s，task_end 輸出 Prometheus 文字檔與 JSON
+- 未啟用的層級幾乎零成本：先檢查 isEnabledFor，訊息 / 請求回應內容可傳入 callable 延遲計算
 """
 
 import logging
+import logging.handlers
 import sys
 import os
 import traceback
 import json
 import datetime
-from functools import wraps
+import atexit
+import queue
+import threading
+import time
+import sysconfig
+from collections import deque
+from functools import lru_cache, wraps
 from typing import Any, Dict, Optional, Union, Callable
 from pathlib import Path
+from urllib.parse import urlsplit
+
+from .metrics import METRICS_ENV, Metrics
+from .tracing import FORMATS, TRACE_DIR_ENV, TRACE_FORMAT_ENV, Tracer, sample_rate_from_env
+
+
+LOG_ASYNC_ENV = 'CRAWLAB_LOG_ASYNC'
+
+
+@lru_cache(maxsize=256)
+def _url_host(url: str) -> str:
+    return (urlsplit(url).hostname or '').lower() if url else ''
+
+
+def _resolve(value: Any) -> Any:
+    """延遲計算的參數：callable 於實際需要時才呼叫"""
+    return value() if callable(value) else value
 
 
 class ErrorContext:
@@ -35,8 +64,10 @@ class ErrorContext:
         self.current_data: Dict[str, Any] = {}
         self.retry_count: int = 0
         self.max_retries: int = 0
-        self.request_info: Dict[str, Any] = {}
-        self.response_info: Dict[str, Any] = {}
+        self._request_info: Dict[str, Any] = {}
+        self._response_info: Dict[str, Any] = {}
+        self._pending_request: Optional[tuple] = None
+        self._pending_response: Optional[tuple] = None
         self.db_info: Dict[str, Any] = {}
         self.progress: Dict[str, Any] = {}
 
@@ -55,23 +86,58 @@ class ErrorContext:
 
     def set_request(self, method: str = "", url: str = "",
                     headers: Dict = None, body: Any = None):
-        """設定 HTTP 請求資訊"""
-        self.request_info = {
-            'method': method,
-            'url': url,
-            'headers': self._safe_headers(headers),
-            'body': self._truncate(body, 2000)
-        }
+        """設定 HTTP 請求資訊 (headers / body 可為 callable，於讀取 request_info 時才計算)"""
+        self._pending_request = (method, url, headers, body)
+        self._request_info = {}
 
     def set_response(self, status_code: int = 0, headers: Dict = None,
                      body: Any = None, elapsed: float = 0):
-        """設定 HTTP 回應資訊"""
-        self.response_info = {
-            'status_code': status_code,
-            'headers': self._safe_headers(headers),
-            'body': self._truncate(body, 2000),
-            'elapsed_seconds': elapsed
-        }
+        """設定 HTTP 回應資訊 (headers / body 可為 callable，於讀取 response_info 時才計算)"""
+        self._pending_response = (status_code, headers, body, elapsed)
+        self._response_info = {}
+
+    @property
+    def request_url(self) -> str:
+        """目前請求的 URL (不觸發延遲計算)"""
+        if self._pending_request is not None:
+            return self._pending_request[1]
+        return self._request_info.get('url', '')
+
+    @property
+    def request_info(self) -> Dict[str, Any]:
+        if self._pending_request is not None:
+            method, url, headers, body = self._pending_request
+            self._pending_request = None
+            self._request_info = {
+                'method': method,
+                'url': url,
+                'headers': self._safe_headers(headers),
+                'body': self._truncate(body, 2000)
+            }
+        return self._request_info
+
+    @request_info.setter
+    def request_info(self, value: Dict[str, Any]):
+        self._pending_request = None
+        self._request_info = value
+
+    @property
+    def response_info(self) -> Dict[str, Any]:
+        if self._pending_response is not None:
+            status_code, headers, body, elapsed = self._pending_response
+            self._pending_response = None
+            self._response_info = {
+                'status_code': status_code,
+                'headers': self._safe_headers(headers),
+                'body': self._truncate(body, 2000),
+                'elapsed_seconds': elapsed
+            }
+        return self._response_info
+
+    @response_info.setter
+    def response_info(self, value: Dict[str, Any]):
+        self._pending_response = None
+        self._response_info = value
 
     def set_db(self, server: str = "", database: str = "",
                table: str = "", operation: str = "", rows: int = 0):
@@ -95,6 +161,7 @@ class ErrorContext:
 
     def _safe_headers(self, headers: Dict) -> Dict:
         """過濾敏感 header 資訊"""
+        headers = _resolve(headers)
         if not headers:
             return {}
         sensitive_keys = ['authorization', 'cookie', 'set-cookie', 'x-api-key', 'password']
@@ -105,6 +172,7 @@ class ErrorContext:
 
     def _truncate(self, data: Any, max_len: int) -> str:
         """截斷過長的資料"""
+        data = _resolve(data)
         if data is None:
             return ""
         text = str(data)
@@ -132,6 +200,150 @@ class ErrorContext:
         self.__init__()
 
 
+_LIBRARY_PATHS = tuple(p for p in {sysconfig.get_paths().get('stdlib'), sysconfig.get_paths().get('purelib'),
+                                    sysconfig.get_paths().get('platlib')} if p)
+
+
+def _error_location(error: Optional[BaseException] = None, depth: int = 2) -> str:
+    """
+    錯誤發生的程式位置 (檔名:行號 函數)
+
+    取 traceback 中最內層的專案程式碼 (略過標準函式庫與 site-packages)，
+    例外沒有 traceback 時 (未 raise 過) 改用呼叫端位置
+    """
+    frames = traceback.extract_tb(error.__traceback__) if error is not None and error.__traceback__ else []
+    if not frames:
+        frames = traceback.extract_stack(sys._getframe(depth), limit=1)
+    frame = next((f for f in reversed(frames) if not f.filename.startswith(_LIBRARY_PATHS)), frames[-1])
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+
+
+class ErrorAggregator:
+    """
+    錯誤彙整 - 取代不斷累積的 stats['errors'] 清單
+
+    - 依 (例外類型, 程式位置, 操作) 分組：次數、第一次 / 最後一次時間、最後一則訊息、第一次的完整範例
+    - 最近 recent 筆錯誤 (只有類型、訊息、位置與時間) 放在固定長度的 ring buffer
+    - 分組數上限 max_groups，超過的只計入 overflow
+
+    Usage:
+        errors = ErrorAggregator()
+        errors.add('TimeoutError', 'read timed out', 'etl_func.py:42 fetch', 'scrape_page',
+                   sample=lambda: {'stack_trace': traceback.format_exc()})
+        errors.summary()
+    """
+
+    def __init__(self, recent: int = 50, max_groups: int = 100, max_text: int = 4000):
+        self.max_groups = max_groups
+        self.max_text = max_text
+        self.total = 0
+        self.overflow = 0
+        self.groups: Dict[tuple, Dict[str, Any]] = {}
+        self.recent: deque = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def add(self, error_type: str, message: str, location: str = '', operation: str = '',
+            sample: Union[Dict[str, Any], Callable[[], Dict[str, Any]], None] = None):
+        """
+        記錄一次錯誤
+
+        sample 可傳入 callable，只有該分組第一次出現時才計算 (stack trace / 上下文快照)
+        """
+        now = datetime.datetime.now().isoformat()
+        message = str(message)[:500]
+        key = (error_type, location, operation)
+        with self._lock:
+            self.total += 1
+            self.recent.append({'timestamp': now, 'type': error_type, 'message': message,
+                                'location': location, 'operation': operation})
+            group = self.groups.get(key)
+            if group is not None:
+                group['count'] += 1
+                group['last_seen'] = now
+                group['last_message'] = message
+                return
+            if len(self.groups) >= self.max_groups:
+                self.overflow += 1
+                return
+            self.groups[key] = group = {
+                'type': error_type,
+                'location': location,
+                'operation': operation,
+                'count': 1,
+                'first_seen': now,
+                'last_seen': now,
+                'last_message': message,
+                'sample': None,
+            }
+        # 範例在鎖外計算 (可能需要解析延遲的請求 / 回應內容)
+        group['sample'] = self._truncate(_resolve(sample)) if sample is not None else None
+
+    def _truncate(self, value: Any) -> Any:
+        if isinstance(value, str):
+            return value if len(value) <= self.max_text else value[:self.max_text] + '...(truncated)'
+        if isinstance(value, dict):
+            return {k: self._truncate(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._truncate(v) for v in value]
+        return value
+
+    def __len__(self) -> int:
+        return self.total
+
+    def summary(self) -> Dict[str, Any]:
+        """彙整結果 (分組依次數由多到少)"""
+        with self._lock:
+            groups = sorted((dict(g) for g in self.groups.values()), key=lambda g: -g['count'])
+            return {
+                'total': self.total,
+                'groups': groups,
+                'recent': list(self.recent),
+                'overflow': self.overflow,
+            }
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    有界佇列 handler - 呼叫端只放入佇列，格式化與寫入由 QueueListener 背景執行緒處理
+
+    佇列已滿時:
+    - overflow='drop': INFO 以下丟棄並計數，WARNING 以上最多等待 block_timeout 秒 (錯誤不輕易遺失)
+    - overflow='block': 所有層級都等待
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = 'drop', block_timeout: float = 5.0):
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._lock_stats = threading.Lock()
+        self.dropped = 0
+        self.max_depth = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只合併訊息參數；時間格式、JSON 序列化留給背景執行緒
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow != 'block' and record.levelno < logging.WARNING:
+                with self._lock_stats:
+                    self.dropped += 1
+                return
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+            except queue.Full:
+                with self._lock_stats:
+                    self.dropped += 1
+                return
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+
 class CrawlabLogger:
     """
     Crawlab 統一 Logger
@@ -175,9 +387,10 @@ class CrawlabLogger:
     """
 
     _instances: Dict[str, 'CrawlabLogger'] = {}
+    _stats_providers: Dict[str, Callable[[], Optional[Dict[str, Any]]]] = {}
+    _task_end_hooks: Dict[str, Callable[[], Any]] = {}
 
-    def __new__(cls, module_name: str, log_dir: str = None,
-                json_format: bool = False, debug: bool = False):
+    def __new__(cls, module_name: str, *args, **kwargs):
         """單例模式 - 每個模組只有一個 logger 實例"""
         if module_name not in cls._instances:
             instance = super().__new__(cls)
@@ -185,7 +398,9 @@ class CrawlabLogger:
         return cls._instances[module_name]
 
     def __init__(self, module_name: str, log_dir: str = None,
-                 json_format: bool = False, debug: bool = False):
+                 json_format: bool = False, debug: bool = False,
+                 async_mode: Optional[bool] = None, queue_size: int = 10000,
+                 overflow: str = 'drop'):
         """
         初始化 Logger
 
@@ -194,6 +409,9 @@ class CrawlabLogger:
             log_dir: Log 檔案存放目錄 (預設為模組目錄下的 logs/)
             json_format: 是否使用 JSON 格式輸出
             debug: 是否啟用 DEBUG 模式
+            async_mode: 背景寫入模式 (None 時依 CRAWLAB_LOG_ASYNC 環境變數)
+            queue_size: 背景寫入佇列上限
+            overflow: 佇列已滿時的處理方式 ('drop' 丟棄 INFO 以下 / 'block' 等待)
         """
         if hasattr(self, '_initialized'):
             return
@@ -204,6 +422,12 @@ class CrawlabLogger:
         self.ctx = ErrorContext()
         self.start_time: Optional[datetime.datetime] = None
         self.stats: Dict[str, Any] = {}
+        self._stats_lock = threading.Lock()
+        self.metrics = Metrics()
+        self.errors = ErrorAggregator()
+        self._last_progress = 0
+        self.tracer = Tracer(sample_rate_from_env())
+        self.trace_format = os.environ.get(TRACE_FORMAT_ENV, 'chrome').lower()
 
         # 設定 Log 目錄
         if log_dir:
@@ -247,37 +471,63 @@ class CrawlabLogger:
         file_handler.setFormatter(formatter)
         error_handler.setFormatter(formatter)
 
-        self.logger.addHandler(console_handler)
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(error_handler)
+        self._handlers = [console_handler, file_handler, error_handler]
+        self._queue_handler: Optional[BoundedQueueHandler] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+
+        if async_mode is None:
+            async_mode = os.environ.get(LOG_ASYNC_ENV, '').lower() in ('1', 'true', 'yes')
+        if async_mode:
+            # 呼叫端只放入佇列，stdout 為 pipe 或磁碟緩慢時不會卡住爬取
+            log_queue: queue.Queue = queue.Queue(queue_size)
+            self._queue_handler = BoundedQueueHandler(log_queue, overflow)
+            self._listener = logging.handlers.QueueListener(
+                log_queue, *self._handlers, respect_handler_level=True)
+            self._listener.start()
+            self.logger.addHandler(self._queue_handler)
+            atexit.register(self.close)
+        else:
+            for handler in self._handlers:
+                self.logger.addHandler(handler)
 
     # ========== 基本 Log 方法 ==========
 
-    def debug(self, msg: str, **kwargs):
+    def debug(self, msg: Union[str, Callable[[], str]], **kwargs):
         """DEBUG 級別 Log"""
         self._log(logging.DEBUG, msg, **kwargs)
 
-    def info(self, msg: str, **kwargs):
+    def info(self, msg: Union[str, Callable[[], str]], **kwargs):
         """INFO 級別 Log"""
         self._log(logging.INFO, msg, **kwargs)
 
-    def warning(self, msg: str, **kwargs):
+    def warning(self, msg: Union[str, Callable[[], str]], **kwargs):
         """WARNING 級別 Log"""
         self._log(logging.WARNING, msg, **kwargs)
 
-    def error(self, msg: str, **kwargs):
+    def error(self, msg: Union[str, Callable[[], str]], **kwargs):
         """ERROR 級別 Log"""
         self._log(logging.ERROR, msg, **kwargs)
 
-    def critical(self, msg: str, **kwargs):
+    def critical(self, msg: Union[str, Callable[[], str]], **kwargs):
         """CRITICAL 級別 Log"""
         self._log(logging.CRITICAL, msg, **kwargs)
 
-    def _log(self, level: int, msg: str, **kwargs):
-        """內部 Log 方法"""
-        extra = {'context': self.ctx.to_dict(), **kwargs}
+    def isEnabledFor(self, level: int) -> bool:
+        """該層級是否會輸出 (呼叫端組裝昂貴訊息前先檢查)"""
+        return self.logger.isEnabledFor(level)
+
+    def _log(self, level: int, msg: Union[str, Callable[[], str]], **kwargs):
+        """
+        內部 Log 方法
+
+        未啟用的層級直接返回；msg 可為 callable (例如 lambda: f"...")，只在實際輸出時才組字串
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        msg = _resolve(msg)
 
         if self.json_format:
+            extra = {'context': self.ctx.to_dict(), **kwargs}
             self.logger.log(level, msg, extra={'extra_data': extra})
         else:
             # 如果有額外資訊，附加在訊息後面
@@ -286,18 +536,62 @@ class CrawlabLogger:
                 msg = f'{msg} | {extra_str}'
             self.logger.log(level, msg)
 
+    # ========== 背景寫入 ==========
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        等待背景佇列寫完 (同步模式直接 flush handlers)
+
+        Returns:
+            是否在 timeout 內寫完
+        """
+        if self._listener is not None:
+            log_queue = self._queue_handler.queue
+            deadline = time.monotonic() + timeout
+            while log_queue.unfinished_tasks and time.monotonic() < deadline:
+                time.sleep(0.005)
+            if log_queue.unfinished_tasks:
+                return False
+        for handler in self._handlers:
+            handler.flush()
+        return True
+
+    def close(self):
+        """停止背景寫入 (寫完佇列內容)，之後改回同步寫入"""
+        if self._listener is None:
+            return
+        listener, self._listener = self._listener, None
+        listener.stop()
+        self.logger.removeHandler(self._queue_handler)
+        for handler in self._handlers:
+            self.logger.addHandler(handler)
+            handler.flush()
+
+    def queue_stats(self) -> Dict[str, Any]:
+        """背景寫入佇列統計 (同步模式為空)"""
+        if self._queue_handler is None:
+            return {}
+        return {
+            'queue_size': self._queue_handler.queue.maxsize,
+            'max_depth': self._queue_handler.max_depth,
+            'dropped': self._queue_handler.dropped,
+        }
+
     # ========== 任務生命週期 ==========
 
     def task_start(self, task_name: str = None):
         """記錄任務開始"""
         self.start_time = datetime.datetime.now()
+        self.metrics = Metrics()
+        self.errors = ErrorAggregator()
+        self._last_progress = 0
+        self.tracer.reset()
         self.stats = {
             'task_name': task_name or self.module_name,
             'start_time': self.start_time.isoformat(),
             'records_processed': 0,
             'records_success': 0,
-            'records_failed': 0,
-            'errors': []
+            'records_failed': 0
         }
         self.info(f"{'='*60}")
         self.info(f"任務開始: {task_name or self.module_name}")
@@ -306,6 +600,9 @@ class CrawlabLogger:
 
     def task_end(self, success: bool = True):
         """記錄任務結束"""
+        self._run_task_end_hooks()
+        self.flush()        # 先清空背景佇列，摘要不會因佇列已滿被丟棄
+
         end_time = datetime.datetime.now()
         duration = (end_time - self.start_time).total_seconds() if self.start_time else 0
 
@@ -323,10 +620,25 @@ class CrawlabLogger:
             self.info(f"成功筆數: {self.stats['records_success']}")
             self.info(f"失敗筆數: {self.stats['records_failed']}")
 
-        if self.stats.get('errors'):
-            self.warning(f"錯誤總數: {len(self.stats['errors'])}")
+        if self.errors.total:
+            self.stats['errors'] = self.errors.summary()
+            self.warning(f"錯誤總數: {self.errors.total} ({len(self.stats['errors']['groups'])} 類)")
+            for group in self.stats['errors']['groups'][:5]:
+                self.warning(f"  {group['count']}x {group['type']} @ {group['location']}"
+                             + (f" [{group['operation']}]" if group['operation'] else "")
+                             + f": {group['last_message'][:200]}")
+
+        self._collect_provider_stats()
+
+        self._write_metrics(duration, success)
+        self._write_trace()
+
+        if self._queue_handler is not None:
+            self.stats['log_queue'] = self.queue_stats()
+            self.info(f"log_queue: " + ', '.join(f'{k}={v}' for k, v in self.stats['log_queue'].items()))
 
         self.info(f"{'='*60}")
+        self.flush()
 
         return self.stats
 
@@ -334,18 +646,33 @@ class CrawlabLogger:
 
     def log_request(self, method: str, url: str,
                     headers: Dict = None, body: Any = None):
-        """記錄 HTTP 請求"""
+        """
+        記錄 HTTP 請求
+
+        headers / body 可傳入 callable，DEBUG 未啟用時不會計算 (發生錯誤時仍可由 ctx 取得)
+        """
         self.ctx.set_request(method, url, headers, body)
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
         self.debug(f"HTTP 請求: {method} {url}")
-        if body and self.logger.level == logging.DEBUG:
+        if body:
             self.debug(f"請求內容: {self.ctx.request_info['body']}")
 
     def log_response(self, status_code: int, headers: Dict = None,
                      body: Any = None, elapsed: float = 0):
-        """記錄 HTTP 回應"""
+        """
+        記錄 HTTP 回應
+
+        headers / body 可傳入 callable (例如 lambda r=response: r.text[:500])，
+        只有回應異常或發生錯誤需要上下文時才計算；以預設參數綁定 response，避免變數之後被重新指定
+        """
         self.ctx.set_response(status_code, headers, body, elapsed)
 
+        self.metrics.observe_http(_url_host(self.ctx.request_url), status_code, elapsed)
+
         level = logging.DEBUG if 200 <= status_code < 300 else logging.WARNING
+        if not self.logger.isEnabledFor(level):
+            return
         self.logger.log(level,
             f"HTTP 回應: {status_code} | 耗時: {elapsed:.3f}s")
 
@@ -355,14 +682,13 @@ class CrawlabLogger:
 
     def log_http_error(self, error: Exception, url: str, retry: int = 0):
         """記錄 HTTP 錯誤"""
-        error_info = {
-            'type': type(error).__name__,
-            'message': str(error),
-            'url': url,
-            'retry': retry,
-            'request': self.ctx.request_info,
-            'response': self.ctx.response_info
-        }
+        self.errors.add(type(error).__name__, error, _error_location(error), self.ctx.current_operation,
+                        sample=lambda: {
+                            'url': url,
+                            'retry': retry,
+                            'request': self.ctx.request_info,
+                            'response': self.ctx.response_info
+                        })
 
         self.error(f"HTTP 錯誤: {type(error).__name__}: {error}")
         self.error(f"請求 URL: {url}")
@@ -375,8 +701,6 @@ class CrawlabLogger:
             self.error(f"回應狀態: {self.ctx.response_info.get('status_code', 'N/A')}")
             self.error(f"回應內容: {self.ctx.response_info.get('body', '')}")
 
-        self.stats.setdefault('errors', []).append(error_info)
-
     # ========== 資料庫追蹤 ==========
 
     def log_db_connect(self, server: str, database: str, user: str = None):
@@ -386,22 +710,28 @@ class CrawlabLogger:
                   (f" (user: {user})" if user else ""))
 
     def log_db_operation(self, operation: str, database: str,
-                         table: str, rows: int = 0):
-        """記錄資料庫操作"""
+                         table: str, rows: int = 0, elapsed: float = None):
+        """
+        記錄資料庫操作
+
+        elapsed (秒) 有值時計入該資料表的延遲直方圖
+        """
         self.ctx.set_db(database=database, table=table,
                         operation=operation, rows=rows)
-        self.info(f"資料庫 {operation}: {database}.{table} | 影響筆數: {rows}")
+        self.metrics.inc('db_rows_total', rows, table=table, operation=operation)
+        if elapsed is not None:
+            self.metrics.observe('db_operation_duration_seconds', elapsed, table=table, operation=operation)
+        self.info(lambda: f"資料庫 {operation}: {database}.{table} | 影響筆數: {rows}" +
+                  (f" | 耗時: {elapsed:.3f}s" if elapsed is not None else ""))
 
     def log_db_error(self, error: Exception, operation: str = "",
                      sql: str = None):
         """記錄資料庫錯誤"""
-        error_info = {
-            'type': type(error).__name__,
-            'message': str(error),
-            'operation': operation,
-            'db_info': self.ctx.db_info,
-            'sql': sql[:500] if sql else None  # 截斷過長的 SQL
-        }
+        self.errors.add(type(error).__name__, error, _error_location(error), operation or self.ctx.current_operation,
+                        sample={
+                            'db_info': dict(self.ctx.db_info),
+                            'sql': sql[:500] if sql else None  # 截斷過長的 SQL
+                        })
 
         self.error(f"資料庫錯誤: {type(error).__name__}: {error}")
         self.error(f"操作類型: {operation}")
@@ -413,13 +743,13 @@ class CrawlabLogger:
         if sql:
             self.error(f"SQL 語句: {sql[:500]}")
 
-        self.stats.setdefault('errors', []).append(error_info)
-
     # ========== 進度追蹤 ==========
 
     def log_progress(self, current: int, total: int, item: str = ""):
         """記錄處理進度"""
         self.ctx.set_progress(current, total, item)
+        self.metrics.add_records(current - self._last_progress if current > self._last_progress else 1)
+        self._last_progress = current
         percentage = current / total * 100 if total > 0 else 0
 
         # 每 10% 或特定筆數輸出一次進度
@@ -432,6 +762,7 @@ class CrawlabLogger:
         """記錄批次處理結果"""
         self.info(f"批次 {batch_num}: 大小={batch_size} | "
                  f"成功={success} | 失敗={failed}")
+        self.metrics.add_records(batch_size)
 
         self.stats['records_processed'] = self.stats.get('records_processed', 0) + batch_size
         self.stats['records_success'] = self.stats.get('records_success', 0) + success
@@ -449,12 +780,8 @@ class CrawlabLogger:
     def log_retry_exhausted(self, operation: str, attempts: int):
         """記錄重試耗盡"""
         self.error(f"重試耗盡: {operation} | 已嘗試 {attempts} 次")
-        self.stats.setdefault('errors', []).append({
-            'type': 'RetryExhausted',
-            'operation': operation,
-            'attempts': attempts,
-            'context': self.ctx.to_dict()
-        })
+        self.errors.add('RetryExhausted', f"{operation}: {attempts} attempts", _error_location(), operation,
+                        sample=lambda: {'attempts': attempts, 'context': self.ctx.to_dict()})
 
     # ========== 例外追蹤 ==========
 
@@ -468,52 +795,50 @@ class CrawlabLogger:
             message: 額外說明訊息
             include_locals: 是否包含區域變數 (僅 DEBUG 模式)
         """
-        error_info = {
-            'type': type(error).__name__,
-            'message': str(error),
-            'description': message,
-            'stack_trace': traceback.format_exc(),
-            'context': self.ctx.to_dict(),
-            'timestamp': datetime.datetime.now().isoformat()
-        }
-
-        self.error(f"{'='*60}")
-        self.error(f"例外發生: {type(error).__name__}")
+        stack_trace = traceback.format_exc()
+        self.errors.add(type(error).__name__, error, _error_location(error), self.ctx.current_operation,
+                        sample=lambda: {
+                            'description': message,
+                            'stack_trace': stack_trace,
+                            'context': self.ctx.to_dict()
+                        })
+
+        # 整段輸出為一筆多行記錄：背景佇列滿載時每個例外只等待一次
+        lines = [
+            '=' * 60,
+            f"例外發生: {type(error).__name__}",
+        ]
         if message:
-            self.error(f"說明: {message}")
-        self.error(f"錯誤訊息: {error}")
-        self.error(f"----- Stack Trace -----")
-
-        # 輸出 stack trace (每行分開)
-        for line in traceback.format_exc().strip().split('\n'):
-            self.error(line)
-
-        self.error(f"----- 錯誤上下文 -----")
+            lines.append(f"說明: {message}")
+        lines.append(f"錯誤訊息: {error}")
+        lines.append("----- Stack Trace -----")
+        lines.extend(stack_trace.strip().split('\n'))
+        lines.append("----- 錯誤上下文 -----")
 
         if self.ctx.current_operation:
-            self.error(f"當前操作: {self.ctx.current_operation}")
+            lines.append(f"當前操作: {self.ctx.current_operation}")
 
         if self.ctx.current_data:
-            self.error(f"處理資料: {self.ctx.current_data}")
+            lines.append(f"處理資料: {self.ctx.current_data}")
 
         if self.ctx.progress:
-            self.error(f"處理進度: {self.ctx.progress}")
+            lines.append(f"處理進度: {self.ctx.progress}")
 
         if self.ctx.request_info:
-            self.error(f"HTTP 請求: {self.ctx.request_info.get('method')} "
-                      f"{self.ctx.request_info.get('url')}")
+            lines.append(f"HTTP 請求: {self.ctx.request_info.get('method')} "
+                         f"{self.ctx.request_info.get('url')}")
 
         if self.ctx.response_info:
-            self.error(f"HTTP 回應: {self.ctx.response_info.get('status_code')}")
+            lines.append(f"HTTP 回應: {self.ctx.response_info.get('status_code')}")
 
         if self.ctx.db_info:
-            self.error(f"資料庫操作: {self.ctx.db_info}")
+            lines.append(f"資料庫操作: {self.ctx.db_info}")
 
-        self.error(f"{'='*60}")
+        lines.append('=' * 60)
+        self.error('\n'.join(lines))
 
         # 記錄到統計
-        self.stats.setdefault('errors', []).append(error_info)
-        self.stats['records_failed'] = self.stats.get('records_failed', 0) + 1
+        self.increment('records_failed')
 
     # ========== 統計資訊 ==========
 
@@ -525,19 +850,108 @@ class CrawlabLogger:
         self.stats.update(stats)
 
     def increment(self, key: str, value: int = 1):
-        """遞增統計計數器"""
-        self.stats[key] = self.stats.get(key, 0) + value
+        """遞增統計計數器 (背景寫入的回呼也會呼叫，需加鎖)"""
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + value
 
     def get_stats(self) -> Dict[str, Any]:
-        """取得統計資訊"""
-        return self.stats.copy()
+        """取得統計資訊 (errors 為彙整結果)"""
+        stats = self.stats.copy()
+        if self.errors.total:
+            stats['errors'] = self.errors.summary()
+        return stats
+
+    def _write_metrics(self, duration: float, success: bool):
+        """輸出直方圖 / 吞吐量 (CRAWLAB_METRICS_DIR，預設 logs/metrics/)"""
+        self.metrics.set_gauge('task_duration_seconds', round(duration, 3))
+        self.metrics.set_gauge('task_success', 1 if success else 0)
+        summary = self.metrics.to_dict()
+        rate = summary.get('records_per_second')
+        if rate:
+            self.stats['records_per_second'] = rate[0]['value']
+            self.info(f"吞吐量: {rate[0]['value']} 筆/秒 (峰值 {summary['records_per_second_peak'][0]['value']})")
+        directory = os.environ.get(METRICS_ENV) or str(self.log_dir / 'metrics')
+        try:
+            self.stats['metrics_files'] = self.metrics.write(directory, self.module_name)
+        except OSError as e:
+            self.warning(f"指標檔案寫入失敗: {e}")
+
+    def _write_trace(self):
+        """輸出 span 追蹤檔 (CRAWLAB_TRACE_DIR，預設 logs/traces/) 並列出 self time 最多的步驟"""
+        if not self.tracer.enabled or not self.tracer.totals:
+            return
+        summary = self.tracer.summary()
+        self.stats['trace'] = summary
+        for span in summary['spans'][:5]:
+            self.info(f"span {span['name']}: {span['count']} 次 | wall={span['wall_s']}s "
+                      f"| cpu={span['cpu_s']}s | self={span['self_s']}s")
+
+        directory = os.environ.get(TRACE_DIR_ENV) or str(self.log_dir / 'traces')
+        suffix = '.speedscope.json' if self.trace_format == 'speedscope' else '.json'
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(directory, f'{self.module_name}_{stamp}{suffix}')
+        try:
+            summary['file'] = self.tracer.write(path, self.trace_format, self.module_name)
+            self.info(f"追蹤檔: {summary['file']}")
+        except (OSError, ValueError) as e:
+            self.warning(f"追蹤檔寫入失敗: {e}")
+
+    @classmethod
+    def register_stats_provider(cls, name: str,
+                                provider: Callable[[], Optional[Dict[str, Any]]]):
+        """
+        註冊統計提供者 - task_end 時呼叫並併入 stats[name]
+
+        供 common 內的共用元件 (例如連線池) 回報自身計數器，
+        provider 回傳 None 或空 dict 時略過。
+        """
+        cls._stats_providers[name] = provider
+
+    @classmethod
+    def register_task_end_hook(cls, name: str, hook: Callable[[], Any]):
+        """
+        註冊 task_end 掛勾 - 於計算執行時間與收集統計前呼叫
+
+        供 common 內的共用元件 (例如背景寫入) 在任務結束前完成待處理工作。
+        """
+        cls._task_end_hooks[name] = hook
+
+    def _run_task_end_hooks(self):
+        """執行所有 task_end 掛勾"""
+        for name, hook in self._task_end_hooks.items():
+            try:
+                hook()
+            except Exception as e:
+                self.warning(f"task_end 掛勾 {name} 執行失敗: {e}")
+
+    def _collect_provider_stats(self):
+        """收集所有統計提供者的資料"""
+        for name, provider in self._stats_providers.items():
+            try:
+                data = provider()
+            except Exception as e:
+                self.warning(f"統計提供者 {name} 執行失敗: {e}")
+                continue
+            if not data:
+                continue
+            self.stats[name] = data
+            self.info(f"{name}: " + ', '.join(f'{k}={v}' for k, v in data.items()))
 
     # ========== 驗證碼/OCR 追蹤 ==========
 
     def log_captcha_attempt(self, attempt: int, success: bool,
-                            result: str = ""):
-        """記錄驗證碼識別嘗試"""
+                            result: str = "", elapsed: float = None):
+        """
+        記錄驗證碼識別嘗試
+
+        elapsed (秒) 有值時計入 OCR 延遲直方圖；成功率一律計入
+        """
+        self.metrics.inc('ocr_attempts_total', result='success' if success else 'failure')
+        if elapsed is not None:
+            self.metrics.observe('ocr_duration_seconds', elapsed)
         level = logging.DEBUG if success else logging.WARNING
+        if not self.logger.isEnabledFor(level):
+            return
         self.logger.log(level,
             f"驗證碼識別: 第 {attempt} 次 | "
             f"{'成功' if success else '失敗'}" +
@@ -562,11 +976,50 @@ class CrawlabLogger:
             f"{'通過' if is_valid else '失敗'} | "
             f"期望: {expected} | 實際: {actual}")
 
+    # ========== Span 追蹤 ==========
+
+    def span(self, name: str, **args):
+        """
+        建立追蹤 span (context manager)；CRAWLAB_TRACE 未設定時為空操作
+
+        Usage:
+            with logger.span('pdf_download', url=pdf_url):
+                response = session.get(pdf_url)
+                with logger.span('pdf_parse') as span:
+                    rows = parse(response.content)
+                    span.set(rows=len(rows))
+        """
+        return self.tracer.span(name, **args)
+
+    def trace(self, name: Optional[str] = None) -> Callable:
+        """
+        追蹤 span 裝飾器
+
+        Usage:
+            @logger.trace('captcha')
+            def solve_captcha(page): ...
+        """
+        return self.tracer.trace(name)
+
+    def enable_tracing(self, sample_rate: float = 1.0, fmt: Optional[str] = None):
+        """
+        程式內啟用 span 追蹤 (等同設定 CRAWLAB_TRACE / CRAWLAB_TRACE_FORMAT)
+
+        Args:
+            sample_rate: 最外層 span 的取樣比例
+            fmt: 'chrome' 或 'speedscope'
+        """
+        if fmt is not None:
+            if fmt not in FORMATS:
+                raise ValueError(f"不支援的追蹤格式: {fmt} (可用: {', '.join(FORMATS)})")
+            self.trace_format = fmt
+        self.tracer.sample_rate = sample_rate
+
     # ========== 裝飾器 ==========
 
     def track_function(self, func: Callable) -> Callable:
         """
-        函數追蹤裝飾器 - 自動記錄函數執行
+        函數追蹤裝飾器 - 自動記錄函數執行 (同時建立同名 span)
 
         Usage:
             @logger.track_function
@@ -579,14 +1032,13 @@ class CrawlabLogger:
             self.debug(f"函數開始: {func_name}")
             self.ctx.set_operation(func_name)
 
-            start = datetime.datetime.now()
+            start = time.perf_counter()
             try:
-                result = func(*args, **kwargs)
-                elapsed = (datetime.datetime.now() - start).total_seconds()
-                self.debug(f"函數結束: {func_name} | 耗時: {elapsed:.3f}s")
+                with self.tracer.span(func_name):
+                    result = func(*args, **kwargs)
+                self.debug(lambda: f"函數結束: {func_name} | 耗時: {time.perf_counter() - start:.3f}s")
                 return result
             except Exception as e:
-                elapsed = (datetime.datetime.now() - start).total_seconds()
                 self.log_exception(e, f"函數 {func_name} 執行失敗")
                 raise
             finally:
@@ -652,6 +1104,12 @@ class JsonFormatter(logging.Formatter):
 
 # ========== 便利函數 ==========
 
+def flush_logs(timeout: float = 10.0):
+    """等待所有 logger 的背景佇列寫完 (例如輸出 JSON 結果到 stdout 之前)"""
+    for instance in list(CrawlabLogger._instances.values()):
+        instance.flush(timeout)
+
+
 def get_logger(module_name: str, **kwargs) -> CrawlabLogger:
     """
     取得 Logger 實例
@@ -662,6 +1120,8 @@ def get_logger(module_name: str, **kwargs) -> CrawlabLogger:
             - log_dir: Log 檔案目錄
             - json_format: 是否使用 JSON 格式
             - debug: 是否啟用 DEBUG 模式
+            - async_mode: 背景寫入模式 (預設依 CRAWLAB_LOG_ASYNC)
+            - queue_size / overflow: 背景寫入佇列上限與滿載處理方式
 
     Returns:
         CrawlabLogger 實例
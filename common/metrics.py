@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Metrics Module
+延遲直方圖與吞吐量統計 - 由 CrawlabLogger 的 log_response / log_db_operation / log_captcha_attempt /
+log_progress 自動收集，task_end 時輸出 Prometheus 文字檔與 JSON 摘要
+
+Features:
+- 固定 bucket 直方圖 (每次 observe 只做一次二分搜尋 + 計數)，p50 / p90 / p99 於輸出時由 bucket 估算
+- HTTP 延遲 (每個主機 × 狀態類別)、資料庫操作延遲 (每個資料表)、OCR 延遲與成功率
+- 最近 60 秒的滾動 records/s 與峰值
+- Prometheus text exposition format (node_exporter textfile collector / api_gateway /metrics 皆可直接使用)
+- 輸出目錄：CRAWLAB_METRICS_DIR，預設為模組 logs/metrics/
+- 僅使用標準函式庫 (api_gateway 可直接 import 合併多個模組的輸出)
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+METRICS_ENV = 'CRAWLAB_METRICS_DIR'
+PREFIX = 'crawlab'
+
+# 秒；涵蓋快取命中 (ms) 到政府網站逾時 (數十秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    'http_request_duration_seconds': 'HTTP response latency by host and status class',
+    'http_responses_total': 'HTTP responses by host and status class',
+    'db_operation_duration_seconds': 'Database operation latency by table and operation',
+    'db_rows_total': 'Rows affected by table and operation',
+    'ocr_duration_seconds': 'Captcha OCR latency',
+    'ocr_attempts_total': 'Captcha OCR attempts by result',
+    'records_total': 'Records processed',
+    'records_per_second': 'Records per second over the last rate window',
+    'records_per_second_peak': 'Peak rolling records per second',
+    'task_duration_seconds': 'Task wall-clock duration',
+    'task_success': 'Whether the last task succeeded (1) or failed (0)',
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    固定 bucket 直方圖 (不保存原始樣本，記憶體固定)
+
+    Usage:
+        hist = Histogram()
+        hist.observe(0.123)
+        hist.quantile(0.9)
+    """
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, bounds: Iterable[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)     # 最後一格為 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """由 bucket 線性內插估算百分位數 (落在 +Inf 的以最大值代替)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.bounds):
+                    return self.max
+                upper = self.bounds[i]
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+            if i < len(self.bounds):
+                lower = self.bounds[i]
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'avg_ms': round(self.sum * 1000 / self.count, 1) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 1),
+            'p90_ms': round(self.quantile(0.9) * 1000, 1),
+            'p99_ms': round(self.quantile(0.99) * 1000, 1),
+            'max_ms': round(self.max * 1000, 1),
+        }
+
+
+class RateWindow:
+    """滾動吞吐量 - 最近 window 秒內的事件數 / 秒，並記錄峰值"""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self.total = 0
+        self.peak = 0.0
+        self._events: deque = deque()      # (monotonic 秒, 數量)，每秒合併為一筆
+        self._in_window = 0
+        self._started = time.monotonic()
+
+    def add(self, n: int = 1):
+        now = time.monotonic()
+        second = int(now)
+        if self._events and self._events[-1][0] == second:
+            self._events[-1][1] += n
+        else:
+            self._events.append([second, n])
+            self._expire(now)
+            # 每秒更新一次峰值 (至少經過 1 秒才計算，避免開頭的瞬間值)
+            if now - self._started >= 1.0:
+                self.peak = max(self.peak, self.rate(now))
+        self.total += n
+        self._in_window += n
+
+    def _expire(self, now: float):
+        while self._events and self._events[0][0] <= now - self.window:
+            self._in_window -= self._events.popleft()[1]
+
+    def rate(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        span = min(self.window, max(now - self._started, 1e-9))
+        return self._in_window / span
+
+
+class Metrics:
+    """
+    單一任務的指標集合 (執行緒安全)
+
+    Usage:
+        metrics = Metrics()
+        metrics.observe_http('example.gov.tw', 200, 0.42)
+        metrics.observe('db_operation_duration_seconds', 0.015, table='wbt_x', operation='INSERT')
+        metrics.inc('db_rows_total', 100, table='wbt_x', operation='INSERT')
+        metrics.write('./logs/metrics', 'Data-Insurance')
+    """
+
+    def __init__(self, rate_window: float = 60.0):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.records = RateWindow(rate_window)
+        self._http: Dict[Tuple[str, int], list] = {}     # (host, status // 100) -> [回應數, Histogram]
+
+    # ========== 收集 ==========
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe_http(self, host: str, status_code: int, elapsed: float = 0):
+        """HTTP 回應 (每筆都會呼叫，不經 labels 排序的快速路徑；elapsed 為 0 時只計數)"""
+        key = (host, status_code // 100)
+        with self._lock:
+            series = self._http.get(key)
+            if series is None:
+                series = self._http[key] = [0, Histogram()]
+            series[0] += 1
+            if elapsed:
+                series[1].observe(elapsed)
+
+    def add_records(self, n: int = 1):
+        with self._lock:
+            self.records.add(n)
+
+    # ========== 輸出 ==========
+
+    def _snapshot(self):
+        with self._lock:
+            hists = {k: (h.bounds, list(h.counts), h.sum, h.count, h.summary())
+                     for k, h in self.histograms.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            for (host, klass), (count, hist) in self._http.items():
+                labels = (('host', host), ('status_class', status_class(klass * 100)))
+                counters[('http_responses_total', labels)] = count
+                if hist.count:
+                    hists[('http_request_duration_seconds', labels)] = (
+                        hist.bounds, list(hist.counts), hist.sum, hist.count, hist.summary())
+            if self.records.total:
+                gauges[('records_per_second', ())] = round(self.records.rate(), 3)
+                gauges[('records_per_second_peak', ())] = round(max(self.records.peak, self.records.rate()), 3)
+                counters[('records_total', ())] = self.records.total
+        return hists, counters, gauges
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON 摘要：{metric: [{labels..., count, avg_ms, p50_ms, ...}]}"""
+        hists, counters, gauges = self._snapshot()
+        data: Dict[str, Any] = {}
+        for (name, labels), (_, _, _, _, summary) in sorted(hists.items()):
+            data.setdefault(name, []).append(dict(labels, **summary))
+        for (name, labels), value in sorted(counters.items()):
+            data.setdefault(name, []).append(dict(labels, value=value))
+        for (name, labels), value in sorted(gauges.items()):
+            data.setdefault(name, []).append(dict(labels, value=value))
+        return data
+
+    def to_prometheus(self, **const_labels) -> str:
+        """Prometheus text exposition format；const_labels 加在每個樣本上 (例如 module=...)"""
+        hists, counters, gauges = self._snapshot()
+        families: Dict[str, Tuple[str, List[str]]] = {}
+
+        for (name, labels), (bounds, counts, total, count, _) in sorted(hists.items()):
+            metric = f'{PREFIX}_{name}'
+            lines = families.setdefault(metric, ('histogram', []))[1]
+            base = dict(const_labels, **dict(labels))
+            cumulative = 0
+            for bound, n in zip(bounds + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                lines.append(f'{metric}_bucket{_format_labels(dict(base, le=le))} {cumulative}')
+            lines.append(f'{metric}_sum{_format_labels(base)} {_format_value(total)}')
+            lines.append(f'{metric}_count{_format_labels(base)} {count}')
+
+        for kind, samples in (('counter', counters), ('gauge', gauges)):
+            for (name, labels), value in sorted(samples.items()):
+                metric = f'{PREFIX}_{name}'
+                lines = families.setdefault(metric, (kind, []))[1]
+                lines.append(f'{metric}{_format_labels(dict(const_labels, **dict(labels)))} {_format_value(value)}')
+
+        out = []
+        for metric, (kind, lines) in families.items():
+            out.append(f'# HELP {metric} {HELP.get(metric[len(PREFIX) + 1:], metric)}')
+            out.append(f'# TYPE {metric} {kind}')
+            out.extend(lines)
+        return '\n'.join(out) + '\n' if out else ''
+
+    def write(self, directory: str, module: str) -> Dict[str, str]:
+        """
+        寫入 {module}.prom 與 {module}.json (先寫暫存檔再取代，讀取端不會讀到一半)
+
+        Returns:
+            {'prometheus': path, 'json': path}
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = {
+            'prometheus': os.path.join(directory, f'{module}.prom'),
+            'json': os.path.join(directory, f'{module}.json'),
+        }
+        summary = {
+            'module': module,
+            'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'metrics': self.to_dict(),
+        }
+        _atomic_write(paths['prometheus'], self.to_prometheus(module=module))
+        _atomic_write(paths['json'], json.dumps(summary, ensure_ascii=False, indent=2))
+        return paths
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    body = ','.join(
+        f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(10), " ").replace(chr(34), chr(92) + chr(34))}"'
+        for k, v in labels.items())
+    return '{' + body + '}'
+
+
+def _atomic_write(path: str, text: str):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def status_class(status_code: int) -> str:
+    """200 -> '2xx'"""
+    return f'{status_code // 100}xx' if status_code else 'error'
+
+
+def merge_prometheus(texts: Iterable[str]) -> str:
+    """
+    合併多個模組的 .prom 內容 (同名 metric 的 HELP / TYPE 只保留一次，樣本依 family 分組)
+
+    供 api_gateway /metrics 端點使用
+    """
+    families: Dict[str, Tuple[List[str], List[str]]] = {}
+    for text in texts:
+        current = None
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith('# '):
+                parts = line.split(None, 3)
+                if len(parts) >= 3 and parts[1] in ('HELP', 'TYPE'):
+                    current = parts[2]
+                    headers, _ = families.setdefault(current, ([], []))
+                    if not any(h.split(None, 2)[1] == parts[1] for h in headers):
+                        headers.append(line)
+                continue
+            if current is not None:
+                families[current][1].append(line)
+    out = []
+    for headers, samples in families.values():
+        out.extend(headers)
+        out.extend(samples)
+    return '\n'.join(out) + '\n' if out else ''
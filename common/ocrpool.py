@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab OCR Pool Module
+選用的驗證碼辨識程序池 - 多個查詢 session 同時執行時，OCR 不再與解析搶 GIL
+
+Features:
+- 子程序各自載入一次 ddddocr，主程序不載入模型
+- 背景 dispatcher 將同時送來的圖片合併成一批，一次送進子程序辨識 (一次 IPC 往返)
+- submit() 回傳 Future；classify() 與 CaptchaSolver 介面相同
+- 啟用後 common.captcha.get_solver() / solve() / CaptchaPipeline 自動改走程序池，呼叫端不需修改
+- 佇列深度、批次大小、延遲等統計於 logger.task_end 時自動併入 CrawlabLogger stats
+"""
+
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import captcha
+from .captcha import CaptchaProfile
+from .logger import CrawlabLogger
+
+
+# ========== 子程序 ==========
+
+_engine = None
+_engine_ranges: Optional[str] = None
+
+
+def _init_worker(engine_kwargs: Dict[str, Any]):
+    """子程序初始化：載入 ddddocr"""
+    global _engine
+    _engine = captcha.load_engine(**engine_kwargs)
+
+
+def _classify_batch(items: List[Tuple[bytes, Optional[str]]]) -> List[Tuple[bool, Any]]:
+    """
+    子程序：依序辨識一批圖片
+
+    Returns:
+        [(True, code) / (False, 錯誤訊息), ...]，單張失敗不影響同批其他圖片
+    """
+    global _engine_ranges
+    results = []
+    for image, charset in items:
+        try:
+            if charset:
+                if _engine_ranges != charset:
+                    _engine.set_ranges(charset)
+                    _engine_ranges = charset
+                out = _engine.classification(image, probability=True)
+                code = captcha._ctc_decode(out['charsets'], out['probability'])
+            else:
+                code = _engine.classification(image)
+            results.append((True, code))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+class _Request:
+    __slots__ = ('image', 'charset', 'profile', 'future', 'submitted')
+
+    def __init__(self, image: bytes, profile: Optional[CaptchaProfile]):
+        self.image = profile.prepare(image) if profile is not None else image
+        self.profile = profile
+        self.charset = profile.charset if profile is not None else None
+        self.future: Future = Future()
+        self.submitted = time.monotonic()
+
+
+_STOP = object()
+
+
+# ========== 程序池 ==========
+
+class OcrPool:
+    """
+    驗證碼辨識程序池
+
+    Usage:
+        from common.ocrpool import configure_ocr
+
+        configure_ocr(crawler.get('ocr_workers', 0))   # 0 = 維持程序內辨識
+
+        # 之後照常使用，不需知道辨識在哪裡執行
+        code = solve(captcha_img, profile)
+
+        # 或直接送出多張，取得 Future
+        pool = configure_ocr(4)
+        futures = [pool.submit(img, profile) for img in images]
+        codes = [f.result() for f in futures]
+    """
+
+    def __init__(self, workers: int = 2, batch_size: int = 8, max_wait: float = 0.005,
+                 timeout: float = 30.0, **engine_kwargs):
+        """
+        Args:
+            workers: 子程序數
+            batch_size: 單批最多圖片數
+            max_wait: 收到第一張後最多等待多少秒湊成一批
+            timeout: classify() 等待結果的秒數
+            engine_kwargs: 傳給 ddddocr.DdddOcr 的參數 (show_ad 預設 False)
+        """
+        engine_kwargs.setdefault('show_ad', False)
+        self.name = 'pool'
+        self.workers = max(workers, 1)
+        self.batch_size = max(batch_size, 1)
+        self.max_wait = max_wait
+        self.timeout = timeout
+
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(engine_kwargs,))
+        self._queue: queue.Queue = queue.Queue()
+        self._inflight = threading.Semaphore(self.workers * 2)  # 每個子程序最多排兩批
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.stats: Dict[str, Any] = {
+            'workers': self.workers,
+            'submitted': 0,
+            'completed': 0,
+            'errors': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'max_queue_depth': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._dispatch, name='ocr-dispatch', daemon=True)
+        self._thread.start()
+
+    # ========== 提交 ==========
+
+    def submit(self, image: bytes, profile: Optional[CaptchaProfile] = None) -> Future:
+        """送出一張圖片，回傳結果為辨識字串的 Future (已套用 profile.normalize)"""
+        if self._closed:
+            raise RuntimeError("OcrPool 已關閉")
+        request = _Request(image, profile)
+        self._queue.put(request)
+        with self._lock:
+            self.stats['submitted'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self._queue.qsize())
+        return request.future
+
+    def classify(self, image: bytes, profile: Optional[CaptchaProfile] = None) -> str:
+        """與 CaptchaSolver.classify 相同介面 (阻塞至結果返回)"""
+        return self.submit(image, profile).result(self.timeout)
+
+    def warmup(self) -> 'OcrPool':
+        """讓子程序先載入模型"""
+        futures = [self._executor.submit(_classify_batch, []) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+        return self
+
+    # ========== dispatcher ==========
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = self._collect(item)
+
+            self._inflight.acquire()
+            try:
+                future = self._executor.submit(_classify_batch, [(r.image, r.charset) for r in batch])
+            except Exception as e:
+                self._inflight.release()
+                self._fail(batch, e)
+                continue
+
+            with self._lock:
+                self.stats['batches'] += 1
+                self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+            future.add_done_callback(lambda f, batch=batch: self._complete(batch, f))
+
+    def _complete(self, batch: List[_Request], future: Future):
+        self._inflight.release()
+        try:
+            results = future.result()
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        now = time.monotonic()
+        for request, (ok, value) in zip(batch, results):
+            elapsed_ms = (now - request.submitted) * 1000
+            with self._lock:
+                self.stats['completed'] += 1
+                self.stats['total_ms'] += elapsed_ms
+                self.stats['max_ms'] = max(self.stats['max_ms'], elapsed_ms)
+                if not ok:
+                    self.stats['errors'] += 1
+            if ok:
+                code = request.profile.normalize(value) if request.profile is not None else value
+                request.future.set_result(code)
+            else:
+                request.future.set_exception(RuntimeError(value))
+
+    def _fail(self, batch: List[_Request], error: Exception):
+        with self._lock:
+            self.stats['errors'] += len(batch)
+        for request in batch:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    # ========== 結束 ==========
+
+    def close(self):
+        """等待已送出的圖片辨識完成後關閉子程序"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(self.timeout)
+        self._executor.shutdown(wait=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得統計資訊"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_batch'] = round(stats['completed'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['avg_ms'] = round(stats['total_ms'] / stats['completed'], 2) if stats['completed'] else 0.0
+        stats['total_ms'] = round(stats['total_ms'], 1)
+        stats['max_ms'] = round(stats['max_ms'], 2)
+        return stats
+
+
+# ========== 管理 ==========
+
+_pool: Optional[OcrPool] = None
+_pool_lock = threading.Lock()
+
+
+def configure_ocr(workers: int = 0, **kwargs) -> Optional[OcrPool]:
+    """
+    啟用 / 停用程序池
+
+    Args:
+        workers: 子程序數，0 表示停用 (維持程序內辨識)
+        kwargs: 傳給 OcrPool 的其他參數
+
+    Returns:
+        OcrPool，停用時 None
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and (not workers or _pool.workers != workers):
+            captcha.set_service(None)
+            _pool.close()
+            _pool = None
+        if workers and _pool is None:
+            _pool = OcrPool(workers, **kwargs)
+            captcha.set_service(_pool)
+        return _pool
+
+
+def shutdown_ocr():
+    """關閉程序池"""
+    configure_ocr(0)
+
+
+def ocr_pool_stats() -> Dict[str, Any]:
+    """程序池統計 (供 logger.task_end 使用)"""
+    pool = _pool
+    return pool.get_stats() if pool is not None else {}
+
+
+CrawlabLogger.register_stats_provider('ocr_pool', ocr_pool_stats)
+atexit.register(shutdown_ocr)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Query Module
+參數化查詢 - 取代 f-string 內嵌字面值的 SQL
+
+pymssql 的參數在用戶端展開成字面值，SQL Server 每組值都視為不同的 ad-hoc 語句，
+plan cache 被大量單次使用的計畫塞滿。本模組把具名參數改寫成 sp_executesql 呼叫，
+語句本文與參數宣告固定，不同的值共用同一個執行計畫。
+
+Features:
+- 具名參數 %(name)s，自動改寫為 sp_executesql + @name
+- 依 Python 型別推斷參數型別，可用 types= 指定 (例如 NVARCHAR / 日期欄位)
+- 語句改寫結果快取 (以正規化後的 SQL 為 fingerprint)
+- 每個 fingerprint 的執行次數、總耗時、最大耗時、錯誤數
+- 統計於 logger.task_end 時自動併入 CrawlabLogger stats
+"""
+
+import datetime
+import decimal
+import hashlib
+import re
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from .logger import CrawlabLogger
+
+# 既有 f-string 語句的字串字面值沒有 N 前綴 (VARCHAR)；沿用相同型別，
+# 避免 NVARCHAR 參數比對 VARCHAR 欄位時發生隱含轉換而無法使用索引
+DEFAULT_STR_TYPE = 'VARCHAR(8000)'
+
+_PARAM_RE = re.compile(r'%\((\w+)\)s')
+
+
+def _infer_type(value: Any) -> str:
+    """依 Python 值推斷 sp_executesql 參數型別"""
+    if isinstance(value, bool):
+        return 'BIT'
+    if isinstance(value, int):
+        return 'BIGINT'
+    if isinstance(value, float):
+        return 'FLOAT'
+    if isinstance(value, decimal.Decimal):
+        return 'DECIMAL(38, 10)'
+    if isinstance(value, datetime.datetime):
+        return 'DATETIME2'
+    if isinstance(value, datetime.date):
+        return 'DATE'
+    if isinstance(value, (bytes, bytearray)):
+        return 'VARBINARY(MAX)'
+    if isinstance(value, str) and len(value) > 8000:
+        return 'VARCHAR(MAX)'
+    return DEFAULT_STR_TYPE
+
+
+def fingerprint(sql: str) -> str:
+    """正規化空白後的 SQL 摘要 (統計與快取用)"""
+    normalized = ' '.join(sql.split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+# ========== 語句 ==========
+
+class Statement:
+    """
+    改寫後的參數化語句 (由 prepare() 取得並快取)
+
+    Attributes:
+        sql: 原始 SQL (%(name)s 參數)
+        text: sp_executesql 的語句本文 (@name 參數)
+        names: 參數名稱 (依出現順序，不重複)
+        fingerprint: 統計用摘要
+    """
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.fingerprint = fingerprint(sql)
+        self.names: List[str] = []
+        for name in _PARAM_RE.findall(sql):
+            if name not in self.names:
+                self.names.append(name)
+        reserved = {'stmt', 'params'} & {n.lower() for n in self.names}
+        if reserved:
+            raise ValueError(f"參數名稱與 sp_executesql 保留字衝突: {reserved}")
+        self.text = _PARAM_RE.sub(lambda m: '@' + m.group(1), sql).replace('%%', '%')
+
+    def bind(self, params: Mapping[str, Any],
+             types: Optional[Mapping[str, str]] = None) -> Tuple[str, tuple]:
+        """
+        組出 sp_executesql 呼叫
+
+        Returns:
+            (sql, args) 交給 cursor.execute
+        """
+        if not self.names:
+            return self.text, None
+
+        types = types or {}
+        decls, assigns, args = [], [], [self.text]
+        for name in self.names:
+            if name not in params:
+                raise KeyError(f"缺少參數: {name}")
+            value = params[name]
+            if isinstance(value, (list, tuple, set)):
+                raise TypeError(f"參數 {name} 不支援清單值，請改用暫存表或分別查詢")
+            decls.append(f"@{name} {types.get(name) or _infer_type(value)}")
+            assigns.append(f"@{name} = %s")
+            args.append(value)
+        args.insert(1, ', '.join(decls))
+
+        sql = "EXEC sp_executesql %s, %s, " + ', '.join(assigns)
+        return sql, tuple(args)
+
+
+_statements: Dict[str, Statement] = {}
+_timings: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def prepare(sql: str) -> Statement:
+    """取得 (快取的) 改寫後語句"""
+    stmt = _statements.get(sql)
+    if stmt is None:
+        stmt = Statement(sql)
+        with _lock:
+            _statements[sql] = stmt
+    return stmt
+
+
+def _record(stmt: Statement, elapsed: float, error: bool = False):
+    with _lock:
+        t = _timings.get(stmt.fingerprint)
+        if t is None:
+            t = _timings[stmt.fingerprint] = {
+                'sql': ' '.join(stmt.sql.split())[:120],
+                'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            }
+        t['calls'] += 1
+        t['total_seconds'] += elapsed
+        t['max_seconds'] = max(t['max_seconds'], elapsed)
+        if error:
+            t['errors'] += 1
+
+
+# ========== 執行 ==========
+
+def execute(cursor, sql: str, params: Optional[Mapping[str, Any]] = None,
+            types: Optional[Mapping[str, str]] = None):
+    """
+    以 cursor 執行參數化語句
+
+    Usage:
+        from common.query import execute
+
+        execute(cursor, f"UPDATE [{totb}] SET note = %(note)s WHERE id = %(id)s",
+                {'note': note, 'id': ID})
+
+    Args:
+        cursor: pymssql cursor
+        sql: SQL (值以 %(name)s 表示；表名等識別字仍以 f-string 組出)
+        params: 具名參數
+        types: 指定參數型別，例如 {'name': 'NVARCHAR(200)'}
+
+    Returns:
+        cursor
+    """
+    stmt = prepare(sql)
+    bound_sql, args = stmt.bind(params or {}, types)
+    start = time.perf_counter()
+    try:
+        cursor.execute(bound_sql, args)
+    except Exception:
+        _record(stmt, time.perf_counter() - start, error=True)
+        raise
+    _record(stmt, time.perf_counter() - start)
+    return cursor
+
+
+def fetch_all(pool, sql: str, params: Optional[Mapping[str, Any]] = None,
+              types: Optional[Mapping[str, str]] = None, as_dict: bool = False) -> list:
+    """自連線池取得 cursor 執行並回傳全部結果"""
+    with pool.cursor(as_dict=as_dict) as cursor:
+        execute(cursor, sql, params, types)
+        return cursor.fetchall()
+
+
+def fetch_value(pool, sql: str, params: Optional[Mapping[str, Any]] = None,
+                types: Optional[Mapping[str, str]] = None, default: Any = None) -> Any:
+    """自連線池取得 cursor 執行並回傳第一列第一欄"""
+    with pool.cursor() as cursor:
+        execute(cursor, sql, params, types)
+        row = cursor.fetchone()
+    return row[0] if row else default
+
+
+def run(pool, sql: str, params: Optional[Mapping[str, Any]] = None,
+        types: Optional[Mapping[str, str]] = None) -> int:
+    """自連線池取得 cursor 執行 (自動 commit)，回傳影響筆數"""
+    with pool.cursor() as cursor:
+        execute(cursor, sql, params, types)
+        return cursor.rowcount
+
+
+# ========== 統計 ==========
+
+def query_stats(top: int = 10) -> Dict[str, Any]:
+    """依總耗時排序的前 N 個語句統計 (供 logger.task_end 使用)"""
+    with _lock:
+        timings = [(fp, dict(t)) for fp, t in _timings.items()]
+    if not timings:
+        return {}
+
+    timings.sort(key=lambda x: x[1]['total_seconds'], reverse=True)
+    stats: Dict[str, Any] = {
+        'statements': len(timings),
+        'calls': sum(t['calls'] for _, t in timings),
+    }
+    for fp, t in timings[:top]:
+        t['total_seconds'] = round(t['total_seconds'], 3)
+        t['max_seconds'] = round(t['max_seconds'], 3)
+        t['avg_ms'] = round(t['total_seconds'] * 1000 / t['calls'], 2)
+        stats[fp] = t
+    return stats
+
+
+CrawlabLogger.register_stats_provider('query', query_stats)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Daily Quota Module
+共用每日處理上限 - 取代每筆資料後執行 COUNT(DISTINCT) 的 exit_obs 檢查
+
+Features:
+- 啟動時讀取一次今日已處理筆數，之後以本地計數累加
+- 每 N 筆或接近上限時才與 DB 對帳 (以 DB 為準修正本地計數)
+- 跨日自動重新讀取當日筆數
+- 對帳失敗時沿用本地計數 (只會提早停止，不會超量)
+- sync：對帳前先等待背景寫入完成 (common.writer)，DB 筆數才包含已處理但仍在佇列中的資料
+- QuotaExhausted 例外讓多層迴圈乾淨結束，不需在處理函式中 sys.exit
+- 統計於 logger.task_end 時自動併入 CrawlabLogger stats
+"""
+
+import datetime
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from .logger import CrawlabLogger
+
+
+# ========== 每日上限 ==========
+
+class QuotaExhausted(Exception):
+    """今日處理上限已達成"""
+
+
+class DailyQuota:
+    """
+    每日處理上限控制
+
+    Usage:
+        from common.quota import DailyQuota, QuotaExhausted
+
+        quota = DailyQuota(
+            'Data-Insurance', 5000,
+            counter=lambda: exit_obs(server, username, password, database, totb),
+            sync=writer.flush,          # 使用 BackgroundWriter 時，對帳前先寫完佇列
+        )
+
+        for row in rows:
+            if quota.exhausted:
+                break
+            ...
+            quota.consume()
+
+        # 多層迴圈內直接中止
+        try:
+            for page in pages:
+                for item in page:
+                    ...
+                    quota.consume()
+                    quota.check()       # 已達上限時 raise QuotaExhausted
+        except QuotaExhausted:
+            logger.warning(...)
+    """
+
+    def __init__(self, name: str, limit: int, counter: Callable[[], int],
+                 reconcile_every: int = 100, margin: Optional[int] = None,
+                 sync: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            name: 名稱 (統計用，通常為模組名稱)
+            limit: 每日上限
+            counter: 回傳今日 DB 已處理筆數的函式 (例如各模組的 exit_obs)
+            reconcile_every: 本地累計多少筆後與 DB 對帳
+            margin: 剩餘筆數小於等於此值時每筆都對帳 (預設同 reconcile_every)
+            sync: 對帳前呼叫 (例如 BackgroundWriter.flush)，確保已處理的資料都已寫入 DB
+        """
+        self.name = name
+        self.limit = limit
+        self.counter = counter
+        self.reconcile_every = max(reconcile_every, 1)
+        self.margin = reconcile_every if margin is None else margin
+        self.sync = sync
+
+        self._lock = threading.Lock()
+        self._day: Optional[datetime.date] = None
+        self._db_used = 0      # 最近一次對帳時的 DB 筆數
+        self._local = 0        # 對帳後本地累加的筆數
+
+        self.stats: Dict[str, Any] = {
+            'limit': limit,
+            'consumed': 0,
+            'reconciles': 0,
+            'reconcile_errors': 0,
+            'exhausted': False,
+        }
+
+        with _quotas_lock:
+            _quotas[name] = self
+
+        self.reconcile()
+
+    def reconcile(self) -> int:
+        """
+        與 DB 對帳，回傳今日已處理筆數
+
+        對帳失敗時保留本地計數，下一次 consume 再重試
+        """
+        if self.sync is not None:
+            # 佇列中的資料尚未寫入，不先寫完 DB 筆數會偏低，重設本地計數後可能超量
+            self.sync()
+        with self._lock:
+            try:
+                used = int(self.counter() or 0)
+            except Exception:
+                self.stats['reconcile_errors'] += 1
+                if self._day is None:
+                    self._day = datetime.date.today()
+                return self._db_used + self._local
+
+            self._day = datetime.date.today()
+            self._db_used = used
+            self._local = 0
+            self.stats['reconciles'] += 1
+            return used
+
+    def _roll_day(self):
+        """跨日時重新讀取當日筆數"""
+        if self._day != datetime.date.today():
+            self.reconcile()
+
+    @property
+    def used(self) -> int:
+        """今日已處理筆數 (DB 筆數 + 本地累加)"""
+        return self._db_used + self._local
+
+    @property
+    def remaining(self) -> int:
+        """今日剩餘可處理筆數"""
+        self._roll_day()
+        return max(self.limit - self.used, 0)
+
+    @property
+    def exhausted(self) -> bool:
+        """是否已達今日上限"""
+        done = self.remaining <= 0
+        self.stats['exhausted'] = done
+        return done
+
+    def consume(self, n: int = 1) -> bool:
+        """
+        記錄已處理 n 筆
+
+        Returns:
+            True 表示仍可繼續處理
+        """
+        self._roll_day()
+        with self._lock:
+            self._local += n
+            self.stats['consumed'] += n
+            need_reconcile = (
+                self._local >= self.reconcile_every
+                or self.limit - self.used <= self.margin
+            )
+        if need_reconcile:
+            self.reconcile()
+        return not self.exhausted
+
+    def check(self):
+        """已達今日上限時 raise QuotaExhausted"""
+        if self.exhausted:
+            raise QuotaExhausted(f"{self.name} 已達每日上限: {self.used} >= {self.limit}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得統計資訊"""
+        stats = dict(self.stats)
+        stats['used'] = self.used
+        return stats
+
+
+# ========== 統計 ==========
+
+_quotas: Dict[str, DailyQuota] = {}
+_quotas_lock = threading.Lock()
+
+
+def quota_stats() -> Dict[str, Any]:
+    """彙整所有每日上限統計 (供 logger.task_end 使用)"""
+    with _quotas_lock:
+        quotas = list(_quotas.values())
+    return {q.name: q.get_stats() for q in quotas}
+
+
+CrawlabLogger.register_stats_provider('quota', quota_stats)
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Replay Module
+HTTP 錄製 / 重播 - 不連線政府網站也能端對端測試並行數與速率設定
+
+Features:
+- 錄製模式 (CRAWLAB_HTTP_RECORD=<dir>)：經 common.http 送出的請求與回應逐筆存入 fixture 目錄
+- 重播模式 (CRAWLAB_HTTP_REPLAY=http://127.0.0.1:8800)：請求改送本機 stand-in server，模組程式不需修改
+- ReplayServer：依 method + 主機 + 路徑 + body 回傳錄製內容，可設定延遲、抖動、錯誤率與斷線率
+- body 不同時 (例如每次不同的 token) 退回只比對 method + 主機 + 路徑
+- set_rate() 仍以原始主機計算，重播時可直接比較速率 / 並行數設定
+- 錄製 / 重播統計於 logger.task_end 時自動併入 CrawlabLogger stats
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .logger import CrawlabLogger
+
+RECORD_ENV = 'CRAWLAB_HTTP_RECORD'
+REPLAY_ENV = 'CRAWLAB_HTTP_REPLAY'
+HOST_HEADER = 'X-Crawlab-Host'
+
+# body 已解壓縮，重播時由 server 重新計算長度
+_DROP_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length', 'connection', 'keep-alive')
+
+
+def _body_bytes(body) -> Optional[bytes]:
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    if isinstance(body, bytes):
+        return body
+    return None
+
+
+def _body_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def _target(url: str) -> str:
+    parts = urlsplit(url)
+    return (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+
+
+# ========== 錄製 ==========
+
+class FixtureStore:
+    """
+    HTTP fixture 目錄 (請求 / 回應配對)
+
+    目錄結構:
+        <root>/<host>/fixtures.jsonl    {"method", "target", "body_sha", "status", "headers", "file", "ts"} 每行一筆
+        <root>/<host>/bodies/<sha>.bin  回應內容 (相同內容只存一份)
+
+    Usage:
+        export CRAWLAB_HTTP_RECORD=./data/http_fixtures      # 或 enable_record(path)
+        python Data-Court_Auction/main.py                    # 照常執行，回應同時存入 fixture
+
+        python replay_server.py --fixtures ./data/http_fixtures --latency 0.3 --error-rate 0.02
+        export CRAWLAB_HTTP_REPLAY=http://127.0.0.1:8800     # 或 enable_replay(url)
+        python Data-Court_Auction/main.py                    # 改由本機 server 回應
+    """
+
+    def __init__(self, root: str, max_per_host: int = 20000):
+        """
+        Args:
+            root: fixture 目錄
+            max_per_host: 每個主機最多錄製筆數
+        """
+        self.root = root
+        self.max_per_host = max_per_host
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self.stats: Dict[str, Any] = {'recorded': 0, 'skipped': 0, 'errors': 0}
+
+    def _host_dir(self, host: str) -> str:
+        host_dir = os.path.join(self.root, host)
+        if host not in self._counts:
+            os.makedirs(os.path.join(host_dir, 'bodies'), exist_ok=True)
+            index = os.path.join(host_dir, 'fixtures.jsonl')
+            count = 0
+            if os.path.exists(index):
+                with open(index, encoding='utf-8') as f:
+                    count = sum(1 for _ in f)
+            self._counts[host] = count
+        return host_dir
+
+    def record(self, host: str, request, response):
+        """保存一筆請求 / 回應 (失敗只計數，不影響爬取)"""
+        try:
+            body = _body_bytes(request.body)
+            if body is None:
+                self.stats['skipped'] += 1
+                return
+            content = response.content
+            content_sha = _body_hash(content)
+            entry = {
+                'method': request.method.upper(),
+                'target': _target(request.url),
+                'body_sha': _body_hash(body),
+                'status': response.status_code,
+                'reason': response.reason,
+                'headers': {k: v for k, v in response.headers.items() if k.lower() not in _DROP_HEADERS},
+                'file': f"{content_sha}.bin",
+                'ts': time.strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            with self._lock:
+                host_dir = self._host_dir(host)
+                if self._counts[host] >= self.max_per_host:
+                    self.stats['skipped'] += 1
+                    return
+                path = os.path.join(host_dir, 'bodies', entry['file'])
+                if not os.path.exists(path):
+                    with open(path, 'wb') as f:
+                        f.write(content)
+                with open(os.path.join(host_dir, 'fixtures.jsonl'), 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                self._counts[host] += 1
+                self.stats['recorded'] += 1
+        except Exception:
+            self.stats['errors'] += 1
+
+    @staticmethod
+    def load(root: str) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        讀取 fixture
+
+        Returns:
+            {host: [entry (含 'path'), ...]}，依錄製順序
+        """
+        result = {}
+        for host in sorted(os.listdir(root)):
+            index = os.path.join(root, host, 'fixtures.jsonl')
+            if not os.path.isfile(index):
+                continue
+            entries = []
+            with open(index, encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    entry['path'] = os.path.join(root, host, 'bodies', entry['file'])
+                    entries.append(entry)
+            result[host] = entries
+        return result
+
+
+# ========== Stand-in server ==========
+
+class ReplayServer:
+    """
+    以錄製內容回應的本機 HTTP server
+
+    同一請求錄到多筆回應時依序輪流回傳 (例如分頁、每次不同的驗證碼圖片)。
+
+    Usage:
+        from common.replay import ReplayServer, enable_replay
+
+        server = ReplayServer('./data/http_fixtures', latency=0.3, jitter=0.1, error_rate=0.02).start()
+        enable_replay(server.url)
+        ...
+        print(server.get_stats())
+        server.close()
+    """
+
+    def __init__(self, root: str, host: str = '127.0.0.1', port: int = 8800,
+                 latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, drop_rate: float = 0.0, seed: Optional[int] = None):
+        """
+        Args:
+            root: fixture 目錄
+            host / port: 監聽位址 (port=0 自動選擇)
+            latency: 每個回應的平均延遲秒數
+            jitter: 延遲隨機變動範圍 (±秒)
+            error_rate: 回傳 503 的比例
+            drop_rate: 不回應直接斷線的比例
+            seed: 亂數種子 (固定後錯誤注入可重現)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self._exact: Dict[Tuple[str, str, str, str], List[Dict[str, Any]]] = {}
+        self._loose: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        self._cursor: Dict[Any, int] = {}
+        self._bodies: Dict[str, bytes] = {}
+        fixtures = FixtureStore.load(root)
+        for site, entries in fixtures.items():
+            for entry in entries:
+                self._exact.setdefault((entry['method'], site, entry['target'], entry['body_sha']), []).append(entry)
+                self._loose.setdefault((entry['method'], site, entry['target']), []).append(entry)
+
+        self.stats: Dict[str, Any] = {
+            'fixtures': sum(len(v) for v in fixtures.values()),
+            'hosts': len(fixtures),
+            'served': 0,
+            'loose': 0,
+            'missing': 0,
+            'errors_injected': 0,
+            'drops_injected': 0,
+        }
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_port}"
+        self._thread: Optional[threading.Thread] = None
+
+    def _pick(self, key, candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+        return candidates[index % len(candidates)]
+
+    def _body(self, entry: Dict[str, Any]) -> bytes:
+        body = self._bodies.get(entry['path'])
+        if body is None:
+            with open(entry['path'], 'rb') as f:
+                body = self._bodies[entry['path']] = f.read()
+        return body
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def lookup(self, method: str, site: str, target: str, body: bytes) -> Optional[Dict[str, Any]]:
+        """找出對應的錄製回應 (先比對 body，找不到時只比對路徑)"""
+        key = (method, site, target, _body_hash(body))
+        if key in self._exact:
+            return self._pick(key, self._exact[key])
+        loose = key[:3]
+        if loose in self._loose:
+            self._count('loose')
+            return self._pick(loose, self._loose[loose])
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                delay = server.latency + server._random.uniform(-server.jitter, server.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+
+                roll = server._random.random()
+                if roll < server.drop_rate:
+                    server._count('drops_injected')
+                    self.close_connection = True
+                    return
+                if roll < server.drop_rate + server.error_rate:
+                    server._count('errors_injected')
+                    self._send(503, 'Service Unavailable', {}, b'')
+                    return
+
+                site = (self.headers.get(HOST_HEADER) or '').lower()
+                entry = server.lookup(self.command.upper(), site, self.path, body)
+                if entry is None:
+                    server._count('missing')
+                    self._send(404, 'Not Found', {}, f"no fixture: {self.command} {site}{self.path}".encode())
+                    return
+                server._count('served')
+                self._send(entry['status'], entry.get('reason') or '', entry['headers'], server._body(entry))
+
+            def _send(self, status, reason, headers, content):
+                self.send_response(status, reason or None)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _reply
+
+        return Handler
+
+    def start(self) -> 'ReplayServer':
+        """背景執行緒啟動"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='replay-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得統計資訊"""
+        with self._lock:
+            return dict(self.stats)
+
+
+# ========== 管理 ==========
+
+_recorder: Optional[FixtureStore] = None
+_target_url: Optional[str] = None
+_redirected = 0
+_redirected_lock = threading.Lock()
+
+
+def enable_record(root: Optional[str] = None, **kwargs) -> Optional[FixtureStore]:
+    """
+    啟用錄製
+
+    Args:
+        root: fixture 目錄，None 表示停用
+        kwargs: 傳給 FixtureStore 的其他參數
+    """
+    global _recorder
+    _recorder = FixtureStore(root, **kwargs) if root else None
+    return _recorder
+
+
+def enable_replay(url: Optional[str] = None):
+    """
+    啟用重播：之後經 common.http 的請求都改送到 url (例如 http://127.0.0.1:8800)，None 表示停用
+    """
+    global _target_url
+    _target_url = url.rstrip('/') if url else None
+
+
+def redirect(request, host: str):
+    """重播模式下將請求改送 stand-in server (供 common.http adapter 呼叫)"""
+    global _redirected
+    if _target_url is None:
+        return
+    request.headers[HOST_HEADER] = host
+    request.url = _target_url + _target(request.url)
+    with _redirected_lock:
+        _redirected += 1
+
+
+def record(host: str, request, response):
+    """錄製模式下保存請求 / 回應 (供 common.http adapter 呼叫)"""
+    if _recorder is not None:
+        _recorder.record(host, request, response)
+
+
+def replay_stats() -> Dict[str, Any]:
+    """錄製 / 重播統計 (供 logger.task_end 使用)"""
+    stats = {}
+    if _recorder is not None:
+        stats['record'] = dict(_recorder.stats, root=_recorder.root)
+    if _target_url is not None:
+        stats['replay'] = {'target': _target_url, 'redirected': _redirected}
+    return stats
+
+
+CrawlabLogger.register_stats_provider('http_replay', replay_stats)
+
+if os.environ.get(RECORD_ENV):
+    enable_record(os.environ[RECORD_ENV])
+if os.environ.get(REPLAY_ENV):
+    enable_replay(os.environ[REPLAY_ENV])
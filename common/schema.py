@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Schema Module
+索引維護與可走索引 (sargable) 的日期條件
+
+Features:
+- stale_predicate(): 以 欄位 < DATEADD(...) 取代 DATEDIFF(MONTH, 欄位, GETDATE()) >= N
+- ensure_index(): 索引不存在時建立 (支援 INCLUDE 覆蓋欄位、WHERE 篩選索引、UNIQUE)
+- 已存在的同名索引會比對鍵欄位 / INCLUDE / 篩選條件，不一致時回報 mismatch (不自動重建)
+- ensure_indexes(): 一次檢查多個索引，回傳每個索引的狀態
+- log_index_results(): 以 CrawlabLogger 記錄檢查結果
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+# ========== 日期條件 ==========
+
+def stale_before(months: int) -> str:
+    """
+    DATEDIFF(MONTH, x, GETDATE()) >= months 的等價截止日
+
+    DATEDIFF(MONTH) 計算的是跨過的月份邊界數，等同於
+    x < (本月 1 日往前 months - 1 個月)，例如 10/18 時 months=3 → x < 08/01
+    """
+    return f"DATEADD(MONTH, DATEDIFF(MONTH, 0, GETDATE()) - {months - 1}, 0)"
+
+
+def stale_predicate(column: str, months: int = 3) -> str:
+    """
+    可走索引的「超過 N 個月未更新」條件
+
+    Usage:
+        f"SELECT ID FROM [{totb}] WHERE {stale_predicate('update_date')}"
+        # -> update_date < DATEADD(MONTH, DATEDIFF(MONTH, 0, GETDATE()) - 2, 0)
+    """
+    return f"{column} < {stale_before(months)}"
+
+
+# ========== 索引 ==========
+
+def _normalize_filter(text: Optional[str]) -> str:
+    """篩選條件比對用：去掉空白、括號與 []，不分大小寫"""
+    if not text:
+        return ''
+    return ''.join(c for c in text if c not in ' ()[]\t\r\n').lower()
+
+
+def describe_index(cursor, table: str, name: str) -> Optional[Dict[str, Any]]:
+    """
+    取得索引定義
+
+    Returns:
+        {'columns': [...], 'include': [...], 'where': str, 'unique': bool}，不存在時 None
+    """
+    cursor.execute("""
+    SELECT i.is_unique, i.filter_definition, c.name, ic.is_included_column, ic.key_ordinal
+    FROM sys.indexes i
+    JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+    JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+    WHERE i.object_id = OBJECT_ID(%s) AND i.name = %s
+    ORDER BY ic.is_included_column, ic.key_ordinal, c.name
+    """, (table, name))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    return {
+        'unique': bool(rows[0][0]),
+        'where': rows[0][1] or '',
+        'columns': [r[2] for r in rows if not r[3]],
+        'include': sorted(r[2] for r in rows if r[3]),
+    }
+
+
+def ensure_index(cursor, table: str, name: str, columns: Sequence[str],
+                 include: Optional[Sequence[str]] = None, where: Optional[str] = None,
+                 unique: bool = False) -> str:
+    """
+    索引不存在時建立 (不 commit，交由呼叫端控制交易)
+
+    Args:
+        cursor: pymssql cursor
+        table: 資料表
+        name: 索引名稱
+        columns: 鍵欄位 (順序有意義)
+        include: INCLUDE 覆蓋欄位
+        where: 篩選索引條件，例如 "status IS NULL"
+        unique: 是否為 UNIQUE
+
+    Returns:
+        'created' / 'exists' / 'mismatch'
+    """
+    include = list(include or [])
+    current = describe_index(cursor, table, name)
+    if current is not None:
+        same = (
+            [c.lower() for c in current['columns']] == [c.lower() for c in columns]
+            and sorted(c.lower() for c in current['include']) == sorted(c.lower() for c in include)
+            and _normalize_filter(current['where']) == _normalize_filter(where)
+            and current['unique'] == unique
+        )
+        return 'exists' if same else 'mismatch'
+
+    sql = (f"CREATE {'UNIQUE ' if unique else ''}NONCLUSTERED INDEX [{name}] "
+           f"ON {table} ({', '.join(f'[{c}]' for c in columns)})")
+    if include:
+        sql += f" INCLUDE ({', '.join(f'[{c}]' for c in include)})"
+    if where:
+        sql += f" WHERE {where}"
+    cursor.execute(sql)
+    return 'created'
+
+
+def ensure_indexes(pool, specs: Sequence[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """
+    依序檢查 / 建立多個索引，單一索引失敗不影響其他索引
+
+    Usage:
+        from common.schema import ensure_indexes
+
+        results = ensure_indexes(get_pool(server, username, password, database), [
+            {'table': 'insurance', 'name': 'IX_insurance_ID', 'columns': ['ID'],
+             'include': ['rowid']},
+            {'table': 'insurance', 'name': 'IX_insurance_update_date',
+             'columns': ['update_date'], 'include': ['ID', 'note']},
+        ])
+        for name, status in results:
+            logger.info(f"索引 {name}: {status}")
+
+    Args:
+        pool: common.db.ConnectionPool
+        specs: ensure_index 的參數 dict 清單
+
+    Returns:
+        [(name, 'created' / 'exists' / 'mismatch' / 'failed: ...'), ...]
+    """
+    results = []
+    for spec in specs:
+        try:
+            with pool.cursor() as cursor:
+                status = ensure_index(cursor, **spec)
+        except Exception as e:
+            status = f"failed: {e}"
+        results.append((spec['name'], status))
+    return results
+
+
+def log_index_results(logger, results: Sequence[Tuple[str, str]]):
+    """記錄 ensure_indexes 結果 (建立 → info，不一致 / 失敗 → warning)"""
+    for name, status in results:
+        if status == 'created':
+            logger.info(f"索引 {name}: 已建立")
+        elif status == 'exists':
+            logger.debug(f"索引 {name}: 已存在")
+        else:
+            logger.warning(f"索引 {name}: {status}")
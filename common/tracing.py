@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Tracing Module
+巢狀 span 追蹤 - 記錄每個步驟 (驗證碼、查詢、解析、PDF 下載 / 解析、資料庫寫入) 的實際耗時與 CPU 時間，
+task_end 時輸出 Chrome trace (chrome://tracing、Perfetto) 或 speedscope 檔案
+
+Features:
+- with logger.span('pdf_parse'): / @logger.trace() 兩種用法，可任意巢狀 (每個執行緒各自的 span 堆疊)
+- 每個 span 記錄 wall time (perf_counter_ns)、該執行緒的 CPU time (thread_time_ns) 與扣除子 span 後的 self time；
+  wall 遠大於 CPU 表示在等網路 / 資料庫
+- 取樣：在最外層 span 決定是否記錄，內層跟隨 (一筆記錄的完整呼叫樹要嘛全部保留、要嘛全部略過)
+- 未啟用時 span 為共用的空 context manager，幾乎零成本
+- 事件數上限 max_events，超過後只累計每個 span 名稱的次數 / 時間
+- 環境變數：CRAWLAB_TRACE (1 或取樣比例 0~1)、CRAWLAB_TRACE_FORMAT (chrome / speedscope)、CRAWLAB_TRACE_DIR (預設 logs/traces/)
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+TRACE_ENV = 'CRAWLAB_TRACE'
+TRACE_FORMAT_ENV = 'CRAWLAB_TRACE_FORMAT'
+TRACE_DIR_ENV = 'CRAWLAB_TRACE_DIR'
+FORMATS = ('chrome', 'speedscope')
+
+
+def sample_rate_from_env() -> float:
+    """CRAWLAB_TRACE: 1 / true = 全部記錄，0~1 的小數 = 取樣比例，未設定 = 停用"""
+    value = os.environ.get(TRACE_ENV, '').strip().lower()
+    if value in ('', '0', 'false', 'no'):
+        return 0.0
+    if value in ('1', 'true', 'yes'):
+        return 1.0
+    try:
+        return min(max(float(value), 0.0), 1.0)
+    except ValueError:
+        return 0.0
+
+
+class _NoopSpan:
+    """未啟用時使用的空 span"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _SkippedSpan(_NoopSpan):
+    """未取樣的呼叫樹 - 只追蹤深度，回到最外層後下一個 span 重新取樣"""
+
+    __slots__ = ('local',)
+
+    def __init__(self, local):
+        self.local = local
+
+    def __enter__(self):
+        self.local.skipping += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.local.skipping -= 1
+        return False
+
+
+class Span:
+    """一個已取樣的 span (由 Tracer.span 建立)"""
+
+    __slots__ = ('tracer', 'name', 'args', 'start', 'cpu_start', 'depth')
+
+    def __init__(self, tracer: 'Tracer', name: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        stack = self.tracer._local.stack
+        self.depth = len(stack)
+        stack.append(0)                 # 直接子 span 的 wall time 合計
+        self.cpu_start = time.thread_time_ns()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end = time.perf_counter_ns()
+        cpu = time.thread_time_ns() - self.cpu_start
+        stack = self.tracer._local.stack
+        child_wall = stack.pop()
+        if stack:
+            stack[-1] += end - self.start
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer._finish(self, end, cpu, child_wall)
+        return False
+
+    def set(self, **args):
+        """補充 span 參數 (例如解析出的筆數)"""
+        self.args.update(args)
+
+
+class Tracer:
+    """
+    Span 追蹤器 (執行緒安全)
+
+    Usage:
+        tracer = Tracer(sample_rate=0.2)
+        with tracer.span('auction_item', number='112司執123'):
+            with tracer.span('pdf_download'):
+                ...
+        tracer.write('./logs/traces/Data-Court_Auction.json', 'chrome')
+    """
+
+    def __init__(self, sample_rate: float = 0.0, max_events: int = 200000):
+        """
+        Args:
+            sample_rate: 最外層 span 的取樣比例 (0 = 停用，1 = 全部記錄)
+            max_events: 保留的 span 事件數上限 (每筆約 200 bytes)
+        """
+        self.sample_rate = sample_rate
+        self.max_events = max_events
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._events: List[tuple] = []          # (name, start_ns, end_ns, cpu_ns, tid, depth, args)
+        self._threads: Dict[int, str] = {}
+        self.totals: Dict[str, List[int]] = {}   # name -> [次數, wall_ns, cpu_ns, self_ns]
+        self.sampled_roots = 0
+        self.skipped_roots = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def reset(self):
+        """清除已記錄的 span (task_start 時呼叫)"""
+        with self._lock:
+            self._origin = time.perf_counter_ns()
+            self._events = []
+            self._threads = {}
+            self.totals = {}
+            self.sampled_roots = self.skipped_roots = self.dropped = 0
+
+    # ========== 記錄 ==========
+
+    def span(self, name: str, **args):
+        """
+        建立 span (context manager)
+
+        Usage:
+            with tracer.span('db_insert', table='wbt_auction') as span:
+                rows = insert(...)
+                span.set(rows=rows)
+        """
+        if self.sample_rate <= 0:
+            return _NOOP
+        local = self._local
+        stack = getattr(local, 'stack', None)
+        if stack is None:
+            stack = local.stack = []
+            local.skipping = 0
+            local.skipped = _SkippedSpan(local)
+        if local.skipping:
+            return local.skipped
+        if not stack:
+            # 最外層 span：決定整棵呼叫樹是否記錄
+            if self.sample_rate < 1 and random.random() >= self.sample_rate:
+                self.skipped_roots += 1
+                return local.skipped
+            self.sampled_roots += 1
+        return Span(self, name, args)
+
+    def trace(self, name: Optional[str] = None) -> Callable:
+        """
+        span 裝飾器
+
+        Usage:
+            @tracer.trace()
+            def parse_page(html): ...
+        """
+        def decorator(func: Callable) -> Callable:
+            span_name = name or func.__name__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _finish(self, span: Span, end: int, cpu: int, child_wall: int):
+        wall = end - span.start
+        tid = threading.get_ident()
+        with self._lock:
+            total = self.totals.get(span.name)
+            if total is None:
+                total = self.totals[span.name] = [0, 0, 0, 0]
+            total[0] += 1
+            total[1] += wall
+            total[2] += cpu
+            total[3] += wall - child_wall
+            if tid not in self._threads:
+                self._threads[tid] = threading.current_thread().name
+            if len(self._events) < self.max_events:
+                self._events.append((span.name, span.start, end, cpu, tid, span.depth, span.args))
+            else:
+                self.dropped += 1
+
+    # ========== 輸出 ==========
+
+    def summary(self, top: int = 10) -> Dict[str, Any]:
+        """每個 span 名稱的次數 / wall / CPU / self time (依 self time 由多到少)"""
+        with self._lock:
+            totals = {k: list(v) for k, v in self.totals.items()}
+        spans = [{
+            'name': name,
+            'count': count,
+            'wall_s': round(wall / 1e9, 3),
+            'cpu_s': round(cpu / 1e9, 3),
+            'self_s': round(own / 1e9, 3),
+        } for name, (count, wall, cpu, own) in totals.items()]
+        spans.sort(key=lambda s: -s['self_s'])
+        return {
+            'sample_rate': self.sample_rate,
+            'sampled_roots': self.sampled_roots,
+            'skipped_roots': self.skipped_roots,
+            'dropped': self.dropped,
+            'spans': spans[:top],
+        }
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self._events), dict(self._threads), self._origin
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """Chrome trace event format (complete events，chrome://tracing / ui.perfetto.dev)"""
+        events, threads, origin = self._snapshot()
+        pid = os.getpid()
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in threads.items()]
+        for name, start, end, cpu, tid, _, args in events:
+            trace.append({
+                'name': name,
+                'cat': 'crawlab',
+                'ph': 'X',
+                'ts': (start - origin) / 1000,
+                'dur': (end - start) / 1000,
+                'pid': pid,
+                'tid': tid,
+                'args': dict(args, cpu_ms=round(cpu / 1e6, 3)),
+            })
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def to_speedscope(self, title: str = 'crawlab') -> Dict[str, Any]:
+        """speedscope evented profile (每個執行緒一個 profile，https://www.speedscope.app)"""
+        events, threads, origin = self._snapshot()
+        frames: List[Dict[str, str]] = []
+        frame_index: Dict[str, int] = {}
+        by_thread: Dict[int, List[tuple]] = {}
+        for event in events:
+            by_thread.setdefault(event[4], []).append(event)
+
+        profiles = []
+        for tid, spans in by_thread.items():
+            spans.sort(key=lambda e: (e[1], e[5]))      # 開始時間相同時外層在前
+            out = []
+            stack: List[tuple] = []
+            for name, start, end, _, _, depth, _ in spans:
+                while stack and stack[-1][1] >= depth:
+                    closing = stack.pop()
+                    out.append({'type': 'C', 'frame': closing[0], 'at': (closing[2] - origin) / 1000})
+                index = frame_index.get(name)
+                if index is None:
+                    index = frame_index[name] = len(frames)
+                    frames.append({'name': name})
+                out.append({'type': 'O', 'frame': index, 'at': (start - origin) / 1000})
+                stack.append((index, depth, end))
+            while stack:
+                closing = stack.pop()
+                out.append({'type': 'C', 'frame': closing[0], 'at': (closing[2] - origin) / 1000})
+            profiles.append({
+                'type': 'evented',
+                'name': threads.get(tid, str(tid)),
+                'unit': 'microseconds',
+                'startValue': out[0]['at'],
+                'endValue': max(e['at'] for e in out),
+                'events': out,
+            })
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': title,
+            'exporter': 'crawlab',
+            'shared': {'frames': frames},
+            'profiles': profiles,
+        }
+
+    def write(self, path: str, fmt: str = 'chrome', title: str = 'crawlab') -> str:
+        """
+        輸出追蹤檔 (先寫暫存檔再取代)
+
+        Args:
+            path: 檔案路徑
+            fmt: 'chrome' 或 'speedscope'
+            title: speedscope 顯示名稱
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"不支援的追蹤格式: {fmt} (可用: {', '.join(FORMATS)})")
+        data = self.to_speedscope(title) if fmt == 'speedscope' else self.to_chrome()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp, path)
+        return path
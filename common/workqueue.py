@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Work Queue Module
+共用工作佇列 - 取代「COUNT → 取 TOP 1 → 再 COUNT」的逐筆處理迴圈
+
+Features:
+- 候選資料一次寫入佇列表 (crawlab_work_queue)，不再每筆重建 #test
+- 以 UPDLOCK + READPAST + OUTPUT 一次認領 N 筆，多個 worker 可安全同時消化
+- 認領帶租約 (lease)，worker 中斷後租約到期自動釋出
+- 處理結果批次標記 done / failed
+- 佇列統計於 logger.task_end 時併入 CrawlabLogger stats
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .db import ConnectionPool
+from .logger import CrawlabLogger
+
+
+QUEUE_TABLE = 'dbo.crawlab_work_queue'
+
+STATUS_PENDING = 'pending'
+STATUS_LEASED = 'leased'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+# ========== SQL ==========
+
+_CREATE_SQL = f"""
+IF OBJECT_ID('{QUEUE_TABLE}') IS NULL
+BEGIN
+    CREATE TABLE {QUEUE_TABLE} (
+        queue_name   VARCHAR(100)   NOT NULL,
+        item_key     NVARCHAR(200)  NOT NULL,
+        priority     INT            NOT NULL DEFAULT 0,
+        status       VARCHAR(10)    NOT NULL DEFAULT 'pending',
+        lease_owner  VARCHAR(100)   NULL,
+        lease_until  DATETIME2      NULL,
+        attempts     INT            NOT NULL DEFAULT 0,
+        last_error   NVARCHAR(1000) NULL,
+        enqueued_at  DATETIME2      NOT NULL DEFAULT SYSDATETIME(),
+        updated_at   DATETIME2      NOT NULL DEFAULT SYSDATETIME(),
+        CONSTRAINT PK_crawlab_work_queue PRIMARY KEY (queue_name, item_key)
+            WITH (IGNORE_DUP_KEY = ON)
+    );
+    CREATE INDEX IX_crawlab_work_queue_claim
+        ON {QUEUE_TABLE} (queue_name, status, priority DESC, enqueued_at)
+        INCLUDE (lease_until);
+END
+"""
+
+# 候選資料先落到 #wq_candidates，新增/重置/移除三個動作共用同一份結果
+_REFILL_SQL = f"""
+SET NOCOUNT ON;
+DECLARE @since DATETIME2 = SYSDATETIME();
+IF OBJECT_ID('tempdb..#wq_candidates') IS NOT NULL DROP TABLE #wq_candidates;
+
+SELECT CONVERT(NVARCHAR(200), c.item_key) AS item_key, MAX(c.priority) AS priority
+INTO #wq_candidates
+FROM ({{candidates}}) c
+GROUP BY c.item_key;
+
+INSERT INTO {QUEUE_TABLE} (queue_name, item_key, priority)
+SELECT %(queue)s, item_key, priority FROM #wq_candidates;
+
+UPDATE q
+SET status = 'pending', lease_owner = NULL, lease_until = NULL,
+    priority = c.priority, updated_at = SYSDATETIME()
+FROM {QUEUE_TABLE} q
+JOIN #wq_candidates c ON c.item_key = q.item_key
+WHERE q.queue_name = %(queue)s
+  AND q.status IN ('done', 'failed')
+  AND q.updated_at < @since;
+
+DELETE q
+FROM {QUEUE_TABLE} q
+WHERE q.queue_name = %(queue)s
+  AND q.status = 'pending'
+  AND NOT EXISTS (SELECT 1 FROM #wq_candidates c WHERE c.item_key = q.item_key);
+
+DROP TABLE #wq_candidates;
+
+SELECT COUNT(*) FROM {QUEUE_TABLE}
+WHERE queue_name = %(queue)s
+  AND (status = 'pending' OR (status = 'leased' AND lease_until < SYSDATETIME()));
+"""
+
+_CLAIM_SQL = f"""
+SET NOCOUNT ON;
+WITH c AS (
+    SELECT TOP (%(n)s) *
+    FROM {QUEUE_TABLE} WITH (ROWLOCK, UPDLOCK, READPAST)
+    WHERE queue_name = %(queue)s
+      AND (status = 'pending' OR (status = 'leased' AND lease_until < SYSDATETIME()))
+    ORDER BY priority DESC, enqueued_at
+)
+UPDATE c
+SET status = 'leased', lease_owner = %(owner)s,
+    lease_until = DATEADD(SECOND, %(lease)s, SYSDATETIME()),
+    attempts = attempts + 1, updated_at = SYSDATETIME()
+OUTPUT inserted.item_key, inserted.priority;
+"""
+
+_RENEW_SQL = f"""
+UPDATE {QUEUE_TABLE}
+SET lease_until = DATEADD(SECOND, %(lease)s, SYSDATETIME())
+WHERE queue_name = %(queue)s AND lease_owner = %(owner)s AND status = 'leased'
+"""
+
+_MARK_SQL = f"""
+UPDATE {QUEUE_TABLE}
+SET status = %(status)s, lease_owner = NULL, lease_until = NULL,
+    last_error = %(error)s, updated_at = SYSDATETIME()
+WHERE queue_name = %(queue)s AND lease_owner = %(owner)s AND item_key IN %(keys)s
+"""
+
+
+# ========== 工作佇列 ==========
+
+class WorkQueue:
+    """
+    批次認領工作佇列
+
+    Usage:
+        from common.db import get_pool
+        from common.workqueue import WorkQueue
+
+        queue = WorkQueue(
+            get_pool(server, username, password, database),
+            name='Data-Insurance',
+            candidates_sql="SELECT b.ID AS item_key, b.flg AS priority FROM ...",
+            fetch_sql="SELECT b.ID, b.*, r.rowid FROM ... WHERE b.ID IN %s",
+            batch_size=20,
+        )
+        pending = queue.refill()
+
+        with queue:
+            for key, row in queue:
+                try:
+                    ...
+                    queue.done(key)
+                except Exception as e:
+                    queue.fail(key, e)
+
+    candidates_sql: 需輸出 item_key 與 priority 兩欄 (priority 大者先處理)
+    fetch_sql: 以 IN %s 接收本批 key，第一欄為 key，其餘欄位原樣交給呼叫端
+    fetch_params: 複合 key (例如 'ID|IDN_10') 時把 key 轉成 IN 的值 (例如只取 ID)，
+                  讓 WHERE 條件留在原始欄位上可用索引；多取回的列依第一欄 key 比對後略過
+    SQL 內若有 % 字元需寫成 %%
+    """
+
+    def __init__(self, pool: ConnectionPool, name: str, candidates_sql: str,
+                 fetch_sql: str, batch_size: int = 20, lease_seconds: int = 900,
+                 owner: str = None, fetch_params: Optional[Callable[[List[str]], Sequence[Any]]] = None):
+        """
+        Args:
+            pool: common.db 連線池
+            name: 佇列名稱 (同名佇列的 worker 共同消化)
+            candidates_sql: 候選資料 SELECT (item_key, priority)
+            fetch_sql: 依 key 取回完整資料的 SELECT
+            batch_size: 每次認領筆數
+            lease_seconds: 租約秒數，逾時未完成的項目可被其他 worker 認領
+            owner: worker 識別 (預設 host:pid:隨機碼)
+            fetch_params: fetch_params(keys) 回傳代入 IN %s 的值 (預設為 keys 本身)
+        """
+        self.pool = pool
+        self.name = name
+        self.candidates_sql = candidates_sql
+        self.fetch_sql = fetch_sql
+        self.fetch_params = fetch_params
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._leased: List[str] = []          # 已認領但尚未交出的 key
+        self._done: List[str] = []
+        self._failed: List[Tuple[str, str]] = []
+        self._lease_start = 0.0
+
+        self.stats: Dict[str, Any] = {
+            'claimed': 0,
+            'done': 0,
+            'failed': 0,
+            'released': 0,
+            'missing': 0,
+            'batches': 0,
+            'claim_seconds': 0.0,
+        }
+        _register(self)
+
+    # ---------- 佇列維護 ----------
+
+    def ensure_table(self):
+        """建立佇列表 (已存在則略過)"""
+        with self.pool.cursor() as cursor:
+            cursor.execute(_CREATE_SQL)
+
+    def refill(self) -> int:
+        """
+        將候選資料寫入佇列
+
+        - 新候選加入 pending (已存在者由 IGNORE_DUP_KEY 略過)
+        - 先前 done / failed 但仍為候選者重置為 pending
+        - 已不再是候選的 pending 項目移除
+
+        Returns:
+            可認領筆數
+        """
+        self.ensure_table()
+        script = _REFILL_SQL.replace('{candidates}', self.candidates_sql)
+        with self.pool.cursor() as cursor:
+            cursor.execute(script, {'queue': self.name})
+            row = cursor.fetchone()
+        return int(row[0]) if row else 0
+
+    # ---------- 認領 / 標記 ----------
+
+    def claim(self, n: int = None) -> List[str]:
+        """認領最多 n 筆，回傳 key 清單"""
+        start = time.monotonic()
+        with self.pool.cursor() as cursor:
+            cursor.execute(_CLAIM_SQL, {
+                'n': n or self.batch_size,
+                'queue': self.name,
+                'owner': self.owner,
+                'lease': self.lease_seconds,
+            })
+            rows = cursor.fetchall()
+        # OUTPUT 不保證順序，依優先序重排
+        keys = [r[0] for r in sorted(rows, key=lambda r: -r[1])]
+
+        self.stats['claim_seconds'] += time.monotonic() - start
+        self.stats['claimed'] += len(keys)
+        self.stats['batches'] += 1 if keys else 0
+        self._leased.extend(keys)
+        self._lease_start = time.monotonic()
+        return keys
+
+    def fetch(self, keys: List[str]) -> Dict[str, Tuple]:
+        """依 key 取回資料列 (同一 key 多列時取第一列；不在本批 key 內的列略過)"""
+        if not keys:
+            return {}
+        values = self.fetch_params(keys) if self.fetch_params else keys
+        with self.pool.cursor() as cursor:
+            cursor.execute(self.fetch_sql, (tuple(values),))
+            rows = cursor.fetchall()
+        wanted = set(keys)
+        result: Dict[str, Tuple] = {}
+        for row in rows:
+            key = str(row[0])
+            if key in wanted:
+                result.setdefault(key, tuple(row[1:]))
+        return result
+
+    def done(self, key: str):
+        """標記完成 (批次寫回)"""
+        self._forget(key)
+        self._done.append(key)
+
+    def fail(self, key: str, error: Any = None):
+        """標記失敗 (本輪不再認領，下次 refill 時若仍為候選會重置)"""
+        self._forget(key)
+        self._failed.append((key, str(error or '')[:1000]))
+
+    def renew(self):
+        """延長本 worker 所有租約"""
+        with self.pool.cursor() as cursor:
+            cursor.execute(_RENEW_SQL, {
+                'lease': self.lease_seconds,
+                'queue': self.name,
+                'owner': self.owner,
+            })
+        self._lease_start = time.monotonic()
+
+    def flush(self):
+        """將累積的 done / failed 批次寫回"""
+        if not self._done and not self._failed:
+            return
+        with self.pool.cursor() as cursor:
+            if self._done:
+                cursor.execute(_MARK_SQL, {
+                    'status': STATUS_DONE, 'error': None, 'queue': self.name,
+                    'owner': self.owner, 'keys': tuple(self._done),
+                })
+            # 失敗數量通常很少，逐筆寫入錯誤訊息
+            for key, error in self._failed:
+                cursor.execute(_MARK_SQL, {
+                    'status': STATUS_FAILED, 'error': error, 'queue': self.name,
+                    'owner': self.owner, 'keys': (key,),
+                })
+        self.stats['done'] += len(self._done)
+        self.stats['failed'] += len(self._failed)
+        self._done = []
+        self._failed = []
+
+    def release(self):
+        """釋出尚未處理的認領項目，讓其他 worker 接手"""
+        self.flush()
+        if not self._leased:
+            return
+        with self.pool.cursor() as cursor:
+            cursor.execute(_MARK_SQL, {
+                'status': STATUS_PENDING, 'error': None, 'queue': self.name,
+                'owner': self.owner, 'keys': tuple(self._leased),
+            })
+        self.stats['released'] += len(self._leased)
+        self._leased = []
+
+    def close(self):
+        """結束處理：寫回結果並釋出剩餘租約"""
+        self.release()
+
+    def _forget(self, key: str):
+        try:
+            self._leased.remove(key)
+        except ValueError:
+            pass
+
+    # ---------- 迭代 ----------
+
+    def __iter__(self) -> Iterator[Tuple[str, Tuple]]:
+        """
+        逐批認領並逐筆交出 (key, row)
+
+        交出後未呼叫 done / fail 的項目，迴圈繼續時視為完成；
+        中途 break 時未處理的項目由 close() 釋出。
+        佇列內已不存在於來源的 key 直接標記完成。
+        """
+        while True:
+            self.flush()
+            keys = self.claim()
+            if not keys:
+                return
+            rows = self.fetch(keys)
+
+            for key in keys:
+                if key not in rows:
+                    self.stats['missing'] += 1
+                    self.done(key)
+                    continue
+
+                if time.monotonic() - self._lease_start > self.lease_seconds / 2:
+                    self.renew()
+
+                yield key, rows[key]
+
+                if key in self._leased:
+                    self.done(key)
+
+    def __enter__(self) -> 'WorkQueue':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.close()
+        except Exception:
+            # 資料庫異常時交由租約逾時釋出，不覆蓋原本的例外
+            if exc_type is None:
+                raise
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得統計資訊"""
+        stats = dict(self.stats)
+        stats['claim_seconds'] = round(stats['claim_seconds'], 3)
+        return stats
+
+
+# ========== 統計 ==========
+
+_queues: List[WorkQueue] = []
+_queues_lock = threading.Lock()
+
+
+def _register(queue: WorkQueue):
+    with _queues_lock:
+        _queues.append(queue)
+
+
+def queue_stats() -> Dict[str, Any]:
+    """彙整所有工作佇列統計 (供 logger.task_end 使用)"""
+    with _queues_lock:
+        queues = list(_queues)
+    total: Dict[str, Any] = {}
+    for queue in queues:
+        for k, v in queue.get_stats().items():
+            total[k] = total.get(k, 0) + v
+    if not total.get('claimed'):
+        return {}
+    total['claim_seconds'] = round(total['claim_seconds'], 3)
+    return total
+
+
+CrawlabLogger.register_stats_provider('work_queue', queue_stats)
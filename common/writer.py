@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Crawlab Background Writer Module
+背景寫入 - 讓 DB 寫入不阻塞爬取迴圈
+
+Features:
+- 有界佇列：爬取端 insert / execute 立即返回，佇列滿時阻塞 (backpressure)
+- 背景執行緒每 N 筆或每 T 秒以單一交易批次寫入
+- 連續寫入同一資料表的 insert 合併為 bulk_insert
+- execute 使用 common.query 參數化語句
+- 批次失敗時逐筆重試，找出失敗的那幾筆並透過 on_error 回報
+- on_success：commit 後才回呼 (例如寫入成功才加入去重索引、才計入成功筆數)
+- 指定 logger 時，於背景執行緒量測實際執行 / commit 的耗時，依資料表計入
+  db_operation_duration_seconds (呼叫端排入佇列的時間不算)；
+  啟用追蹤時每批寫入記為 db_batch span (子 span: db_insert / db_execute / db_commit)
+- logger.task_end 時自動 flush，統計併入 CrawlabLogger stats
+"""
+
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from .bulk import bulk_insert_docs
+from .db import ConnectionPool  # 先註冊連線池的 atexit，程式結束時背景寫入先於連線池關閉
+from .logger import CrawlabLogger
+from .query import execute as query_execute
+
+
+class _Op:
+    """一筆待寫入的操作"""
+    __slots__ = ('kind', 'table', 'doc', 'sql', 'params', 'tag', 'done')
+
+    def __init__(self, kind: str, table: str = None, doc: Dict[str, Any] = None,
+                 sql: str = None, params: Mapping[str, Any] = None, tag: Any = None,
+                 done: Optional[Callable[[bool], None]] = None):
+        self.kind = kind
+        self.table = table
+        self.doc = doc
+        self.sql = sql
+        self.params = params
+        self.tag = tag
+        self.done = done
+
+
+def _completion(on_success: Optional[Callable[[], None]], count: int) -> Optional[Callable[[bool], None]]:
+    """count 筆操作全部 commit 後呼叫 on_success (只在背景執行緒呼叫，不需加鎖)"""
+    if on_success is None:
+        return None
+    state = {'remaining': count, 'ok': True}
+
+    def done(ok: bool):
+        state['remaining'] -= 1
+        state['ok'] = state['ok'] and ok
+        if state['remaining'] == 0 and state['ok']:
+            on_success()
+    return done
+
+
+class _Flush:
+    """flush 標記，背景執行緒寫完前面的資料後 set event"""
+    __slots__ = ('event',)
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+_STOP = object()
+
+
+# ========== 背景寫入 ==========
+
+class BackgroundWriter:
+    """
+    背景批次寫入
+
+    Usage:
+        from common.writer import BackgroundWriter
+
+        def on_write_error(tag, error):
+            logger.log_db_error(error, "UPDATE")
+            logger.increment('records_failed')
+
+        writer = BackgroundWriter(get_pool(server, username, password, database),
+                                  name='Data-TaxRefund', on_error=on_write_error, logger=logger)
+
+        writer.insert(totb, doc, tag=rowid,                         # dict 一筆
+                      on_success=lambda: index.add(key))            # commit 後才加入去重索引
+        writer.execute(f"UPDATE [{totb}] SET info = %(info)s WHERE pid = %(pid)s",
+                       {'info': info, 'pid': pid}, tag=pid, table=totb)
+
+        writer.flush()      # 等待目前為止的資料寫完
+        writer.close()      # flush 並結束背景執行緒
+    """
+
+    def __init__(self, pool: ConnectionPool, name: str, batch_size: int = 100,
+                 flush_interval: float = 2.0, max_queue: int = 1000, on_error: Optional[Callable[[Any, Exception], None]] = None,
+                 logger: Optional[CrawlabLogger] = None):
+        """
+        Args:
+            pool: common.db.ConnectionPool
+            name: 名稱 (統計用，通常為模組名稱)
+            batch_size: 累積多少筆寫入一次
+            flush_interval: 最久多少秒寫入一次
+            max_queue: 佇列上限，超過時 insert / execute 阻塞
+            on_error: 寫入失敗的回呼 on_error(tag, error)，於背景執行緒呼叫
+            logger: 指定時依資料表記錄實際寫入延遲 (logger.metrics) 與追蹤 span (logger.span)
+        """
+        self.pool = pool
+        self.name = name
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.logger = logger
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self.failures: deque = deque(maxlen=100)  # 最近失敗的 (tag, error)
+
+        self.stats: Dict[str, Any] = {
+            'submitted': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'batch_retries': 0,
+            'backpressure_waits': 0,
+            'backpressure_seconds': 0.0,
+            'write_seconds': 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._worker, name=f"writer-{name}", daemon=True)
+        self._thread.start()
+
+        with _writers_lock:
+            _writers[name] = self
+
+    # ========== 提交 ==========
+
+    def _put(self, item):
+        if self._closed:
+            raise RuntimeError(f"BackgroundWriter {self.name} 已關閉")
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            start = time.monotonic()
+            self._queue.put(item)
+            self.stats['backpressure_waits'] += 1
+            self.stats['backpressure_seconds'] += time.monotonic() - start
+
+    def insert(self, table: str, doc: Dict[str, Any], tag: Any = None,
+               on_success: Optional[Callable[[], None]] = None):
+        """
+        排入一筆 insert (dict，欄位名稱為 key)
+
+        on_success 於 commit 後在背景執行緒呼叫；寫入失敗時改由 on_error 回報
+        """
+        self._put(_Op('insert', table=table, doc=doc, tag=tag, done=_completion(on_success, 1)))
+        self.stats['submitted'] += 1
+
+    def insert_docs(self, table: str, docs: List[Dict[str, Any]], tag: Any = None,
+                    on_success: Optional[Callable[[], None]] = None):
+        """排入多筆 insert (on_success 於全部 commit 後呼叫一次)"""
+        done = _completion(on_success, len(docs))
+        for doc in docs:
+            self._put(_Op('insert', table=table, doc=doc, tag=tag, done=done))
+            self.stats['submitted'] += 1
+
+    def execute(self, sql: str, params: Optional[Mapping[str, Any]] = None, tag: Any = None,
+                on_success: Optional[Callable[[], None]] = None, table: Optional[str] = None):
+        """排入一筆參數化語句 (%(name)s 參數，見 common.query)；table 為延遲統計用的資料表名稱"""
+        self._put(_Op('execute', table=table, sql=sql, params=params, tag=tag,
+                      done=_completion(on_success, 1)))
+        self.stats['submitted'] += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待目前為止排入的資料寫完，回傳是否在 timeout 內完成"""
+        if self._closed or not self._thread.is_alive():
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.event.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """寫完剩餘資料並結束背景執行緒"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    # ========== 背景執行緒 ==========
+
+    def _worker(self):
+        batch: List[_Op] = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, _Op):
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            elif item is None and time.monotonic() < deadline:
+                continue
+
+            # 達批次大小 / 逾時 / flush / 結束
+            if batch:
+                self._write(batch)
+                batch = []
+            deadline = time.monotonic() + self.flush_interval
+
+            if isinstance(item, _Flush):
+                item.event.set()
+            elif item is _STOP:
+                return
+
+    def _apply(self, cursor, ops: List[_Op]):
+        """依序執行；連續寫入同一資料表、相同欄位的 insert 合併成一次 bulk_insert"""
+        i = 0
+        while i < len(ops):
+            op = ops[i]
+            if op.kind == 'insert':
+                keys = list(op.doc.keys())
+                j = i + 1
+                while (j < len(ops) and ops[j].kind == 'insert' and ops[j].table == op.table
+                       and list(ops[j].doc.keys()) == keys):
+                    j += 1
+                start = time.perf_counter()
+                with self._span('db_insert', table=op.table, rows=j - i):
+                    bulk_insert_docs(cursor, op.table, [o.doc for o in ops[i:j]])
+                self._observe(op.table, 'INSERT', time.perf_counter() - start)
+                i = j
+            else:
+                start = time.perf_counter()
+                with self._span('db_execute', table=op.table):
+                    query_execute(cursor, op.sql, op.params)
+                self._observe(op.table, op.sql.split(None, 1)[0].upper(), time.perf_counter() - start)
+                i += 1
+
+    def _commit(self, ops: List[_Op]):
+        """在一個交易內寫入 ops 並 commit (失敗時 rollback 由連線池處理)"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self._apply(cursor, ops)
+                start = time.perf_counter()
+                with self._span('db_commit'):
+                    conn.commit()
+                tables = sorted({op.table or '-' for op in ops})
+                self._observe('+'.join(tables), 'COMMIT', time.perf_counter() - start)
+            finally:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    def _span(self, name: str, **args):
+        return self.logger.span(name, **args) if self.logger is not None else nullcontext()
+
+    def _observe(self, table: Optional[str], operation: str, elapsed: float):
+        if self.logger is not None:
+            self.logger.metrics.observe('db_operation_duration_seconds', elapsed,
+                                        table=table or '-', operation=operation)
+
+    def _write(self, ops: List[_Op]):
+        start = time.monotonic()
+        try:
+            with self._span('db_batch', writer=self.name, ops=len(ops)):
+                self._commit(ops)
+            self.stats['written'] += len(ops)
+            for op in ops:
+                self._done(op, True)
+        except Exception:
+            # 整批已 rollback，逐筆重試找出失敗的資料
+            self.stats['batch_retries'] += 1
+            for op in ops:
+                try:
+                    with self._span('db_retry', writer=self.name, tag=str(op.tag)):
+                        self._commit([op])
+                    self.stats['written'] += 1
+                except Exception as e:
+                    self._report(op, e)
+                    self._done(op, False)
+                else:
+                    self._done(op, True)
+        self.stats['batches'] += 1
+        self.stats['write_seconds'] += time.monotonic() - start
+
+    def _done(self, op: _Op, ok: bool):
+        if op.done is None:
+            return
+        try:
+            op.done(ok)
+        except Exception as e:
+            self.failures.append((op.tag, e))
+
+    def _report(self, op: _Op, error: Exception):
+        self.stats['failed'] += 1
+        self.failures.append((op.tag, error))
+        if self.on_error:
+            try:
+                self.on_error(op.tag, error)
+            except Exception:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得統計資訊"""
+        stats = dict(self.stats)
+        stats['pending'] = self._queue.qsize()
+        stats['backpressure_seconds'] = round(stats['backpressure_seconds'], 3)
+        stats['write_seconds'] = round(stats['write_seconds'], 3)
+        return stats
+
+
+# ========== 管理 ==========
+
+_writers: Dict[str, BackgroundWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def flush_all(timeout: Optional[float] = None):
+    """flush 所有背景寫入 (logger.task_end 時自動呼叫)"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush(timeout)
+
+
+def close_all_writers(timeout: Optional[float] = None):
+    """關閉所有背景寫入"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close(timeout)
+
+
+def writer_stats() -> Dict[str, Any]:
+    """彙整所有背景寫入統計 (供 logger.task_end 使用)"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    return {w.name: w.get_stats() for w in writers}
+
+
+CrawlabLogger.register_task_end_hook('writer', flush_all)
+CrawlabLogger.register_stats_provider('writer', writer_stats)
+atexit.register(close_all_writers)
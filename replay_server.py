@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in server: 以錄製的 HTTP fixture 取代政府網站，離線測試並行數與速率設定
+fixture 由 CRAWLAB_HTTP_RECORD 收集 (見 common.replay.FixtureStore)。
+
+模組端設定 CRAWLAB_HTTP_REPLAY 後，經 common.http 的請求都會改送本 server；
+set_rate() 仍以原始主機計算，task_end 的 http 統計可直接比較不同設定。
+
+Usage:
+    python replay_server.py --fixtures ./data/http_fixtures
+    python replay_server.py --fixtures ./data/http_fixtures --latency 0.3 --jitter 0.1 --error-rate 0.02
+    CRAWLAB_HTTP_REPLAY=http://127.0.0.1:8800 python Data-Court_Auction/main.py
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common.replay import ReplayServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP replay stand-in server')
+    parser.add_argument('--fixtures', default='./data/http_fixtures', help='fixture 目錄')
+    parser.add_argument('--host', default='127.0.0.1', help='監聽位址')
+    parser.add_argument('--port', type=int, default=8800, help='監聽 port')
+    parser.add_argument('--latency', type=float, default=0.0, help='平均回應延遲 (秒)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延遲隨機變動範圍 (±秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='回傳 503 的比例')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='直接斷線的比例')
+    parser.add_argument('--seed', type=int, default=None, help='亂數種子')
+    args = parser.parse_args()
+
+    server = ReplayServer(args.fixtures, args.host, args.port, latency=args.latency, jitter=args.jitter,
+                          error_rate=args.error_rate, drop_rate=args.drop_rate, seed=args.seed)
+    stats = server.get_stats()
+    print(f"fixtures={args.fixtures} hosts={stats['hosts']} responses={stats['fixtures']}")
+    print(f"listening on {server.url}  (export CRAWLAB_HTTP_REPLAY={server.url})")
+    print(f"latency={args.latency}s jitter=±{args.jitter}s error_rate={args.error_rate} drop_rate={args.drop_rate}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        print(server.get_stats())
+
+
+if __name__ == '__main__':
+    main()
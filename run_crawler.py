@@ -196,6 +196,12 @@ def main():
 
     # 執行模組
     result = run_module(arg)
+
+    # 背景寫入模式：Log 寫完後才輸出結果 JSON，避免與 Log 交錯
+    crawlab_logger = sys.modules.get('common.logger')
+    if crawlab_logger is not None:
+        crawlab_logger.flush_logs()
+
     print(json.dumps(result, ensure_ascii=False, indent=2))
 
     # 回傳適當的 exit code